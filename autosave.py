@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+import threading
+import time
+
+from stats import STATS
+
+# Seconds without a change after which the changes are saved
+AUTOSAVE_INTERVAL = 2.0
+# Number of unsaved changes that are saved at once, without waiting for AUTOSAVE_INTERVAL
+AUTOSAVE_CHANGES = 100
+
+
+class Autosaver:
+    """
+    Saves a ToDo in a background thread, so the changes are saved without the save command.
+    The changes of a burst of commands are saved together, interval seconds after the last command that changed the engine,
+    or as soon as max_changes changes are not saved.
+    The engine is only used inside self.command(), which the saves hold too, so a save never sees a command half done,
+    and there is never more than one save at a time, see ToDo.save.
+    The thread only holds the engine to start a background save of it, which merges and copies the notes,
+    and waits for the file to be written without holding it, so a long save, e.g. a compact, does not block the commands.
+    The time from the first change that was not saved to its save is recorded in STATS as "autosave lag".
+    """
+
+    def __init__(self, engine, interval=AUTOSAVE_INTERVAL, max_changes=AUTOSAVE_CHANGES):
+        """
+        :param engine: The ToDo to save
+        :type engine: ToDo
+        :param interval: Seconds without a change after which the changes are saved
+        :type interval: float
+        :param max_changes: Number of unsaved changes that are saved without waiting for interval
+        :type max_changes: int
+        :return: An object of class Autosaver, call start to start its thread
+        :r type: class Autosaver
+        """
+        self.engine = engine
+        self.interval = interval
+        self.max_changes = max_changes
+        # held by the commands and the saves, and notified when a command changed the engine
+        self._condition = threading.Condition()
+        # engine.mutations at the last save
+        self._saved = engine.mutations
+        # time.monotonic() of the first and the last change that are not saved, None if all the changes are saved
+        self._first_change = None
+        self._last_change = None
+        self._thread = None
+        self._stopped = False
+        # the error of the last save of the thread, None if it succeeded
+        self.error = None
+
+    def start(self):
+        """
+        Starts the thread that saves the engine
+        """
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def command(self):
+        """
+        Holds the engine while a command uses it, and schedules a save if the command changed it
+        """
+        with self._condition:
+            mutations = self.engine.mutations
+            try:
+                yield self.engine
+            finally:
+                if self.engine.is_saved:
+                    # e.g. the save command
+                    self._saved = self.engine.mutations
+                    self._first_change = self._last_change = None
+                elif self.engine.mutations != mutations:
+                    self._last_change = time.monotonic()
+                    if self._first_change is None:
+                        self._first_change = self._last_change
+                    self._condition.notify()
+
+    def flush(self):
+        """
+        Saves the changes that are not saved now, e.g. before exit, and waits until they are written
+
+        :raise OSError: If the engine cannot be saved
+        """
+        with self._condition:
+            if not self.engine.is_saved:
+                self._save()
+            self.engine.wait_for_save()
+
+    def stop(self):
+        """
+        Saves the changes that are not saved and stops the thread.
+        The thread is stopped even if the save fails.
+
+        :raise OSError: If the engine cannot be saved
+        """
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                self._stopped = True
+                self._condition.notify()
+
+    def _run(self):
+        """
+        The loop of the thread: starts a save while holding self._condition, then waits for it without holding it
+        """
+        while True:
+            with self._condition:
+                save = self._start()
+            if save is None:
+                return
+            self._finish(*save)
+
+    def _start(self):
+        """
+        Waits for a change, then until interval seconds pass without a change or max_changes are not saved,
+        and starts a background save of the engine. The caller holds self._condition.
+
+        :return: The number of changes saved and the time of the first of them for self._finish, None if the thread is stopped
+        :rtype: tuple or None
+        """
+        while not self._stopped:
+            if self._last_change is None:
+                self._condition.wait()
+                continue
+            delay = self._last_change + self.interval - time.monotonic()
+            if delay > 0 and self.engine.mutations - self._saved < self.max_changes:
+                self._condition.wait(delay)
+                continue
+            mutations, first_change = self.engine.mutations, self._first_change
+            try:
+                # merges the changes of other processes and copies the changes, a thread of the engine writes them
+                self.engine.save(background=True)
+            except OSError as e:
+                self._failed(e, first_change)
+                continue
+            save = (mutations - self._saved, first_change)
+            self._saved = mutations
+            self._first_change = self._last_change = None
+            return save
+        return None
+
+    def _finish(self, changes, first_change):
+        """
+        Waits until the save started by self._start is written and records it, without holding self._condition meanwhile
+
+        :param changes: The number of changes saved
+        :type changes: int
+        :param first_change: time.monotonic() of the first change saved
+        :type first_change: float or None
+        """
+        try:
+            self.engine.wait_for_save()
+        except OSError as e:
+            with self._condition:
+                self._failed(e, first_change)
+            return
+        if first_change is not None:
+            STATS.record("autosave lag", time.monotonic() - first_change)
+        STATS.count("autosaves")
+        STATS.count("changes autosaved", changes)
+        with self._condition:
+            self.error = None
+            if not self.engine.is_saved and self._last_change is None:
+                # e.g. another process saved while the file was written, the engine kept the changes for the next save
+                self._last_change = time.monotonic()
+                self._first_change = first_change
+
+    def _failed(self, error, first_change):
+        """
+        Records a save that failed, the changes stay in the engine and are saved again after interval. The caller holds self._condition.
+        """
+        self.error = error
+        self._last_change = time.monotonic()
+        if self._first_change is None:
+            self._first_change = first_change
+        STATS.count("autosave errors")
+
+    def _save(self):
+        """
+        Saves the engine in the foreground and records the lag of the oldest change saved, the caller holds self._condition
+
+        :raise OSError: If the engine cannot be saved
+        """
+        mutations = self.engine.mutations
+        self.engine.save()
+        if self._first_change is not None:
+            STATS.record("autosave lag", time.monotonic() - self._first_change)
+        STATS.count("autosaves")
+        STATS.count("changes autosaved", mutations - self._saved)
+        self._saved = mutations
+        self._first_change = self._last_change = None
+        self.error = None
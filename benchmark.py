@@ -0,0 +1,1042 @@
+from tabulate import tabulate
+import multiprocessing
+import subprocess
+import statistics
+import tracemalloc
+import argparse
+import platform
+import tempfile
+import asyncio
+import random
+import shutil
+import time
+import json
+import math
+import re
+import csv
+import sys
+import os
+
+# import todo Library
+from todo import ToDo
+import todo
+from commands import CommandParser
+from storage import TASK_ID_BITS, format_task_id, new_task_id
+from workspaces import Workspaces
+
+# Milliseconds that importing project may take, bench_startup fails above it.
+# The heavy modules, tabulate, pyfiglet and colorama, must stay out of the import of project.
+STARTUP_BUDGET_MS = 60
+# A line written by python -X importtime: self and cumulative microseconds, and the module indented by its depth
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (.+)")
+# The length of the body of a task for each distribution of generate_workspace, from the random generator and the average length
+BODY_LENGTHS = {
+    "fixed": lambda generator, average: average,
+    "uniform": lambda generator, average: generator.uniform(1, 2 * average - 1),
+    # many short bodies and a few long ones, like the tasks people write
+    "lognormal": lambda generator, average: generator.lognormvariate(math.log(average) - 0.5, 1),
+}
+# Version of the json written by the suite benchmark, increased when its format changes
+SUITE_FORMAT = 1
+
+
+def generate_workspace(file_name, notes=10, tasks_per_note=1000, body_length=40, seed=0, distribution="fixed"):
+    """
+    Writes a workspace with random tasks in the csv format of the class ToDo
+
+    :param file_name: The name of the csv file
+    :type file_name: str
+    :param notes: Number of notes
+    :type notes: int
+    :param tasks_per_note: Number of tasks in each note
+    :type tasks_per_note: int
+    :param body_length: Average number of characters in the body of a task
+    :type body_length: int
+    :param seed: Seed of the random generator, the same seed generates the same workspace
+    :type seed: int
+    :param distribution: How the lengths of the bodies are spread around body_length, a key of BODY_LENGTHS
+    :type distribution: str
+    """
+    generator = random.Random(seed)
+    # the ids have their own generator, so the bodies are the same as in the workspaces generated before the tasks had ids
+    id_generator = random.Random(-1 - seed)
+    body_lengths = BODY_LENGTHS[distribution]
+    words = ["buy", "call", "fix", "write", "review", "plan", "send", "read", "meet", "clean", "report", "update"]
+    with open(file_name, "w", newline="") as file:
+        writer = csv.writer(file)
+        for i in range(1, notes + 1):
+            for _ in range(tasks_per_note):
+                length = body_lengths(generator, body_length)
+                body = []
+                size = 0
+                while size < length:
+                    body.append(generator.choice(words))
+                    size += len(body[-1]) + 1
+                writer.writerow([
+                    f"note_{i}",
+                    " ".join(body),
+                    generator.choice(["low", "normal", "high"]),
+                    generator.choice(["complete", "incomplete"]),
+                    format_task_id(id_generator.getrandbits(TASK_ID_BITS)),
+                ])
+
+
+def measure(function, repeat=5, setup=None):
+    """
+    Calls function repeat times and returns the median time of a call in milliseconds
+    If setup is passed, it is called before each call of function and is not timed
+
+    :rtype: float
+    """
+    return statistics.median(_times(function, repeat, setup))
+
+
+def _times(function, repeat, setup):
+    """
+    Returns the time in milliseconds of each call of function, see measure
+
+    :rtype: list
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def legacy_save(engine):
+    """
+    Saves engine the way ToDo.save did before the journal, by truncating the file and writing all the rows into it
+    """
+    with open(engine.file_name, "w", newline="") as file:
+        writer = csv.writer(file)
+        for note in engine.notes.values():
+            for task in note.tasks:
+                writer.writerow([note.title, task.body, task.priority, task.status])
+
+
+class DictTask:
+    """
+    The representation of a task before Task had __slots__, for comparing the memory use.
+    Every object has a __dict__ and keeps the priority and the status as new strings.
+    It takes the same arguments and has the same attributes as Task, so the loader of ToDo can create it.
+    """
+
+    def __init__(self, body="", priority="normal", status="incomplete", task_id=None):
+        self._cells = None
+        self._note = None
+        self._id = new_task_id() if task_id is None else task_id
+        self.body = body
+        self.priority = priority
+        self.status = status
+
+    @property
+    def note(self):
+        return self._note
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, priority):
+        if priority.lower().strip() in ["low", "normal", "high"]:
+            self._priority = priority.lower().strip()
+        else:
+            raise ValueError("Invalid Priority. Priority can be low, normal or high")
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        if status.lower().strip() in ["complete", "incomplete"]:
+            self._status = status.lower().strip()
+        else:
+            raise ValueError("Invalid Status. Status can be complete or incomplete")
+
+
+def bench_memory(tasks):
+    """
+    Compares the memory used by a loaded workspace with tasks tasks when the tasks are objects of Task and of DictTask
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(file_name, notes=10, tasks_per_note=tasks // 10)
+        for name, task_class in [["Task (__slots__)", todo.Task], ["DictTask (__dict__)", DictTask]]:
+            # the loader of ToDo creates the tasks with the class todo.Task
+            original, todo.Task = todo.Task, task_class
+            try:
+                tracemalloc.start()
+                start = time.perf_counter()
+                engine = ToDo(file_name)
+                seconds = time.perf_counter() - start
+                size = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+                todo.Task = original
+            results.append([name, size / 2**20, size / tasks, seconds])
+            del engine
+
+    print(f"memory of a loaded workspace with {tasks} tasks")
+    print(tabulate(results, ["Representation", "MiB", "Bytes per task", "Load s (traced)"], floatfmt=".2f"))
+
+
+def legacy_auto_title(notes):
+    """
+    Returns an automatic note title the way ToDo.new_note did before it kept the free numbers, by trying new_note_1, new_note_2, ...
+    """
+    i = 1
+    while f"new_note_{i}" in notes:
+        i += 1
+    return f"new_note_{i}"
+
+
+def bench_notes(notes, legacy_notes):
+    """
+    Measures creating notes with automatic titles, switching between them and deleting them,
+    and compares creating the titles with the linear search that new_note used before
+    """
+    generator = random.Random(0)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        engine = ToDo(os.path.join(directory, "workspace.csv"))
+
+        start = time.perf_counter()
+        for _ in range(notes):
+            engine.new_note()
+        results.append(["create (auto title)", notes, time.perf_counter() - start])
+
+        titles = list(engine.notes)
+        start = time.perf_counter()
+        for title in generator.choices(titles, k=notes):
+            engine.new_note(title)
+        results.append(["switch", notes, time.perf_counter() - start])
+
+        # delete the current note, which is the first one after each delete
+        engine.new_note(titles[0])
+        start = time.perf_counter()
+        for _ in range(notes):
+            engine.delete_note(engine.current_note)
+        results.append(["delete (current)", notes, time.perf_counter() - start])
+
+    legacy = {}
+    start = time.perf_counter()
+    for _ in range(legacy_notes):
+        title = legacy_auto_title(legacy)
+        legacy[title] = None
+    results.append(["create (legacy auto title)", legacy_notes, time.perf_counter() - start])
+
+    for result in results:
+        result.append(result[2] / result[1] * 1e6)
+    print(tabulate(results, ["Operation", "Notes", "s", "us per note"], floatfmt=".3f"))
+
+
+def legacy_parse(line):
+    """
+    Parses a command the way get_command and the functions of the commands did before CommandParser,
+    with re.search and a literal pattern for the command and again for its arguments
+    """
+    matches = re.search(r"^(newtask|delete|task|note|page|filter|search|undo|redo|save|exit|help)( .+)?$", line.strip())
+    if matches is None:
+        return None
+    command, args = matches.groups()
+    if command == "task" and args is not None:
+        if task_matches := re.search(r"^(\d+) (priority|status|edit) (.+)", args.strip()):
+            field = {"status": "status", "priority": "priority", "edit": "body"}[task_matches.group(2)]
+            return command, (int(task_matches.group(1).strip()), field, task_matches.group(3))
+        return command, None
+    if command == "delete" and args is not None:
+        if delete_matches := re.search(r"^(task|note) (.+)", args.strip()):
+            kind, target = delete_matches.groups()
+            try:
+                return command, (kind, int(target.strip()) if kind == "task" else target.strip())
+            except ValueError:
+                return command, None
+        return command, None
+    if command == "filter" and args is not None:
+        words = args.split()
+        return command, dict(zip(words[::2], words[1::2]))
+    return command, args
+
+
+def generate_commands(commands, seed=0):
+    """
+    Returns a list of commands lines like the ones typed at the prompt, with the mix of a typical session
+    """
+    generator = random.Random(seed)
+    words = ["buy", "call", "fix", "write", "review", "plan", "send", "read", "meet", "clean", "report", "update"]
+    lines = []
+    for _ in range(commands):
+        kind = generator.random()
+        if kind < 0.4:
+            lines.append(f"newtask {' '.join(generator.choices(words, k=5))}")
+        elif kind < 0.65:
+            lines.append(f"task {generator.randint(1, 100)} {generator.choice(['status complete', 'priority high', 'edit call back'])}")
+        elif kind < 0.75:
+            lines.append(f"delete task {generator.randint(1, 100)}")
+        elif kind < 0.85:
+            lines.append(f"note note_{generator.randint(1, 10)}")
+        elif kind < 0.9:
+            lines.append(f"filter priority {generator.choice(['low', 'high'])} status complete")
+        elif kind < 0.95:
+            lines.append(f"search {generator.choice(words)}")
+        else:
+            lines.append(generator.choice(["page next", "undo", "redo", "save", "bogus command"]))
+    return lines
+
+
+def legacy_parse_many(lines):
+    """
+    Parses lines the way run_batch did before CommandParser.parse_many
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        yield line_number, line, legacy_parse(line)
+
+
+def bench_parse(commands, repeat):
+    """
+    Measures parsing commands lines with CommandParser, one by one and as a stream like the batch mode,
+    and compares them with the regular expressions that the functions of the commands used before
+    """
+    lines = generate_commands(commands)
+    results = [
+        ["legacy re.search", measure(lambda: [legacy_parse(line) for line in lines], repeat)],
+        # a new parser for each run, so its cache starts empty
+        ["CommandParser.parse", measure(lambda: [parser.parse(line) for parser in [CommandParser()] for line in lines], repeat)],
+        ["legacy batch loop", measure(lambda: list(legacy_parse_many(lines)), repeat)],
+        ["CommandParser.parse_many", measure(lambda: list(CommandParser().parse_many(lines)), repeat)],
+    ]
+    for result in results:
+        result.append(commands / result[1] * 1000)
+    print(f"{commands} commands")
+    print(tabulate(results, ["Parser", "ms", "commands per second"], floatfmt=".0f"))
+
+
+def bench_search(tasks, repeat):
+    """
+    Measures building the search index of a workspace with tasks tasks, reading it back after compact and searching it
+    """
+    queries = ["report", "buy milk", "rep*", "call OR fix", "benchmark"]
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(file_name, notes=10, tasks_per_note=tasks // 10)
+        engine = ToDo(file_name)
+        results = [["build index", measure(lambda: engine.search(""), 1), ""]]
+        engine.new_task(body="benchmark")
+        engine.compact()
+        results.append(["load without index", measure(lambda: ToDo(file_name + ".copy"), 1, lambda: _copy(file_name)), ""])
+        results.append(["load with saved index", measure(lambda: ToDo(file_name), 1), ""])
+        for query in queries:
+            results.append([f"search {query}", measure(lambda: engine.search(query), repeat), len(engine.search(query))])
+
+    print(f"search in a workspace with {tasks} tasks")
+    print(tabulate(results, ["Operation", "ms", "Results"], floatfmt=".2f"))
+
+
+def _copy(file_name):
+    """
+    Copies file_name to file_name.copy, without the files of its journal and search index
+    """
+    with open(file_name, "rb") as source, open(file_name + ".copy", "wb") as target:
+        target.write(source.read())
+
+
+def bench_save(tasks, repeat):
+    """
+    Compares the latency and the durability of the ways a workspace with tasks tasks can be saved
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(file_name, notes=10, tasks_per_note=tasks // 10)
+        engine = ToDo(file_name)
+
+        def one_edit_save():
+            engine.new_task(body="benchmark")
+            engine.save()
+
+        def background_compact():
+            engine.compact(background=True)
+
+        def background_compact_done():
+            engine.compact(background=True)
+            engine.wait_for_save()
+
+        results = [
+            ["legacy full rewrite", measure(lambda: legacy_save(engine), repeat), "file is truncated if killed while writing"],
+            ["compact", measure(engine.compact, repeat), "old or new file, flushed to disk"],
+            ["save one change", measure(one_edit_save, repeat), "change flushed to disk, a torn last change is ignored"],
+            ["compact (background, returns)", measure(background_compact, repeat, engine.wait_for_save), "same as compact, once wait_for_save returns"],
+            ["compact (background, finished)", measure(background_compact_done, repeat), "old or new file, flushed to disk"],
+        ]
+        engine.wait_for_save()
+
+    print(f"save latency of a workspace with {tasks} tasks, median of {repeat} runs")
+    print(tabulate(results, ["Method", "ms", "Durability"], floatfmt=".2f"))
+
+
+def bench_storage(sizes, repeat):
+    """
+    Compares loading, saving all the tasks and saving one change of workspaces with each number of tasks in sizes
+    stored in a csv file and in an SQLite database
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for tasks in sizes:
+            csv_name = os.path.join(directory, f"workspace_{tasks}.csv")
+            generate_workspace(csv_name, notes=10, tasks_per_note=tasks // 10)
+            ToDo(csv_name, lazy=True).export(os.path.join(directory, f"workspace_{tasks}.db"))
+            for extension in [".csv", ".db"]:
+                file_name = os.path.join(directory, f"workspace_{tasks}{extension}")
+                engine = ToDo(file_name)
+
+                def one_edit_save():
+                    engine.edit_task(1, "status", "complete")
+                    engine.save()
+
+                results.append([
+                    extension[1:],
+                    tasks,
+                    measure(lambda: ToDo(file_name, lazy=True), repeat),
+                    measure(lambda: ToDo(file_name), 1),
+                    measure(engine.compact, repeat),
+                    measure(one_edit_save, repeat),
+                    os.path.getsize(file_name) / 2**20,
+                ])
+
+    print(f"storage backends, median of {repeat} runs")
+    print(tabulate(results, ["Storage", "Tasks", "Lazy load ms", "Load ms", "Full save ms", "Save one edit ms", "MiB"], floatfmt=".2f"))
+
+
+def bench_open(tasks, repeat):
+    """
+    Compares opening a workspace with tasks tasks in each storage format and reading it the way a dashboard does:
+    showing the first page of a note, or counting the incomplete tasks of all the notes
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        csv_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(csv_name, notes=10, tasks_per_note=tasks // 10)
+        for extension in [".db", ".m3"]:
+            ToDo(csv_name, lazy=True).export(os.path.join(directory, f"workspace{extension}"))
+
+        for extension in [".csv", ".db", ".m3"]:
+            file_name = os.path.join(directory, f"workspace{extension}")
+
+            def first_page():
+                engine = ToDo(file_name, lazy=True)
+                engine.page_size = 20
+                str(engine)
+
+            def count_incomplete():
+                engine = ToDo(file_name, lazy=True)
+                len(engine.query(status="incomplete"))
+
+            results.append([
+                extension[1:],
+                measure(lambda: ToDo(file_name, lazy=True), repeat),
+                measure(first_page, repeat),
+                measure(count_incomplete, repeat),
+                measure(lambda: ToDo(file_name), repeat),
+                os.path.getsize(file_name) / 2**20,
+            ])
+
+    print(f"opening a workspace with {tasks} tasks, median of {repeat} runs")
+    print(tabulate(results, ["Storage", "Open ms", "First page ms", "Count incomplete ms", "Load all ms", "MiB"], floatfmt=".2f"))
+
+
+def bench_trusted(tasks, repeat):
+    """
+    Compares loading a csv workspace with tasks tasks written by another program, whose rows are validated,
+    and the same workspace written by compact, whose rows are trusted, see storage.TrustedRows
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        foreign_name = os.path.join(directory, "foreign.csv")
+        generate_workspace(foreign_name, notes=10, tasks_per_note=tasks // 10)
+        trusted_name = os.path.join(directory, "trusted.csv")
+        ToDo(foreign_name, lazy=True).export(trusted_name)
+
+        for name, file_name in [("validated (other program)", foreign_name), ("trusted (written by compact)", trusted_name)]:
+
+            def lazy_load_all():
+                engine = ToDo(file_name, lazy=True)
+                for note in engine.notes.values():
+                    note.tasks
+
+            results.append([name, measure(lambda: ToDo(file_name), repeat), measure(lazy_load_all, repeat)])
+    for row in results[1:]:
+        row += [results[0][1] / row[1], results[0][2] / row[2]]
+    results[0] += [1.0, 1.0]
+
+    print(f"loading a csv workspace with {tasks} tasks, median of {repeat} runs")
+    print(tabulate(results, ["File", "Load ms", "Lazy load all ms", "Load speedup", "Lazy speedup"], floatfmt=".2f"))
+
+
+def bench_workspaces(files, tasks, workers, repeat):
+    """
+    Measures Workspaces loading a number files of csv workspaces with tasks tasks each, with each number of processes in workers,
+    without a cache, and refreshing a cache after one file changed
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        file_names = [os.path.join(directory, f"team_{i}.csv") for i in range(files)]
+        for seed, file_name in enumerate(file_names):
+            generate_workspace(file_name, notes=10, tasks_per_note=tasks // 10, seed=seed)
+        cache_name = os.path.join(directory, "cache.json")
+        serial = None
+        for count in workers:
+
+            def cold():
+                Workspaces(file_names, count).refresh()
+
+            def one_changed():
+                engine = ToDo(file_names[0], lazy=True)
+                engine.new_task(body="benchmark")
+                engine.save()
+                Workspaces(file_names, count, cache_name).refresh()
+
+            ms = measure(cold, repeat)
+            serial = serial or ms
+            Workspaces(file_names, count, cache_name).refresh()
+            results.append([count, ms, serial / ms, measure(one_changed, repeat)])
+
+    print(f"loading {files} workspaces of {tasks} tasks on {os.cpu_count()} CPUs, median of {repeat} runs")
+    print(tabulate(results, ["Workers", "Load all ms", "Speedup", "One changed (cached) ms"], floatfmt=".2f"))
+
+
+def _writer(file_name, writer, rounds, changes_per_save, results):
+    """
+    One of the processes of bench_concurrency. Adds, completes and deletes its own tasks in the shared notes of file_name,
+    saves after every changes_per_save changes and compacts now and then.
+    Puts the status of each of its tasks that should be in the file, and the time spent saving, to the queue results,
+    or None and the exception if it failed.
+    """
+    try:
+        results.put(_write_rounds(file_name, writer, rounds, changes_per_save))
+    except Exception as error:
+        results.put((None, repr(error)))
+        raise
+
+
+def _write_rounds(file_name, writer, rounds, changes_per_save):
+    """
+    The work of _writer, returns the status of each of its tasks and the time spent saving
+    """
+    generator = random.Random(writer)
+    engine = ToDo(file_name, lazy=True)
+    mine = {}
+    save_time = 0
+    for save in range(rounds):
+        for change in range(changes_per_save):
+            action = generator.random()
+            if action < 0.6 or not mine:
+                body = f"writer {writer} task {save}.{change}"
+                engine.new_note(generator.choice(["shared_1", "shared_2", "shared_3"]))
+                engine.new_task(body=body)
+                mine[body] = [engine.current_note, "incomplete"]
+                continue
+            body = generator.choice(list(mine))
+            title, _ = mine[body]
+            engine.new_note(title)
+            number = [task.body for task in engine.notes[title].tasks].index(body) + 1
+            if action < 0.8:
+                engine.edit_task(number, "status", "complete")
+                mine[body][1] = "complete"
+            else:
+                engine.delete_task(number)
+                del mine[body]
+        start = time.perf_counter()
+        if generator.random() < 0.05:
+            engine.compact()
+        else:
+            engine.save()
+        save_time += time.perf_counter() - start
+    return {body: status for body, (_, status) in mine.items()}, save_time
+
+
+def bench_concurrency(writers, rounds, changes_per_save, extension):
+    """
+    Runs writers processes that change the same workspace at the same time, and checks that no change was lost
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, f"workspace{extension}")
+        ToDo(file_name)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_writer, args=(file_name, writer, rounds, changes_per_save, results))
+            for writer in range(writers)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        seconds = time.perf_counter() - start
+        failed = [error for mine, error in outcomes if mine is None]
+        if failed:
+            print(f"{len(failed)} writers failed: {failed[0]}")
+            return len(failed)
+
+        expected = {}
+        for mine, _ in outcomes:
+            expected.update(mine)
+        found = {}
+        duplicated = 0
+        for note in ToDo(file_name).notes.values():
+            for task in note.tasks:
+                duplicated += task.body in found
+                found[task.body] = task.status
+
+    missing = sum(body not in found for body in expected)
+    unexpected = sum(body not in expected for body in found)
+    wrong_status = sum(found[body] != status for body, status in expected.items() if body in found)
+    saves = writers * rounds
+    print(f"{writers} writers, {rounds} saves of {changes_per_save} changes each, {extension[1:]} workspace")
+    print(tabulate(
+        [
+            ["saves per second", f"{saves / seconds:.2f}"],
+            ["mean save ms", f"{sum(save_time for _, save_time in outcomes) / saves * 1000:.2f}"],
+            ["tasks expected", len(expected)],
+            ["tasks missing", missing],
+            ["tasks not expected", unexpected],
+            ["tasks duplicated", duplicated],
+            ["tasks with wrong status", wrong_status],
+        ],
+        disable_numparse=True,
+    ))
+    return missing + unexpected + duplicated + wrong_status
+
+
+async def _client(host, port, client, commands, save_every, latencies, failures):
+    """
+    One of the clients of bench_server. Sends commands one after another, like a user, and adds the time of each one
+    to latencies[command] and the failed ones to failures.
+
+    :return: The number of tasks it added
+    :rtype: int
+    """
+    generator = random.Random(client)
+    words = ["buy", "call", "fix", "write", "review", "plan", "send", "read", "meet", "clean", "report", "update"]
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send(line):
+        start = time.perf_counter()
+        writer.write(line.encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.setdefault(line.split()[0], []).append(time.perf_counter() - start)
+        if not response["ok"]:
+            failures.append(line)
+
+    await send(f"note client_{client % 10}")
+    added = 0
+    for i in range(commands):
+        action = generator.random()
+        if i % save_every == save_every - 1:
+            await send("save")
+        elif action < 0.6 or not added:
+            await send(f"newtask {generator.choice(words)} {generator.choice(words)} client{client}task{added}")
+            added += 1
+        elif action < 0.8:
+            await send("task 1 status complete")
+        elif action < 0.9:
+            await send(f"search {generator.choice(words)} client{client}task{generator.randrange(added)}")
+        else:
+            await send("show")
+    writer.write(b"exit\n")
+    writer.close()
+    return added
+
+
+async def _clients(address, clients, commands, save_every, latencies, failures):
+    host, port = address.rsplit(":", 1)
+    added = await asyncio.gather(*(
+        _client(host, int(port), client, commands, save_every, latencies, failures) for client in range(clients)
+    ))
+    return sum(added)
+
+
+def bench_server(clients, commands, save_every, tasks):
+    """
+    Starts server.py on a workspace with tasks tasks, and measures the latency of each command and the throughput
+    of clients connections that send commands at the same time
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(file_name, notes=10, tasks_per_note=tasks // 10)
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"), file_name, "--address", "127.0.0.1:0"],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            # the server prints its address when it accepts clients
+            address = server.stdout.readline().split()[-1]
+            latencies = {}
+            failures = []
+            start = time.perf_counter()
+            added = asyncio.run(_clients(address, clients, commands, save_every, latencies, failures))
+            seconds = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        saved = sum(note.num_of_tasks for note in ToDo(file_name, lazy=True).notes.values()) - tasks // 10 * 10
+
+    rows = []
+    for command, times in sorted(latencies.items()):
+        percentiles = statistics.quantiles(times, n=100) if len(times) > 1 else times * 99
+        rows.append([command, len(times), percentiles[49] * 1000, percentiles[98] * 1000])
+    total = sum(len(times) for times in latencies.values())
+    print(f"{clients} clients, {commands} commands each, a save every {save_every} commands, {tasks} tasks")
+    print(tabulate(rows, ["command", "count", "p50 ms", "p99 ms"], floatfmt=".2f"))
+    print(f"{total / seconds:.0f} commands per second, {len(failures)} failed")
+    print(f"{saved} of {added} added tasks saved")
+
+
+def _startup(arguments):
+    """
+    Runs python with arguments in a new process, like a script that starts M3 ToDo
+
+    :return: The milliseconds of the whole process, and the lines written to stderr
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, *arguments],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1000, process.stderr.splitlines()
+
+
+def _import_times(lines):
+    """
+    Reads the output of python -X importtime
+
+    :return: A dict from each module to its (self, cumulative) microseconds
+    :rtype: dict
+    """
+    times = {}
+    for line in lines:
+        if match := IMPORT_TIME.match(line):
+            times[match[3].strip()] = (int(match[1]), int(match[2]))
+    return times
+
+
+def bench_startup(repeat, budget, top):
+    """
+    Measures the startup of project.py: the import time of its modules with python -X importtime,
+    and a batch run of an empty file with --no-banner, like a script runs it.
+    Returns True if the median import of project takes more than budget milliseconds.
+    """
+    imports = []
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        commands = os.path.join(directory, "commands.txt")
+        generate_workspace(file_name, notes=1, tasks_per_note=10)
+        open(commands, "w").close()
+        # the interpreter alone, which every start pays
+        python = [_startup(["-c", "pass"])[0] for _ in range(repeat)]
+        for _ in range(repeat):
+            imports.append(_import_times(_startup(["-X", "importtime", "-c", "import project"])[1]))
+        batch = [_startup(["project.py", "--no-banner", "--batch", commands, file_name])[0] for _ in range(repeat)]
+
+    import_ms = statistics.median(times["project"][1] for times in imports) / 1000
+    modules = sorted(imports[0], key=lambda module: imports[0][module][0], reverse=True)[:top]
+    print(f"median of {repeat} starts")
+    print(tabulate(
+        [
+            ["python -c pass", statistics.median(python)],
+            ["import project", import_ms],
+            ["project.py --no-banner --batch", statistics.median(batch)],
+        ],
+        ["Startup", "ms"],
+        floatfmt=".1f",
+    ))
+    print(tabulate(
+        [[module, *(statistics.median(times[module][i] for times in imports if module in times) / 1000 for i in range(2))] for module in modules],
+        ["Module", "self ms", "cumulative ms"],
+        floatfmt=".1f",
+    ))
+    if import_ms > budget:
+        print(f"import project takes {import_ms:.1f} ms, over the budget of {budget} ms")
+        return True
+    print(f"import project is within the budget of {budget} ms")
+    return False
+
+
+def _commit():
+    """
+    Returns the git commit of the code being measured, or None if it is not in a git repository
+
+    :rtype: str or None
+    """
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return process.stdout.strip() or None
+
+
+def bench_suite(notes, tasks_per_note, body_length, distribution, commands, repeat, seed):
+    """
+    Measures the paths that the program depends on, on a workspace generated with the same arguments and seed every run:
+    loading a workspace, rendering it, creating notes with automatic titles, running many newtask, task and delete commands
+    through project.process, and saving the changes of the commands and the whole workspace.
+    Each case starts from a new copy of the workspace, so a run does not change the next one.
+    Returns the results with the parameters and the environment of the run, in the format that compare_suites reads.
+
+    :rtype: dict
+    """
+    from project import PAGE_SIZE, PARSER, process
+
+    generator = random.Random(seed)
+    tasks = notes * tasks_per_note
+    # the commands are parsed before, so only process is measured
+    bodies = [PARSER.parse(f"newtask suite task {i}") for i in range(commands)]
+    fields = [("status", "complete"), ("status", "incomplete"), ("priority", "high"), ("edit", "changed by the suite")]
+    edits = [PARSER.parse(f"task {generator.randint(1, tasks_per_note)} {' '.join(generator.choice(fields))}") for _ in range(commands)]
+    deletes = [PARSER.parse(f"delete task {generator.randint(1, max(1, tasks_per_note - i))}") for i in range(commands)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "workspace.csv")
+        generate_workspace(file_name, notes, tasks_per_note, body_length, seed, distribution)
+        state = {}
+
+        def fresh(*changes):
+            # a copy in a new directory, without the journal of the runs before
+            copy = os.path.join(tempfile.mkdtemp(dir=directory), "workspace.csv")
+            shutil.copyfile(file_name, copy)
+            engine = state["engine"] = ToDo(copy)
+            engine.page_size = PAGE_SIZE
+            for command in changes:
+                process(engine, command)
+
+        def run(commands):
+            engine = state["engine"]
+            for command in commands:
+                process(engine, command)
+
+        def new_notes():
+            engine = state["engine"]
+            for _ in range(len(bodies)):
+                engine.new_note()
+
+        engine = ToDo(file_name)
+        engine.page_size = PAGE_SIZE
+        first = engine.notes[engine.current_note]
+        cases = [
+            # name, operations, function, setup
+            ["load", tasks, lambda: ToDo(file_name), None],
+            ["load lazy", tasks, lambda: ToDo(file_name, lazy=True), None],
+            ["render page", min(PAGE_SIZE, tasks_per_note), lambda: str(engine), None],
+            ["render note", tasks_per_note, first.render, None],
+            ["new_note auto title", commands, new_notes, fresh],
+            ["process newtask", commands, lambda: run(bodies), fresh],
+            ["process task", commands, lambda: run(edits), fresh],
+            ["process delete", commands, lambda: run(deletes), fresh],
+            ["save changes", commands, lambda: state["engine"].save(), lambda: fresh(*bodies)],
+            ["compact", tasks, lambda: state["engine"].compact(), fresh],
+        ]
+        for name, operations, function, setup in cases:
+            times = _times(function, repeat, setup)
+            results[name] = {
+                "operations": operations,
+                "ms": statistics.median(times),
+                "min_ms": min(times),
+                "us_per_operation": statistics.median(times) * 1000 / operations,
+            }
+            state.clear()
+
+    return {
+        "format": SUITE_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "notes": notes,
+            "tasks_per_note": tasks_per_note,
+            "body_length": body_length,
+            "distribution": distribution,
+            "commands": commands,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_suites(old, new, threshold):
+    """
+    Prints the results of two runs of bench_suite side by side.
+    The fastest time of each case is compared, because the noise of the machine only makes a run slower.
+    A case is a regression if it is more than threshold (e.g. 0.1 for 10%) slower in new than in old.
+
+    :param old: The results of the run to compare with, e.g. read from the json file of an earlier commit
+    :type old: dict
+    :param new: The results of the current run
+    :type new: dict
+    :param threshold: The slowdown allowed, as a fraction of the old median
+    :type threshold: float
+    :return: True if a case is a regression
+    :rtype: bool
+    """
+    if old.get("format") != new["format"]:
+        print(f"the old results have format {old.get('format')}, not {new['format']}")
+        return True
+    # more repetitions make the fastest time more stable, but do not change what is measured
+    if {**old["parameters"], "repeat": None} != {**new["parameters"], "repeat": None}:
+        print("the runs have different parameters, so their times are not comparable:")
+        print(f"old: {old['parameters']}\nnew: {new['parameters']}")
+        return True
+    rows = []
+    regressions = 0
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            rows.append([name, "", f"{result['min_ms']:.2f}", "", "new"])
+            continue
+        before = old["results"][name]["min_ms"]
+        change = result["min_ms"] / before - 1 if before else 0
+        regressed = change > threshold
+        regressions += regressed
+        rows.append([name, f"{before:.2f}", f"{result['min_ms']:.2f}", f"{change:+.1%}", "REGRESSION" if regressed else ""])
+    print(f"compared with commit {old.get('commit')} of {old.get('created')}")
+    print(tabulate(rows, ["Case", "old min ms", "new min ms", "change", ""], disable_numparse=True))
+    print(f"{regressions} regressions over {threshold:.0%}")
+    return regressions > 0
+
+
+def main():
+    """
+    Runs the benchmark passed in the command line
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks of the M3 ToDo engine")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    save_parser = subparsers.add_parser("save", help="latency and durability of the save methods")
+    save_parser.add_argument("--tasks", type=int, default=100_000)
+    save_parser.add_argument("--repeat", type=int, default=5)
+    notes_parser = subparsers.add_parser("notes", help="creating, switching and deleting notes")
+    notes_parser.add_argument("--notes", type=int, default=100_000)
+    notes_parser.add_argument("--legacy-notes", type=int, default=5_000)
+    parse_parser = subparsers.add_parser("parse", help="parsing throughput of the commands")
+    parse_parser.add_argument("--commands", type=int, default=1_000_000)
+    parse_parser.add_argument("--repeat", type=int, default=3)
+    search_parser = subparsers.add_parser("search", help="building, reading and searching the search index")
+    search_parser.add_argument("--tasks", type=int, default=1_000_000)
+    search_parser.add_argument("--repeat", type=int, default=5)
+    storage_parser = subparsers.add_parser("storage", help="load and save latency of the csv and SQLite storages")
+    storage_parser.add_argument("--tasks", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    storage_parser.add_argument("--repeat", type=int, default=3)
+    open_parser = subparsers.add_parser("open", help="opening a workspace in the csv, SQLite and binary formats")
+    open_parser.add_argument("--tasks", type=int, default=1_000_000)
+    open_parser.add_argument("--repeat", type=int, default=3)
+    concurrency_parser = subparsers.add_parser("concurrency", help="stress test of several processes saving the same workspace")
+    concurrency_parser.add_argument("--writers", type=int, default=8)
+    concurrency_parser.add_argument("--rounds", type=int, default=50)
+    concurrency_parser.add_argument("--changes", type=int, default=5, help="changes per save")
+    concurrency_parser.add_argument("--format", choices=["csv", "db", "m3"], default="csv")
+    server_parser = subparsers.add_parser("server", help="latency and throughput of many clients of server.py")
+    server_parser.add_argument("--clients", type=int, default=100)
+    server_parser.add_argument("--commands", type=int, default=200, help="commands per client")
+    server_parser.add_argument("--save-every", type=int, default=20, help="commands between the saves of a client")
+    server_parser.add_argument("--tasks", type=int, default=100_000)
+    startup_parser = subparsers.add_parser("startup", help="import time and startup of project.py")
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_MS, help="milliseconds allowed to import project")
+    startup_parser.add_argument("--top", type=int, default=10, help="number of the slowest modules shown")
+    suite_parser = subparsers.add_parser("suite", help="the main paths of the program, with results in json to compare runs")
+    suite_parser.add_argument("--notes", type=int, default=10)
+    suite_parser.add_argument("--tasks-per-note", type=int, default=1000)
+    suite_parser.add_argument("--body-length", type=int, default=40, help="average number of characters in a body")
+    suite_parser.add_argument("--distribution", choices=list(BODY_LENGTHS), default="lognormal", help="how the body lengths are spread")
+    suite_parser.add_argument("--commands", type=int, default=1000, help="commands of each process case and notes of new_note")
+    suite_parser.add_argument("--repeat", type=int, default=5)
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    suite_parser.add_argument("--compare", metavar="FILE", help="compare with the results written to FILE by an earlier run")
+    suite_parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression (default: 0.1 for 10%%)")
+    generate_parser = subparsers.add_parser("generate", help="write a synthetic csv workspace")
+    generate_parser.add_argument("file_name")
+    generate_parser.add_argument("--notes", type=int, default=10)
+    generate_parser.add_argument("--tasks-per-note", type=int, default=1000)
+    generate_parser.add_argument("--body-length", type=int, default=40, help="average number of characters in a body")
+    generate_parser.add_argument("--distribution", choices=list(BODY_LENGTHS), default="fixed", help="how the body lengths are spread")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    trusted_parser = subparsers.add_parser("trusted", help="loading a csv workspace written by this program and by another one")
+    trusted_parser.add_argument("--tasks", type=int, default=1_000_000)
+    trusted_parser.add_argument("--repeat", type=int, default=3)
+    workspaces_parser = subparsers.add_parser("workspaces", help="loading many workspaces with 1, 4 and 8 processes")
+    workspaces_parser.add_argument("--files", type=int, default=32)
+    workspaces_parser.add_argument("--tasks", type=int, default=10_000, help="tasks per file")
+    workspaces_parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    workspaces_parser.add_argument("--repeat", type=int, default=3)
+    memory_parser = subparsers.add_parser("memory", help="memory of a loaded workspace")
+    memory_parser.add_argument("--tasks", type=int, default=1_000_000)
+
+    args = parser.parse_args()
+    if args.benchmark == "save":
+        bench_save(args.tasks, args.repeat)
+    elif args.benchmark == "notes":
+        bench_notes(args.notes, args.legacy_notes)
+    elif args.benchmark == "parse":
+        bench_parse(args.commands, args.repeat)
+    elif args.benchmark == "search":
+        bench_search(args.tasks, args.repeat)
+    elif args.benchmark == "storage":
+        bench_storage(args.tasks, args.repeat)
+    elif args.benchmark == "open":
+        bench_open(args.tasks, args.repeat)
+    elif args.benchmark == "concurrency":
+        if bench_concurrency(args.writers, args.rounds, args.changes, "." + args.format):
+            sys.exit(1)
+    elif args.benchmark == "server":
+        bench_server(args.clients, args.commands, args.save_every, args.tasks)
+    elif args.benchmark == "startup":
+        if bench_startup(args.repeat, args.budget, args.top):
+            sys.exit(1)
+    elif args.benchmark == "suite":
+        suite = bench_suite(
+            args.notes, args.tasks_per_note, args.body_length, args.distribution, args.commands, args.repeat, args.seed
+        )
+        rows = [[name, result["operations"], result["ms"], result["min_ms"], result["us_per_operation"]] for name, result in suite["results"].items()]
+        print(f"{args.notes} notes of {args.tasks_per_note} tasks, {args.distribution} bodies of {args.body_length} characters, seed {args.seed}")
+        print(tabulate(rows, ["Case", "operations", "median ms", "min ms", "us per operation"], floatfmt=".2f"))
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(suite, file, indent=2)
+        if args.compare:
+            with open(args.compare) as file:
+                if compare_suites(json.load(file), suite, args.threshold):
+                    sys.exit(1)
+    elif args.benchmark == "generate":
+        generate_workspace(args.file_name, args.notes, args.tasks_per_note, args.body_length, args.seed, args.distribution)
+    elif args.benchmark == "trusted":
+        bench_trusted(args.tasks, args.repeat)
+    elif args.benchmark == "workspaces":
+        bench_workspaces(args.files, args.tasks, args.workers, args.repeat)
+    elif args.benchmark == "memory":
+        bench_memory(args.tasks)
+
+
+if __name__ == "__main__":
+    main()
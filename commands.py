@@ -0,0 +1,177 @@
+from collections import namedtuple
+import re
+
+from storage import TASK_ID_LENGTH
+
+# A command typed at the prompt. name is its first word, and args is a tuple with the typed arguments of the command,
+# or None if the rest of the line is not valid for the command, so the help of the command can be shown.
+Command = namedtuple("Command", ["name", "args"])
+# Creates a Command from a tuple (name, args) without the argument parsing of Command(name, args), which is slower
+_new_command = tuple.__new__
+
+# Number of lines whose Command is kept by CommandParser.parse, so a line typed again is not parsed again
+PARSE_CACHE_SIZE = 10_000
+
+# The tasks chosen by a selector of the task and delete commands: ranges is a tuple of (first, last) task numbers,
+# last is None for all the tasks from first, and filters is a tuple of (field, value), e.g. ("status", "complete")
+Selector = namedtuple("Selector", ["ranges", "filters"])
+# The tasks chosen by their ids in the task and delete commands, ids is a tuple of ids in lower case
+TaskIds = namedtuple("TaskIds", ["ids"])
+
+# The field of a task changed by each property of the task command
+_FIELDS = {"status": "status", "priority": "priority", "edit": "body"}
+# A selector is parts separated by commas: a task number, a range of numbers, all, or a filter of the priority or the status,
+# e.g. 1-5,8 or status=complete. The tasks chosen by any of the parts are selected.
+_SELECTOR_PART = r"(?:\d+(?:-\d+)?|all|(?:priority|status)=\w+)"
+_SELECTOR = rf"{_SELECTOR_PART}(?:,{_SELECTOR_PART})*"
+# Ids of tasks separated by commas, each one after #, e.g. #k5qzj2x7ma,#a2b3c4d5e6
+_TASK_ID = rf"#[a-zA-Z2-7]{{{TASK_ID_LENGTH}}}"
+_TASK_IDS = rf"{_TASK_ID}(?:,{_TASK_ID})*"
+
+
+def parse_selector(text):
+    """
+    Converts a selector of the task and delete commands, e.g. "1-5,8,status=complete"
+    is Selector(((1, 5), (8, 8)), (("status", "complete"),))
+
+    :param text: A selector matched by _SELECTOR
+    :type text: str
+    :rtype: Selector
+    """
+    ranges = []
+    filters = []
+    for part in text.split(","):
+        if part == "all":
+            ranges.append((1, None))
+        elif "=" in part:
+            field, _, value = part.partition("=")
+            filters.append((field, value.lower()))
+        else:
+            first, _, last = part.partition("-")
+            ranges.append((int(first), int(last or first)))
+    return Selector(tuple(ranges), tuple(filters))
+
+
+def parse_task_ids(text):
+    """
+    Converts the ids of the task and delete commands, e.g. "#K5QZJ2X7MA,#a2b3c4d5e6" is TaskIds(("k5qzj2x7ma", "a2b3c4d5e6"))
+
+    :param text: Ids matched by _TASK_IDS
+    :type text: str
+    :rtype: TaskIds
+    """
+    return TaskIds(tuple(part[1:].lower() for part in text.split(",")))
+
+
+# The syntax of the arguments of each command: a list of (pattern, types) tried in order on the rest of the line.
+# The groups of the pattern that matches are converted by types. Only a pattern whose types are all str can have
+# optional groups, which are None if they did not match. An empty pattern matches a command used with no arguments.
+GRAMMAR = {
+    "newtask": [(r"(.+)", (str,))],
+    "delete": [
+        (r"(task)\s+(\d+)", (str, int)),
+        (rf"(task)\s+({_SELECTOR})", (str, parse_selector)),
+        (rf"(task)\s+({_TASK_IDS})", (str, parse_task_ids)),
+        (r"(note)\s+(.+)", (str, str)),
+    ],
+    "task": [
+        (r"(\d+)\s+(priority|status|edit)\s+(.+)", (int, _FIELDS.get, str)),
+        (rf"({_SELECTOR})\s+(priority|status|edit)\s+(.+)", (parse_selector, _FIELDS.get, str)),
+        (rf"({_TASK_IDS})\s+(priority|status|edit)\s+(.+)", (parse_task_ids, _FIELDS.get, str)),
+    ],
+    "note": [(r"", ()), (r"(.+)", (str,))],
+    "page": [(r"(next|prev)", (str,)), (r"(\d+)", (int,))],
+    "filter": [(r"(priority|status)\s+(\S+)(?:\s+(priority|status)\s+(\S+))?", (str, str, str, str))],
+    "search": [(r"(.+)", (str,))],
+    "undo": [(r"", ())],
+    "redo": [(r"", ())],
+    "stats": [(r"", ()), (r"(reset)", (str,)), (r"(profile)\s+(on|off)", (str, str)), (r"(export)\s+(.+)", (str, str))],
+    "save": [(r"", ())],
+    "exit": [(r"", ())],
+    "help": [(r"", ()), (r"(.+)", (str,))],
+}
+
+
+class CommandParser:
+    """
+    Parses lines of commands into objects of Command, with the patterns of a grammar like GRAMMAR compiled once.
+    The command is found by the first word of the line in a dict, and only its patterns are tried on the rest of the line.
+    The empty pattern and (.+), which most commands use, are checked without a regular expression.
+    A Command cannot be changed, so the last PARSE_CACHE_SIZE different lines are kept with their Command,
+    e.g. a batch that completes task 1 of many notes parses "task 1 status complete" once.
+    """
+
+    def __init__(self, grammar=GRAMMAR):
+        """
+        :param grammar: The syntax of the arguments of each command, see GRAMMAR
+        :type grammar: dict
+        :return: An object of class CommandParser
+        :r type: class CommandParser
+        """
+        # (pattern, types) of each command, pattern stays a str for "" and "(.+)", types is None if they are all str
+        self.commands = {
+            name: [
+                (pattern if pattern in ["", "(.+)"] else re.compile(pattern), None if all(t is str for t in types) else types)
+                for pattern, types in forms
+            ]
+            for name, forms in grammar.items()
+        }
+        self._cache = {}
+
+    def parse(self, line):
+        """
+        Parses one line, e.g. "task 2 status complete" is Command("task", (2, "status", "complete"))
+
+        :param line: A line typed at the prompt
+        :type line: str
+        :return: A Command, or None if the first word of line is not a command
+        :rtype: Command or None
+        """
+        try:
+            return self._cache[line]
+        except KeyError:
+            pass
+        command = self._parse(line)
+        if len(self._cache) >= PARSE_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[line] = command
+        return command
+
+    def _parse(self, line):
+        """
+        Parses one line without self._cache, see self.parse
+
+        :rtype: Command or None
+        """
+        name, _, rest = line.strip().partition(" ")
+        forms = self.commands.get(name)
+        if forms is None:
+            return None
+        rest = rest.lstrip()
+        for pattern, types in forms:
+            if pattern.__class__ is str:
+                if rest if pattern else not rest:
+                    return _new_command(Command, (name, (rest,) if rest else ()))
+                continue
+            if match := pattern.fullmatch(rest):
+                if types is None:
+                    # the arguments are strings, as they are matched
+                    return _new_command(Command, (name, match.groups()))
+                return _new_command(Command, (name, tuple([convert(value) for convert, value in zip(types, match.groups())])))
+        return _new_command(Command, (name, None))
+
+    def parse_many(self, lines):
+        """
+        Parses a stream of lines, e.g. a file of commands for the batch mode.
+        Empty lines and lines starting with # are skipped.
+
+        :param lines: An iterable of lines
+        :type lines: iterable
+        :return: A generator of (line_number, line, command), command is None if line is not a command
+        :rtype: generator
+        """
+        parse = self.parse
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if line and line[0] != "#":
+                yield line_number, line, parse(line)
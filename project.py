@@ -1,38 +1,106 @@
-from tabulate import tabulate
-from pyfiglet import Figlet
+# tabulate, pyfiglet and colorama are imported where they are used, because importing them takes most of the startup time
+from contextlib import nullcontext
+import argparse
+import time
 import re
 import sys
 import os
+import unicodedata
 
 # import todo Library
-from todo import Task, Note, ToDo
+from todo import Task, Note, ToDo, PRIORITIES, STATUSES
+# import commands Library
+from commands import CommandParser, Selector, TaskIds
+# import stats Library
+from stats import STATS
+# import autosave Library
+from autosave import Autosaver, AUTOSAVE_INTERVAL, AUTOSAVE_CHANGES
+
+# Number of tasks shown in each page of the active note
+PAGE_SIZE = 20
+# Maximum number of tasks printed by the filter and search commands
+FILTER_LIMIT = 100
+# Parses the commands typed at the prompt, its patterns are compiled once
+PARSER = CommandParser()
+# Font of the banners printed at start and exit
+BANNER_FONT = "doom"
+# Directory where the banners rendered by pyfiglet are kept, so the next starts do not import pyfiglet and load its font
+BANNER_CACHE = os.path.join(
+    os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "m3todo",
+)
+# False with --no-banner
+_show_banner = True
+# The Autosaver of the engine of run, None with --autosave 0
+_autosaver = None
+
+
+# The lines of the last frame printed by show, so the next show only rewrites the lines that changed.
+# None if the screen may not show the last frame at its top anymore.
+_last_frame = None
+# The ANSI escape codes in the lines of a frame, e.g. the colors of the tables, which take no room on the screen
+_ANSI_CODE = re.compile(r"\033\[[0-9;?]*[A-Za-z]")
 
 
 def clear_screen():
     """
     Clears the screen
+    Uses ANSI escape codes instead of starting a clear or cls process
     """
-    # for windows
-    if os.name == "nt":
-        _ = os.system("cls")
-    # for mac and linux
-    else:
-        _ = os.system("clear")
+    global _last_frame
+    sys.stdout.write("\033[2J\033[H")
+    sys.stdout.flush()
+    _last_frame = None
+
+
+def banner(text):
+    """
+    Returns text rendered in big letters with the font BANNER_FONT of pyfiglet.
+    The rendered text is kept in a file of BANNER_CACHE, which is read instead the next time.
+
+    :param text: The text of the banner
+    :type text: str
+    :return: The lines of the banner
+    :rtype: str
+    """
+    file_name = os.path.join(BANNER_CACHE, BANNER_FONT + "-" + re.sub(r"\W+", "_", text) + ".txt")
+    try:
+        with open(file_name, encoding="utf-8") as file:
+            return file.read()
+    except OSError:
+        pass
+
+    from pyfiglet import Figlet
 
+    rendered = Figlet(font=BANNER_FONT).renderText(text)
+    try:
+        os.makedirs(BANNER_CACHE, exist_ok=True)
+        # written to another file first, so another program never reads half a banner
+        with open(f"{file_name}.{os.getpid()}", "w", encoding="utf-8") as file:
+            file.write(rendered)
+        os.replace(f"{file_name}.{os.getpid()}", file_name)
+    except OSError:
+        # the banner is rendered again next time
+        pass
+    return rendered
 
-def initiate():
+
+def initiate(workspace=None):
     """
     This function prinits the welcome message and get the file_name from user
 
+    :param workspace: The file name passed in the command line, which is used without asking the user
+    :type workspace: str or None
     :return: A string of the file name
     :rtype: str
     """
-    figlet = Figlet()
-    figlet.setFont(font="doom")
-    print(figlet.renderText("M3 ToDo"))
-    print("Created by Mehdi Rezagholipour")
-    print("mehdi.rezagholipour@gmail.com\n\n")
+    if _show_banner:
+        print(banner("M3 ToDo"))
+        print("Created by Mehdi Rezagholipour")
+        print("mehdi.rezagholipour@gmail.com\n\n")
 
+    if workspace is not None:
+        return workspace
     return get_file_name("Please insert your todo: ")
 
 
@@ -42,37 +110,40 @@ def get_file_name(s):
     Extract file name from user input
     The file should be a valid csv file, but the use can pass the file name without .csv,
     i.e. use can input both file_name and file_name.csv and the function will extract file_name and return it.
+    A file name ending with .db, .sqlite or .sqlite3 keeps its extension and is stored in an SQLite database,
+    and a file name ending with .m3 in a binary file.
 
     :param s: is the message that we want to be printed when prompting for user input
     :type s: str
-    :return: a string contains file_name with .csv extension
+    :return: a string contains file_name with .csv extension, or its SQLite or binary extension
     :rtype: str
     """
     while True:
         load_file = get_yes_no("Do you want to load an existing todo?")
         n = input(s)
-        matches = re.search(r"^(.+?)(?:\.csv)?$", n, re.IGNORECASE)
+        matches = re.search(r"^(.+?)(\.csv|\.db|\.sqlite3?|\.m3)?$", n, re.IGNORECASE)
         file_name = matches.group(1)
+        extension = matches.group(2) or ".csv"
 
         if load_file:
             # when user wants to load a file
-            if os.path.isfile(file_name + ".csv"):
-                return f"{file_name}.csv"
+            if os.path.isfile(file_name + extension):
+                return f"{file_name}{extension}"
             else:
                 make_new_file = get_yes_no(
-                    f"{file_name}.csv does not exists, do you want to create new file?"
+                    f"{file_name}{extension} does not exists, do you want to create new file?"
                 )
                 if make_new_file:
-                    return f"{file_name}.csv"
+                    return f"{file_name}{extension}"
 
         else:
             # when user wants to create a new file
-            if os.path.isfile(file_name + ".csv"):
+            if os.path.isfile(file_name + extension):
                 # check if the file_name.csv exists.
                 # if exists, ask if user wants to load it
-                load = get_yes_no(f"{file_name}.csv exists, do you want to load it?")
+                load = get_yes_no(f"{file_name}{extension} exists, do you want to load it?")
                 if load:
-                    return f"{file_name}.csv"
+                    return f"{file_name}{extension}"
                 else:
                     continue
             else:
@@ -82,12 +153,12 @@ def get_file_name(s):
                     # Here we check the file_name is a valid system file name, by trying to creating a new file
                     # If we get a system error, that means it is not a valid system file name.
                     # If file creation was susccessfull, we delete the file and return file_name.csv
-                    file = open(f"{file_name}.csv", "w")
+                    file = open(f"{file_name}{extension}", "w")
                     file.close()
-                    os.remove(f"{file_name}.csv")
-                    return f"{file_name}.csv"
+                    os.remove(f"{file_name}{extension}")
+                    return f"{file_name}{extension}"
                 except OSError as e:
-                    print(f"{file_name}.csv is not a valid file name. {e}")
+                    print(f"{file_name}{extension} is not a valid file name. {e}")
 
 
 def get_yes_no(yes_no_question):
@@ -102,6 +173,9 @@ def get_yes_no(yes_no_question):
     :return: A boolean, True for yes/y, False for No/n
     :rtype: bool
     """
+    global _last_frame
+    # the questions are printed below the frame, so the next show redraws the whole frame
+    _last_frame = None
     while True:
         answer = input(yes_no_question + " (yes/no or y/n) ").lower().strip()
         if answer in ["yes", "y"]:
@@ -110,224 +184,439 @@ def get_yes_no(yes_no_question):
             return False
 
 
-def show(engine):
+def visible_width(line):
+    """
+    Returns the number of columns that line takes in the terminal.
+    The ANSI escape codes take none, and the wide characters, e.g. of Chinese, take two.
+
+    :param line: A line of a frame, without new lines
+    :type line: str
+    :return: The number of columns
+    :rtype: int
+    """
+    line = _ANSI_CODE.sub("", line)
+    if line.isascii():
+        return len(line)
+    width = 0
+    for char in line:
+        if unicodedata.category(char) in ("Mn", "Me", "Cf"):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+
+def show(engine, full=False):
     """
     clears the screen and prints the engine
+    If the screen still shows the last frame, only the lines that changed are rewritten,
+    unless a line is wider than the screen, since the terminal wraps it into more rows than one
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    """
-    clear_screen()
-    print(engine)
-    print("\n\n")
+    :param full: If True, clears the screen and prints the whole engine
+    :type full: bool
+    """
+    global _last_frame
+    start = time.perf_counter()
+    frame = (str(engine) + "\n\n\n").split("\n")
+    # render is the time of the tables of tabulate, show adds the time of writing them to the terminal
+    STATS.record("render", time.perf_counter() - start)
+    # the frame and the prompt below it must fit in the screen, otherwise the screen scrolls and the lines move
+    import shutil
+
+    size = shutil.get_terminal_size()
+    if (
+        full
+        or _last_frame is None
+        or len(frame) + 1 >= size.lines
+        or any(visible_width(line) > size.columns for line in frame)
+    ):
+        clear_screen()
+        sys.stdout.write("\n".join(frame) + "\n")
+    else:
+        for i, line in enumerate(frame):
+            if i >= len(_last_frame) or _last_frame[i] != line:
+                # move to the start of line i, rewrite it and clear the rest of it
+                sys.stdout.write(f"\033[{i + 1};1H{line}\033[K")
+        # clear the old prompt and everything below the frame
+        sys.stdout.write(f"\033[{len(frame) + 1};1H\033[J")
+    sys.stdout.flush()
+    _last_frame = frame
+    STATS.record("show", time.perf_counter() - start)
 
 
 def get_command():
     """
     Get the input from user and checks if the first part of the input matches any of the predefined commands.
-    Predefined commands are newtask, delete, task, note, save, exit and help
+    Predefined commands are newtask, delete, task, note, page, filter, search, undo, redo, stats, save, exit and help
+    An invalid command prints below the frame, so the next show redraws the whole frame
 
-    :return: A tupple containing (command, args) command is the first of the user input. args is anything after that. args is None if there is nothing after first part.
-    :rtype: tuple
+    :return: A Command, see parse_command
+    :rtype: Command
     """
+    global _last_frame
     while True:
-        user_input = input(">> ").strip()
-        if matches := re.search(
-            r"^(newtask|delete|task|note|save|exit|help)( .+)?$", user_input
-        ):
-            command, args = matches.groups()
-            return command, args
+        user_input = input(">> ")
+        if parsed := parse_command(user_input):
+            return parsed
 
         else:
             print("Invalid command")
+            # the error and the next prompt may have scrolled the screen
+            _last_frame = None
+
+
+def parse_command(user_input):
+    """
+    Checks if the first part of user_input matches any of the predefined commands, and converts its arguments, see commands.GRAMMAR.
+
+    :param user_input: A line of user input
+    :type user_input: str
+    :return: A Command(name, args), args is a tuple of the arguments of the command or None if they are not valid.
+        None if user_input is not a valid command
+    :rtype: Command or None
+    """
+    return PARSER.parse(user_input)
 
 
-def newtask(engine, args):
+def newtask(engine, body):
     """
-    get an object of class ToDo and creates a newtask under the current note with body in args
+    get an object of class ToDo and creates a newtask under the current note with body
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string containing the body of the new task
-    :type args: str
+    :param body: The body of the new task
+    :type body: str
     :return: True if newtask was successful, False otherwise
     :rtype: bool
     """
-    if args is None:
-        return False
-    else:
-        print(args)
-        print(len(args))
-        engine.new_task(body=args.strip())
-        return True
+    engine.new_task(body=body.strip())
+    return True
 
 
-def delete(engine, args):
+def delete(engine, kind, target):
     """
-    Deletes a note or a task based on what is in args
-    If args is in the format of "note note_title": Deletes the note with title note_title
-    If args is in the format of "task task_number": Deletes task number task_number
-
+    Deletes a note or a task
+    If kind is "note": Deletes the note with title target
+    If kind is "task": Deletes task number target, or all the tasks chosen by the selector target at once, e.g. delete task status=complete,
+    or the tasks with the ids target in any note, e.g. delete task #k5qzj2x7ma
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string, which will be analysed if is in correct format.
-    :type args: str
+    :param kind: task or note
+    :type kind: str
+    :param target: The number of the task, a selector of tasks, the ids of tasks or the title of the note
+    :type target: int or Selector or TaskIds or str
     :return: True if delete was successful, False otherwise
     :rtype: bool
     """
-    if args is None:
-        return False
-    else:
-        matches = re.search(r"^(task|note) (.+)", args.strip())
-        if matches is None:
-            return False
-        arg1, arg2 = matches.groups()
-        if arg2 is None:
-            return False
+    try:
+        if kind == "task" and isinstance(target, TaskIds):
+            engine.delete_tasks_by_id(target.ids)
+        elif kind == "task" and isinstance(target, Selector):
+            engine.delete_tasks(select_tasks(engine, target))
+        elif kind == "task":
+            engine.delete_task(target)
         else:
-            if arg1 == "task":
-                try:
-                    task_number = int(arg2.strip())
-                except:
-                    return False
-                try:
-                    del engine.notes[engine.current_note].tasks[task_number - 1]
-                    return True
-                except IndexError:
-                    return False
-            elif arg1 == "note":
-                if arg2.strip() in engine.notes.keys():
-                    del engine.notes[arg2.strip()]
-                    # decreasing the number of notes by 1
-                    engine.num_of_notes -= 1
-
-                    if engine.num_of_notes:
-                        # check if there is any notes left in the engine
-                        if engine.current_note == arg2.strip():
-                            # if we are deleteing the current_note, then the current_note should be changed, we set it to the first note
-                            engine.current_note = list(engine.notes.keys())[0]
-                    else:
-                        engine.current_note = None
-                    return True
-                else:
-                    return False
+            engine.delete_note(target.strip())
+        return True
+    except (IndexError, KeyError, ValueError):
+        return False
 
 
-def task(engine, args):
+def task(engine, task_number, field, value):
     """
-    This is for modifying a task's status, priority or body
-    args should be in the format of :
+    This is for modifying a task's status, priority or body, the command is in the format of :
         # priority [low|normal|high]
         # satus [complete|incomplete]
         # edit body
-    where # should be the task_number
+    where # should be the task_number, or a selector of tasks which are all changed at once, e.g. task 1-500 status complete,
+    or the ids of tasks in any note, e.g. task #k5qzj2x7ma status complete
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string or None, which will be analysed if is in correct format.
-    :type args: str
+    :param task_number: The number of the task starting from 1, a selector of tasks or the ids of tasks
+    :type task_number: int or Selector or TaskIds
+    :param field: body, priority or status, the property edit changes the body of the task
+    :type field: str
+    :param value: The new value of the field
+    :type value: str
     :return: True if task operation was successful, False otherwise
     :rtype: bool
     """
-
-    if args is None:
-        return False
-    if matches := re.search(r"^(\d+) (priority|status|edit) (.+)", args.strip()):
-        task_number = int(matches.group(1).strip())
-        stat = matches.group(3)
-        if engine.notes[engine.current_note].num_of_tasks < task_number:
-            return False
-        if matches.group(2) == "status":
-            try:
-                engine.notes[engine.current_note].tasks[task_number - 1].status = stat
-                return True
-            except ValueError:
-                return False
-        elif matches.group(2) == "priority":
-            try:
-                engine.notes[engine.current_note].tasks[task_number - 1].priority = stat
-                return True
-            except ValueError:
-                return False
-        elif matches.group(2) == "edit":
-            try:
-                engine.notes[engine.current_note].tasks[task_number - 1].body = stat
-                return True
-            except ValueError:
-                return False
-    else:
+    try:
+        if isinstance(task_number, TaskIds):
+            engine.edit_tasks_by_id(task_number.ids, field, value)
+        elif isinstance(task_number, Selector):
+            engine.edit_tasks(select_tasks(engine, task_number), field, value)
+        else:
+            engine.edit_task(task_number, field, value)
+        return True
+    except (IndexError, KeyError, ValueError):
         return False
 
 
-def note(engine, args):
+def select_tasks(engine, selector):
+    """
+    Returns the numbers of the tasks of the active note chosen by selector
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :param selector: The ranges and filters of the tasks, see commands.parse_selector
+    :type selector: Selector
+    :raise IndexError: If a range has numbers that are not tasks of the active note
+    :raise ValueError: If a filter has a value that is not a priority or a status
+    :return: The numbers of the tasks, starting from 1, in increasing order
+    :rtype: list
+    """
+    if engine.current_note is None:
+        raise IndexError("There is no active note")
+    note = engine.notes[engine.current_note]
+    numbers = set()
+    for first, last in selector.ranges:
+        if last is None:
+            last = note.num_of_tasks
+        elif not 1 <= first <= last <= note.num_of_tasks:
+            raise IndexError(f"There are no tasks {first}-{last}")
+        numbers.update(range(first, last + 1))
+    for field, value in selector.filters:
+        if value not in (PRIORITIES if field == "priority" else STATUSES):
+            raise ValueError(f"Invalid {field} {value}")
+        numbers.update(number for number, task in enumerate(note.tasks, start=1) if getattr(task, field) == value)
+    return sorted(numbers)
+
+
+def note(engine, title=None):
     """
     This is for creating a new note or switching the active note
-    If args is None, creates a new note and generates an authomatic name
-    If args is a string and there is no note with title=args, creates a new note with title=args
-    If args is a string and there is a note with title=args, switches the active note to it.
+    If title is None, creates a new note and generates an authomatic name
+    If there is no note with title, creates a new note with title
+    If there is a note with title, switches the active note to it.
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string or None, which will be analysed if is in correct format.
-    :type args: str or None
+    :param title: The title of the note, or None
+    :type title: str or None
     :return: True if note operation was successful, False otherwise
     :rtype: bool
     """
-    if args is None:
-        engine.new_note("")
-    else:
-        engine.new_note(args.strip())
+    engine.new_note("" if title is None else title.strip())
+    return True
+
+
+def page(engine, page_number):
+    """
+    This is for showing another page of the tasks of the active note
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :param page_number: The page number, next or prev
+    :type page_number: int or str
+    :return: True if the page exists, False otherwise
+    :rtype: bool
+    """
+    if page_number == "next":
+        page_number = engine.page + 1
+    elif page_number == "prev":
+        page_number = engine.page - 1
+    if not 1 <= page_number <= engine.num_of_pages:
+        return False
+    engine.page = page_number
+    return True
+
+
+def filter(engine, field, value, other_field=None, other_value=None):
+    """
+    Prints the tasks of all the notes with a priority, a status or both, the command is in the format of :
+        priority [low|normal|high]
+        status [complete|incomplete]
+        priority [low|normal|high] status [complete|incomplete]
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :param field: priority or status
+    :type field: str
+    :param value: The priority or the status of the tasks
+    :type value: str
+    :param other_field: The other one of priority and status, or None
+    :type other_field: str or None
+    :param other_value: The value of other_field, or None
+    :type other_value: str or None
+    :return: True if filter was successful, False otherwise
+    :rtype: bool
+    """
+    if field == other_field:
+        return False
+    conditions = {field: value, other_field: other_value}
+    try:
+        tasks = engine.query(conditions.get("priority"), conditions.get("status"))
+    except ValueError:
+        return False
+
+    print_tasks(tasks)
+    return True
+
+
+def search(engine, query):
+    """
+    Prints the tasks of all the notes whose body contains the words in query
+    query should be in the format of :
+        word1 word2: tasks with both word1 and word2
+        word1 OR word2: tasks with word1 or word2
+        word*: tasks with a word starting with word
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :param query: The words to search
+    :type query: str
+    :return: True if search was successful, False otherwise
+    :rtype: bool
+    """
+    print_tasks(engine.search(query.strip()))
     return True
 
 
-def save(engine, args):
+def print_tasks(tasks):
+    """
+    Prints the note, body, priority, status and id of at most FILTER_LIMIT tasks in a table
+
+    :param tasks: A list of objects of class Task
+    :type tasks: list
+    """
+    from tabulate import tabulate
+
+    STATS.count("rows rendered", min(len(tasks), FILTER_LIMIT))
+    print(
+        tabulate(
+            [[task.note.title, task.body, task.priority, task.status, task.id] for task in tasks[:FILTER_LIMIT]],
+            ["Note", "Task", "Priority", "Status", "Id"],
+            tablefmt="simple_grid",
+            maxcolwidths=[20, 100, 8, 10, None],
+        )
+    )
+    if len(tasks) > FILTER_LIMIT:
+        print(f"Showing {FILTER_LIMIT} of {len(tasks)} tasks")
+
+
+def undo(engine):
+    """
+    Takes back the last command that changed the notes
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :return: True if there was a command to undo, False otherwise
+    :rtype: bool
+    """
+    try:
+        engine.undo()
+        return True
+    except IndexError:
+        return False
+
+
+def redo(engine):
     """
-    If used with no args, i.e. when args is None, saves the changes to te file
+    Does again the last command taken back by undo
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :return: True if there was a command to redo, False otherwise
+    :rtype: bool
+    """
+    try:
+        engine.redo()
+        return True
+    except IndexError:
+        return False
+
+
+def stats(engine, action=None, value=None):
+    """
+    command: stats [reset|profile on|profile off|export file_name]
+    Shows the time of each command and operation, the rows rendered, the bytes written by the saves and the load time of the notes, see stats.Stats.
+    profile on starts a cProfile capture, and profile off stops it and shows the slowest functions.
+    export writes all the stats to a json file.
+
+    :param engine: An object from the class ToDo. This is not used in this function, it is there for unification with other commands
+    :type engine: ToDo
+    :param action: reset, profile, export or None to show the stats
+    :type action: str or None
+    :param value: on or off for profile, the file name for export
+    :type value: str or None
+    :return: True if the action was done, False otherwise
+    :rtype: bool
+    """
+    try:
+        if action is None:
+            print(STATS.report())
+        elif action == "reset":
+            STATS.reset()
+            print("Stats reset.")
+        elif action == "profile" and value == "on":
+            STATS.start_profile()
+            print("Profiler on.")
+        elif action == "profile":
+            STATS.stop_profile()
+            print(STATS.report())
+        else:
+            STATS.export(value.strip())
+            print(f"Stats exported to {value.strip()}")
+    except (ValueError, OSError) as e:
+        print(e)
+        return False
+    return True
+
+
+def save(engine):
+    """
+    Saves the changes to te file, and reports success only once they are written
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string or None, which will be analysed if is in correct format.
-    :type args: str or None
     :return: True if save operation was successful, False otherwise
     :rtype: bool
     """
-    if args is None:
-        try:
-            engine.save()
-            print("Saved successfull.")
-            return True
-        except:
-            print("Save Error")
+    try:
+        engine.save()
+        print("Saved successfull.")
+        return True
+    except OSError as e:
+        print(f"Save Error: {e}")
     return False
 
 
-def exit(engine, args):
+def exit(engine):
     """
-    If used with no args, i.e. when args is None, exits the program.
-    If there are any unsavesd changes in the object engine, prompt the user and asks if he/she wants to save first.
+    Exits the program.
+    The changes that the autosave did not save yet are saved.
+    Without autosave, if there are any unsavesd changes in the object engine, prompt the user and asks if he/she wants to save first.
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param args: A string or None, which will be analysed if is in correct format.
-    :type args: str or None
-    :return: returns False if exit was unsuccessful
+    :return: returns True if the last save failed
     :rtype: bool
     """
-    if args is None:
-        # check if the command exit is used with no arg
-        if not engine.is_saved:
-            # There are unsaved changes, ask the user if he/she wants to save before exit
-            ifsave = get_yes_no("Do you want to save before exit?")
-            if ifsave:
-                save(engine, args)
-        bye()
-    else:
-        # exit command is used with an argument. Invalid use, return false
-        return False
+    if _autosaver is not None:
+        try:
+            _autosaver.flush()
+        except OSError:
+            print("Save Error")
+            return True
+    elif not engine.is_saved:
+        # There are unsaved changes, ask the user if he/she wants to save before exit
+        ifsave = get_yes_no("Do you want to save before exit?")
+        if ifsave:
+            save(engine)
+    try:
+        # wait for the background save to finish before exit
+        engine.wait_for_save()
+    except OSError:
+        print("Save Error")
+        return True
+    bye()
 
 
-def help(engine, args):
+def help(engine, command=None):
     """
     command: help [command]
     if a [command] is passed, shows help for that command.
@@ -335,8 +624,8 @@ def help(engine, args):
 
     :param engine: An object from the class ToDo. This is not used in this function, it is there for unification with other commands
     :type engine: ToDo
-    :param args: A string or None, which will be analysed if is in correct format.
-    :type args: str or None
+    :param command: The name of a command, or None
+    :type command: str or None
     :return: Always returns True
     :rtype: bool
     """
@@ -351,7 +640,9 @@ def help(engine, args):
     )
     task_help = (
         "Command: task n property value:\n"
-        "\tn is the task number\n"
+        "\tn is the task number, or several tasks: a range like 1-500, a list like 1,3,7-9, all,\n"
+        "\tor a filter like status=complete or priority=high\n"
+        "\tn can also be the id of a task in any note after #, e.g. #k5qzj2x7ma, or several ids like #k5qzj2x7ma,#a2b3c4d5e6\n"
         "\tproperty must be one of the following: status, priority or edit\n"
         "\t\tstatus: if you want to change the status of the task\n"
         "\t\tpriority: if you want to change the priority of the task\n"
@@ -362,98 +653,197 @@ def help(engine, args):
         "Command: delete object arg:\n"
         "\tIt can be used to delete a task or a note depending on the argument object, which can be task or note\n"
         "\tIf you want to delete a task arg should be the task number\n"
+        "\tSeveral tasks are deleted at once with a range, a list or a filter like in the task command, e.g. delete task status=complete\n"
+        "\targ can also be the ids of tasks in any note, e.g. delete task #k5qzj2x7ma\n"
         "\tIf you want to delete a note, arg should be note title"
     )
+    filter_help = (
+        "Command: filter priority value status value:\n"
+        "\tShows the tasks of all the notes with a priority, a status or both\n"
+        "\tpriority can be low|normal|high and status can be complete|incomplete"
+    )
+    search_help = (
+        "Command: search words:\n"
+        "\tShows the tasks of all the notes that contain all the words\n"
+        "\tUse OR between words to show the tasks that contain any of them, e.g. search milk OR bread\n"
+        "\tA word ending with * matches all the words starting with it, e.g. search rep*"
+    )
+    page_help = (
+        "Command: page page_number|next|prev:\n"
+        "\tShows another page of the tasks of the active note"
+    )
+    undo_help = (
+        "Command: undo:\n"
+        "\tTakes back the last command that changed the notes, e.g. a deleted note comes back with its tasks"
+    )
+    redo_help = (
+        "Command: redo:\n" "\tDoes again the last command taken back by undo"
+    )
+    stats_help = (
+        "Command: stats [reset|profile on|profile off|export file_name]:\n"
+        "\tShows the time of each command, of rendering and showing the notes, of the saves and of loading the notes,\n"
+        "\tthe rows rendered and the bytes written by the saves\n"
+        "\treset: forgets the stats recorded until now\n"
+        "\tprofile on|off: starts a cProfile capture, and stops it and shows the slowest functions\n"
+        "\texport: writes all the stats to the json file file_name"
+    )
     save_help = (
-        "Command: save:\n" "\tUse with no argument to saves the changes on the file"
+        "Command: save:\n" "\tUse with no argument to saves the changes on the file\n"
+        "\tThe changes are also saved a few seconds after the last change, unless the program was started with --autosave 0"
     )
-    exit_help = "Command: exit:\n" "\tUse with no argument to exit from the program"
+    exit_help = "Command: exit:\n" "\tUse with no argument to exit from the program, the changes that are not saved yet are saved"
 
     function_help = {
         "newtask": newtask_help,
         "note": note_help,
         "task": task_help,
         "delete": delete_help,
+        "page": page_help,
+        "filter": filter_help,
+        "search": search_help,
+        "undo": undo_help,
+        "redo": redo_help,
+        "stats": stats_help,
         "save": save_help,
         "exit": exit_help,
     }
-    # is args is None, change it to empty str
-    args = args if args else ""
-    if args.strip() not in function_help:
+    # is command is None, change it to empty str
+    command = command.strip() if command else ""
+    if command not in function_help:
         for _ in function_help:
             print(function_help[_])
             print()
     else:
-        print(function_help[args.strip()])
+        print(function_help[command])
     return True
 
 
 def bye():
     """
     Print goodbye message and exit the program
+    The autosave, if any, saves the last changes and stops.
     """
-    figlet = Figlet()
-    figlet.setFont(font="doom")
-    print(figlet.renderText("Stay organized, stay ahead!"))
+    if _autosaver is not None:
+        try:
+            _autosaver.stop()
+        except OSError:
+            print("Save Error")
+    if _show_banner:
+        print(banner("Stay organized, stay ahead!"))
     sys.exit()
 
 
-def process(engine, command, args):
+# The function that runs each command, with the engine and the arguments of the command
+FUNCTIONS = {
+    "newtask": newtask,
+    "delete": delete,
+    "task": task,
+    "note": note,
+    "page": page,
+    "filter": filter,
+    "search": search,
+    "undo": undo,
+    "redo": redo,
+    "stats": stats,
+    "save": save,
+    "exit": exit,
+    "help": help,
+}
+
+
+def process(engine, command):
     """
-    Runs the approperiate function based on the value in command
+    Runs the approperiate function based on the name of command, with the arguments of command
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
-    :param command: A string conaining one of the predefined functions
-    :type command: str
-    :param args: A string or None, which will be passed to approperiate function for further analysis
-    :type args: str or None
+    :param command: A command returned by parse_command
+    :type command: Command
     :return: returns True if function command was successful, False otherwise
     :rtype: bool
     """
-
-    functions = {
-        "newtask": newtask,
-        "delete": delete,
-        "task": task,
-        "note": note,
-        "save": save,
-        "exit": exit,
-        "help": help,
-    }
-    command_function = functions.get(command)
-    return command_function(engine, args)
+    if command.args is None:
+        # the arguments are not valid for the command
+        return False
+    start = time.perf_counter()
+    try:
+        return FUNCTIONS[command.name](engine, *command.args)
+    finally:
+        STATS.record("command " + command.name, time.perf_counter() - start)
 
 
 def run(engine):
     """
     This function continously gets input from user and run the approperiate command based on the user input.
+    The commands hold the engine while they run, so the autosave thread does not save in the middle of a command.
 
     :param engine: An object from the class ToDo
     :type engine: ToDo
     """
 
+    global _last_frame
     show(engine)
     while True:
-        command, args = get_command()
-        if process(engine, command, args):
-            # process returns True if it was exceuted correctly
-            if command not in ["help", "save", "exit"]:
-                show(engine)
-
-            if command == "save":
-                # If the command was save, set engine.is_saved to True
-                engine.is_saved = True
-            elif command == "help":
-                # If command was help, do not change the engine.is_saved
-                pass
+        parsed = get_command()
+        command = parsed.name
+        with _autosaver.command() if _autosaver is not None else nullcontext():
+            if process(engine, parsed):
+                # process returns True if it was exceuted correctly
+                if command not in ["help", "filter", "search", "stats", "save", "exit"]:
+                    show(engine)
+                else:
+                    # the output below the frame may have scrolled the screen, so the next show redraws the whole frame
+                    _last_frame = None
             else:
-                # Change the engine.is_saved to False otherwise
-                engine.is_saved = False
-        else:
-            # if process returns False, this means theres was something wrong with command, prints help for the command
-            print("\nInvalid Command\n")
-            help(engine, command)
+                # if process returns False, this means theres was something wrong with command, prints help for the command
+                print("\nInvalid Command\n")
+                help(engine, command)
+                _last_frame = None
+
+
+def run_batch(engine, lines):
+    """
+    Runs the commands in lines one after another without showing the engine after each command, then saves the engine once.
+    Empty lines and lines starting with # are skipped. save commands are skipped, because the engine is saved at the end.
+    exit ends the batch.
+    Prints the number of commands per second and the commands that failed.
+    Exits with status 1 if the engine can not be saved.
+
+    :param engine: An object from the class ToDo
+    :type engine: ToDo
+    :param lines: An iterable of command lines, e.g. a file
+    :type lines: iterable
+    :return: A list of (line_number, line) for the commands that failed
+    :rtype: list
+    """
+    failures = []
+    num_of_commands = 0
+    start = time.perf_counter()
+    for line_number, line, command in PARSER.parse_many(lines):
+        num_of_commands += 1
+        if command is None:
+            failures.append((line_number, line))
+            continue
+        if command.name == "exit":
+            break
+        if command.name == "save":
+            continue
+        if not process(engine, command):
+            failures.append((line_number, line))
+    saved = True
+    try:
+        engine.save()
+    except OSError as e:
+        print(f"Save Error: {e}")
+        saved = False
+    seconds = time.perf_counter() - start
+
+    print(f"{num_of_commands} commands in {seconds:.3f} s ({num_of_commands / seconds:.0f} commands/sec), {len(failures)} failed")
+    for line_number, line in failures:
+        print(f"line {line_number}: {line}")
+    if not saved:
+        sys.exit(1)
+    return failures
 
 
 def main():
@@ -461,9 +851,60 @@ def main():
     It initiates the program,
     creates the engine, which is an object of class ToDo
     and then starts the run function
-    """
-    file_name = initiate()
-    engine = ToDo(file_name)
+    With --batch, runs the commands in a file (or stdin if the file is -) on the workspace passed in the command line instead.
+    With --convert, copies a workspace to another file, in the format chosen by the extension of each file.
+    A workspace passed in the command line is opened without asking for it.
+    With --no-banner, starts without the banners.
+    With --autosave, the changes are saved by a background thread after some seconds without a change, see Autosaver.
+    """
+    global _show_banner, _autosaver
+    parser = argparse.ArgumentParser(description="M3 ToDo, a todo application in the terminal")
+    parser.add_argument("workspace", nargs="?", help="the csv, SQLite (.db) or binary (.m3) file of the workspace, required with --batch")
+    parser.add_argument("--batch", metavar="FILE", help="run the commands in FILE, or stdin if FILE is -, and save")
+    parser.add_argument("--convert", nargs=2, metavar=("SOURCE", "TARGET"), help="copy the workspace SOURCE to TARGET, e.g. workspace.csv to workspace.db")
+    parser.add_argument("--no-banner", action="store_true", help="start quickly, without the banners")
+    parser.add_argument(
+        "--autosave", type=float, default=AUTOSAVE_INTERVAL, metavar="SECONDS",
+        help=f"save after SECONDS without a change, 0 to save only with the save command (default: {AUTOSAVE_INTERVAL})",
+    )
+    parser.add_argument(
+        "--autosave-changes", type=int, default=AUTOSAVE_CHANGES, metavar="N",
+        help=f"save as soon as N changes are not saved (default: {AUTOSAVE_CHANGES})",
+    )
+    arguments = parser.parse_args()
+    _show_banner = not arguments.no_banner
+
+    if arguments.convert is not None:
+        source, target = arguments.convert
+        if not os.path.isfile(source):
+            parser.error(f"{source} does not exists")
+        if os.path.exists(target):
+            parser.error(f"{target} already exists")
+        ToDo(source, lazy=True).export(target)
+        print(f"{source} converted to {target}")
+        sys.exit(0)
+
+    if arguments.batch is not None:
+        if arguments.workspace is None:
+            parser.error("--batch needs a workspace")
+        engine = ToDo(arguments.workspace, lazy=True)
+        if arguments.batch == "-":
+            failures = run_batch(engine, sys.stdin)
+        else:
+            with open(arguments.batch) as file:
+                failures = run_batch(engine, file)
+        sys.exit(1 if failures else 0)
+
+    # lets the windows console understand the ANSI escape codes used by show
+    from colorama import just_fix_windows_console
+
+    just_fix_windows_console()
+    file_name = initiate(arguments.workspace)
+    engine = ToDo(file_name, lazy=True)
+    engine.page_size = PAGE_SIZE
+    if arguments.autosave > 0:
+        _autosaver = Autosaver(engine, arguments.autosave, arguments.autosave_changes)
+        _autosaver.start()
     run(engine)
 
 
@@ -0,0 +1,275 @@
+import bisect
+import json
+import os
+import re
+import tempfile
+
+# A token is a run of letters, digits or underscores, compared case insensitively
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Returns the tokens of text in lower case
+
+    :param text: A string, e.g. the body of a task
+    :type text: str
+    :return: A set of tokens
+    :rtype: set
+    """
+    return set(_TOKEN.findall(text.lower()))
+
+
+class SearchIndex:
+    """
+    An inverted index from the tokens of the task bodies to the tasks that contain them.
+    The tasks of each token are kept in a dict used as an ordered set.
+    The tokens are also kept in a sorted list, so the tokens with a prefix are found by bisection.
+    The notes added by add_note before they are loaded are pending: the index only knows the positions of their tasks,
+    and a note is loaded when a search needs it, so the notes that do not match are never loaded.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty index
+
+        :return: An object of class SearchIndex
+        :r type: class SearchIndex
+        """
+        self.postings = {}
+        self.vocabulary = []
+        # the positions of the tasks of each pending note by token, and the pending notes of each token
+        self.pending = {}
+        self.pending_tokens = {}
+
+    def add(self, task, body=None):
+        """
+        Adds task to the postings of the tokens of its body
+
+        :param task: An object of class Task
+        :type task: Task
+        :param body: The body to index, task.body if None
+        :type body: str or None
+        """
+        for token in tokenize(task.body if body is None else body):
+            if token not in self.postings:
+                self.postings[token] = {}
+                if token not in self.pending_tokens:
+                    bisect.insort(self.vocabulary, token)
+            self.postings[token][task] = None
+
+    def remove(self, task, body=None):
+        """
+        Removes task from the postings of the tokens of its body
+
+        :param task: An object of class Task
+        :type task: Task
+        :param body: The body that was indexed, task.body if None
+        :type body: str or None
+        """
+        for token in tokenize(task.body if body is None else body):
+            tasks = self.postings[token]
+            del tasks[task]
+            if not tasks:
+                del self.postings[token]
+                if token not in self.pending_tokens:
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def update(self, task, old_body, new_body):
+        """
+        Moves task from the tokens of old_body to the tokens of new_body
+        """
+        self.remove(task, old_body)
+        self.add(task, new_body)
+
+    def add_note(self, note, postings):
+        """
+        Adds the tasks of note from their positions, e.g. as read by read, instead of from their bodies.
+        If note is not loaded, it is pending until it is loaded, which calls resolve.
+
+        :param note: An object of class Note
+        :type note: Note
+        :param postings: A dict from each token to a list of positions of tasks of note
+        :type postings: dict
+        :raise IndexError: If a position is not a position of a task of note
+        """
+        for positions in postings.values():
+            if positions and not 0 <= min(positions) <= max(positions) < note.num_of_tasks:
+                raise IndexError(f"Invalid position in the search index of {note.title}")
+        for token in postings:
+            if token not in self.postings and token not in self.pending_tokens:
+                bisect.insort(self.vocabulary, token)
+            self.pending_tokens.setdefault(token, {})[note] = None
+        self.pending[note] = postings
+        if note.is_loaded:
+            self.resolve(note, note.tasks)
+
+    def resolve(self, note, tasks):
+        """
+        Adds the tasks of a pending note from their positions, when the note is loaded
+
+        :param note: An object of class Note
+        :type note: Note
+        :param tasks: The tasks of note, as they were loaded
+        :type tasks: list
+        :return: False if note is not pending, its tasks are added from their bodies then
+        :rtype: bool
+        """
+        postings = self.pending.pop(note, None)
+        if postings is None:
+            return False
+        for token, positions in postings.items():
+            notes = self.pending_tokens[token]
+            del notes[note]
+            if not notes:
+                del self.pending_tokens[token]
+            resolved = dict.fromkeys(map(tasks.__getitem__, positions))
+            if token in self.postings:
+                self.postings[token].update(resolved)
+            else:
+                self.postings[token] = resolved
+        return True
+
+    def discard(self, note):
+        """
+        Forgets a pending note, e.g. when it is deleted before it is loaded
+
+        :param note: An object of class Note
+        :type note: Note
+        """
+        for token in self.pending.pop(note, {}):
+            notes = self.pending_tokens[token]
+            del notes[note]
+            if not notes:
+                del self.pending_tokens[token]
+                if token not in self.postings:
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def search(self, query):
+        """
+        Returns the tasks that match query.
+        The words of query must all be in a task, unless they are separated by OR,
+        e.g. "buy milk OR call" matches the tasks with both buy and milk, and the tasks with call.
+        A word ending with * matches every token starting with it, e.g. "rep*" matches report and repair.
+
+        :param query: A string with the words to search
+        :type query: str
+        :return: A list of objects of class Task, in the order they were indexed
+        :rtype: list
+        """
+        if self.pending:
+            self._load_pending(query)
+        results = {}
+        for part in query.split(" OR "):
+            groups = []
+            for word in part.split():
+                if word == "AND":
+                    continue
+                if word.endswith("*") and (prefix := word[:-1].lower()):
+                    groups.append(self._prefix(prefix))
+                else:
+                    groups.extend(self.postings.get(token, {}) for token in tokenize(word))
+            if not groups:
+                continue
+            # go through the smallest group and check the others, so the time depends on the smallest group
+            groups.sort(key=len)
+            if len(groups) == 1:
+                results.update(groups[0])
+            else:
+                results.update((task, None) for task in groups[0] if all(task in group for group in groups[1:]))
+        return list(results)
+
+    def _load_pending(self, query):
+        """
+        Loads the pending notes with a token of query, so their tasks are in the postings.
+        The operators OR and AND are skipped the same way search skips them.
+        """
+        tokens = []
+        for word in (word for part in query.split(" OR ") for word in part.split()):
+            if word == "AND":
+                continue
+            if word.endswith("*") and (prefix := word[:-1].lower()):
+                start = bisect.bisect_left(self.vocabulary, prefix)
+                tokens.extend(self.vocabulary[start:bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff", start)])
+            else:
+                tokens.extend(tokenize(word))
+        notes = {note: None for token in tokens for note in self.pending_tokens.get(token, ())}
+        for note in notes:
+            # loading the note calls self.resolve
+            note.tasks
+
+    def _prefix(self, prefix):
+        """
+        Returns the union of the postings of the tokens that start with prefix
+
+        :rtype: dict
+        """
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\U0010ffff", start)
+        if end - start == 1:
+            return self.postings[self.vocabulary[start]]
+        tasks = {}
+        for token in self.vocabulary[start:end]:
+            tasks.update(self.postings[token])
+        return tasks
+
+    def to_positions(self, positions):
+        """
+        Returns the postings of each note with each task replaced by its position in positions.
+        The result is a copy, which can be written by dump while the index changes.
+
+        :param positions: A dict from each task to its position in its note
+        :type positions: dict
+        :return: A dict from the title of each note to a dict from each token to a list of positions
+        :rtype: dict
+        """
+        notes = {note.title: {token: list(positions) for token, positions in postings.items()} for note, postings in self.pending.items()}
+        for token, tasks in self.postings.items():
+            for task in tasks:
+                notes.setdefault(task.note.title, {}).setdefault(token, []).append(positions[task])
+        return notes
+
+    @staticmethod
+    def dump(file_name, postings, version):
+        """
+        Writes postings returned by to_positions to file_name in json format.
+        The postings are written to a temporary file that replaces file_name, so a reader never sees half a file.
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :param postings: A dict from the title of each note to a dict from each token to a list of positions
+        :type postings: dict
+        :param version: The version of the workspace file that the positions belong to
+        :type version: list
+        """
+        fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)), prefix=".", suffix=".tmp")
+        try:
+            with open(fd, "w") as file:
+                json.dump({"version": version, "notes": postings}, file)
+            os.replace(temp_name, file_name)
+        except BaseException:
+            if os.path.isfile(temp_name):
+                os.remove(temp_name)
+            raise
+
+    @staticmethod
+    def read(file_name, version):
+        """
+        Reads the postings written by dump, which add_note adds note by note
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :param version: The version of the workspace file that the notes were loaded from
+        :type version: list
+        :return: A dict from the title of each note to a dict from each token to a list of positions,
+            or None if the file was written for another version of the workspace
+        :rtype: dict or None
+        """
+        try:
+            with open(file_name) as file:
+                data = json.load(file)
+            if data["version"] != version or not isinstance(data["notes"], dict):
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return data["notes"]
@@ -0,0 +1,241 @@
+import contextlib
+import argparse
+import asyncio
+import signal
+import json
+import sys
+import io
+import os
+
+from project import PAGE_SIZE, parse_command, process
+from todo import ToDo
+
+# Seconds a save waits for the saves of other clients, which are written together
+SAVE_DELAY = 0.05
+# The commands of project.process that the clients can run, besides show, save and exit.
+# stats is not served: stats export writes any file the server can write, and stats profile slows down every client.
+# undo and redo are not served either: the engine has one history, so they would take back the commands of other clients.
+COMMANDS = frozenset(["newtask", "delete", "task", "note", "page", "filter", "search", "help"])
+
+
+class Session:
+    """
+    The state of one client: the note it works on and the page of that note.
+    All the clients share one engine, so each command of a client runs with the note of its session.
+    """
+
+    __slots__ = ("note", "page")
+
+    def __init__(self):
+        self.note = None
+        self.page = 1
+
+
+class Server:
+    """
+    Serves the commands of project.process to many clients over a TCP or Unix socket, with one engine in memory.
+    Each line sent by a client is a command, e.g. "newtask buy milk", and the server answers each command
+    with one line of json: {"ok": true or false, "output": what the command printed, "note": the note of the client}.
+    The commands of all the clients run one at a time in the event loop, so the engine is never changed by two commands at once.
+    The save commands received within save_delay seconds are written by one save of the engine.
+    """
+
+    def __init__(self, engine, save_delay=SAVE_DELAY):
+        """
+        :param engine: The engine shared by all the clients
+        :type engine: ToDo
+        :param save_delay: Seconds a save waits for the saves of other clients
+        :type save_delay: float
+        """
+        self.engine = engine
+        self.engine.page_size = PAGE_SIZE
+        self.save_delay = save_delay
+        self.num_of_saves = 0
+        # the connections of the clients, closed when the server stops
+        self._clients = set()
+        # the futures of the save commands waiting for the next save, see self._saver
+        self._save_waiters = []
+        self._save_requested = None
+        self._stopped = None
+
+    async def serve(self, address, ready=None):
+        """
+        Serves the clients until self.stop is called, then saves the engine.
+        address is host:port for TCP, e.g. 127.0.0.1:8765, or the path of a Unix socket.
+
+        :param address: The address to listen on, port 0 picks a free port
+        :type address: str
+        :param ready: If not None, called with the address the server listens on, once it accepts clients
+        :type ready: function
+        :raise OSError: If the server cannot listen on address, or the last save fails
+        """
+        self._save_requested = asyncio.Event()
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError, AttributeError):
+                loop.add_signal_handler(signal_number, self.stop)
+
+        host, _, port = address.rpartition(":")
+        if host and port.isdigit():
+            server = await asyncio.start_server(self.handle, host, int(port))
+            address = "{}:{}".format(*server.sockets[0].getsockname()[:2])
+        else:
+            server = await asyncio.start_unix_server(self.handle, address)
+        saver = asyncio.create_task(self._saver())
+        try:
+            async with server:
+                if ready is not None:
+                    ready(address)
+                await self._stopped.wait()
+                for client in self._clients:
+                    client.close()
+        finally:
+            saver.cancel()
+            if not host:
+                with contextlib.suppress(OSError):
+                    os.remove(address)
+        self.engine.save()
+        self.engine.wait_for_save()
+
+    def stop(self):
+        """
+        Makes self.serve stop accepting clients and return
+        """
+        self._stopped.set()
+
+    async def handle(self, reader, writer):
+        """
+        Runs the commands sent by one client until it sends exit or closes the connection
+        """
+        session = Session()
+        self._clients.add(writer)
+        try:
+            while line := await reader.readline():
+                line = line.decode(errors="replace").strip()
+                if not line:
+                    continue
+                if line == "exit":
+                    break
+                if line == "save":
+                    response = await self.save()
+                else:
+                    response = self.run_command(session, line)
+                response["note"] = session.note
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def run_command(self, session, line):
+        """
+        Runs the command in line with the note and the page of session, like project.run does for the user.
+        show returns the active note, like it is shown to the user.
+        Only the commands in COMMANDS are run.
+
+        :param session: The session of the client
+        :type session: Session
+        :param line: A command, e.g. "task 1 status complete"
+        :type line: str
+        :return: The response to the client, without the note
+        :rtype: dict
+        """
+        if line == "show":
+            command = None
+        elif (command := parse_command(line)) is None:
+            return {"ok": False, "output": "Invalid command"}
+        elif command.name not in COMMANDS:
+            return {"ok": False, "output": f"{command.name} is not available on the server"}
+
+        engine = self.engine
+        if session.note in engine.notes:
+            engine.current_note = session.note
+            engine.page = session.page
+        else:
+            # a new client, or its note was deleted by another client
+            engine.current_note = next(iter(engine.notes), None)
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                if command is None:
+                    print(engine)
+                    ok = True
+                else:
+                    ok = bool(process(engine, command))
+        except Exception as e:
+            # a command that fails must not stop the server for the other clients
+            ok = False
+            output.write(f"{type(e).__name__}: {e}\n")
+        session.note = engine.current_note
+        session.page = engine.page
+        return {"ok": ok, "output": output.getvalue()}
+
+    async def save(self):
+        """
+        Waits until the changes of all the clients are saved by self._saver
+
+        :return: The response to the client, without the note
+        :rtype: dict
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._save_waiters.append(future)
+        self._save_requested.set()
+        error = await future
+        if error is not None:
+            return {"ok": False, "output": f"Save Error: {error}"}
+        return {"ok": True, "output": "Saved successfull."}
+
+    async def _saver(self):
+        """
+        Saves the engine for the save commands of the clients.
+        It waits self.save_delay seconds after a save command, so the save commands of many clients are written by one save.
+        The file is written in a thread, and the clients keep running commands meanwhile.
+        """
+        while True:
+            await self._save_requested.wait()
+            await asyncio.sleep(self.save_delay)
+            self._save_requested.clear()
+            waiters, self._save_waiters = self._save_waiters, []
+            error = None
+            try:
+                # the changes are merged and copied here, and written by the thread of the engine
+                self.engine.save(background=True)
+                while not await asyncio.to_thread(self.engine.wait_for_save):
+                    # another process saved while the file was written, its changes are merged and these are written again
+                    self.engine.save(background=True)
+                self.num_of_saves += 1
+            except OSError as e:
+                error = e
+            for future in waiters:
+                if not future.done():
+                    future.set_result(error)
+
+
+def main():
+    """
+    Serves a workspace to many clients, see Server
+    """
+    parser = argparse.ArgumentParser(description="Serves a M3 ToDo workspace over a socket")
+    parser.add_argument("workspace", help="the csv, SQLite (.db) or binary (.m3) file of the workspace")
+    parser.add_argument(
+        "--address", default="127.0.0.1:8765", help="host:port, or the path of a Unix socket (default: 127.0.0.1:8765)"
+    )
+    parser.add_argument("--save-delay", type=float, default=SAVE_DELAY, help="seconds a save waits to be written with others")
+    arguments = parser.parse_args()
+
+    server = Server(ToDo(arguments.workspace, lazy=True), arguments.save_delay)
+    try:
+        asyncio.run(server.serve(arguments.address, lambda address: print(f"Serving {arguments.workspace} on {address}", flush=True)))
+    except KeyboardInterrupt:
+        # where the event loop cannot handle the signals, e.g. on Windows
+        server.engine.save()
+        server.engine.wait_for_save()
+    except OSError as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import bisect
+import json
+
+# Upper bounds in milliseconds of the buckets of a Histogram, the last bucket holds the longer times
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+_BUCKET_NAMES = [f"<={bound}" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+# Number of notes whose load time is kept, the oldest ones are forgotten first
+NOTE_LOADS_KEPT = 1000
+# Number of saves whose bytes and time are kept
+SAVES_KEPT = 1000
+# Number of functions kept from a cProfile capture, those with the largest cumulative time
+PROFILE_TOP = 25
+
+
+class Histogram:
+    """
+    Counts the times of an operation in the buckets of BUCKETS_MS, so it takes the same memory however many times are added.
+    The percentiles are estimated by the upper bound of their bucket.
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """
+        Adds one time of the operation
+
+        :param seconds: The time the operation took
+        :type seconds: float
+        """
+        ms = seconds * 1000
+        self.buckets[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, percent):
+        """
+        Returns the time in milliseconds that percent of the times are below, at most the upper bound of its bucket
+
+        :param percent: A number from 0 to 100
+        :type percent: float
+        :rtype: float
+        """
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns the histogram in a format that json can write
+
+        :rtype: dict
+        """
+        return {
+            "count": self.count,
+            "total_ms": self.total,
+            "max_ms": self.max,
+            "buckets_ms": dict(zip(_BUCKET_NAMES, self.buckets)),
+        }
+
+
+class Stats:
+    """
+    The instrumentation of the hot paths of the program: a Histogram of the time of each command and operation,
+    counters like the rows of the tables rendered and the bytes written by the saves,
+    and the load time of the last NOTE_LOADS_KEPT notes loaded.
+    A cProfile capture can be started and stopped, and its slowest functions are kept with the other stats.
+    Only the time of the operations is measured, so the stats can always be on.
+    """
+
+    def __init__(self):
+        """
+        :return: An object of class Stats with nothing recorded
+        :r type: class Stats
+        """
+        self.reset()
+        self.profiler = None
+
+    def reset(self):
+        """
+        Forgets everything recorded, except a cProfile capture that is running
+        """
+        # Histogram of each operation, e.g. "command newtask", "show" or "save"
+        self.timings = {}
+        self.counters = {}
+        # load time in milliseconds of each note, by title
+        self.note_loads = {}
+        # [bytes, milliseconds] of the last saves
+        self.saves = []
+        # [function, calls, total ms, cumulative ms] of the slowest functions of the last cProfile capture
+        self.profile = []
+
+    def record(self, name, seconds):
+        """
+        Adds a time to the histogram of the operation name
+
+        :param name: The name of the operation
+        :type name: str
+        :param seconds: The time the operation took
+        :type seconds: float
+        """
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram()
+        histogram.add(seconds)
+
+    def count(self, name, n=1):
+        """
+        Adds n to the counter name
+
+        :param name: The name of the counter, e.g. "rows rendered"
+        :type name: str
+        :param n: The number to add
+        :type n: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_load(self, title, seconds):
+        """
+        Records the time that creating the tasks of a note took
+
+        :param title: The title of the note
+        :type title: str
+        :param seconds: The time the note took to load
+        :type seconds: float
+        """
+        self.record("load note", seconds)
+        self.note_loads.pop(title, None)
+        if len(self.note_loads) >= NOTE_LOADS_KEPT:
+            del self.note_loads[next(iter(self.note_loads))]
+        self.note_loads[title] = seconds * 1000
+
+    def record_save(self, num_of_bytes, seconds):
+        """
+        Records a save that wrote num_of_bytes bytes. It is called by the thread of a background save.
+
+        :param num_of_bytes: The bytes written by the save
+        :type num_of_bytes: int
+        :param seconds: The time the save took
+        :type seconds: float
+        """
+        self.record("save", seconds)
+        self.count("bytes written", num_of_bytes)
+        self.saves.append([num_of_bytes, seconds * 1000])
+        if len(self.saves) > SAVES_KEPT:
+            del self.saves[: len(self.saves) - SAVES_KEPT]
+
+    def start_profile(self):
+        """
+        Starts a cProfile capture of the functions called until stop_profile
+
+        :raise ValueError: If a capture is already running, or another profiler is active
+        """
+        import cProfile
+
+        if self.profiler is not None:
+            raise ValueError("The profiler is already on")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        self.profiler = profiler
+
+    def stop_profile(self):
+        """
+        Stops the cProfile capture and keeps its PROFILE_TOP functions with the largest cumulative time in self.profile
+
+        :raise ValueError: If no capture is running
+        """
+        import pstats
+
+        if self.profiler is None:
+            raise ValueError("The profiler is already off")
+        self.profiler.disable()
+        functions = pstats.Stats(self.profiler).stats
+        self.profiler = None
+        slowest = sorted(functions.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        self.profile = [
+            [pstats.func_std_string(function), calls, total * 1000, cumulative * 1000]
+            for function, (_, calls, total, cumulative, _) in slowest
+        ]
+
+    def report(self):
+        """
+        Returns the stats in tables, which the stats command prints
+
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        rows = [
+            [name, h.count, h.total / h.count, h.percentile(50), h.percentile(99), h.max]
+            for name, h in sorted(self.timings.items())
+        ]
+        lines = [tabulate(rows, ["Operation", "count", "mean ms", "p50 ms", "p99 ms", "max ms"], floatfmt=".2f")]
+        counters = dict(self.counters)
+        if self.saves:
+            counters["bytes per save (last)"] = self.saves[-1][0]
+        if counters:
+            lines.append(tabulate(sorted(counters.items()), ["Counter", "value"]))
+        if self.note_loads:
+            slowest = sorted(self.note_loads.items(), key=lambda item: item[1], reverse=True)[:5]
+            lines.append(tabulate(slowest, ["Slowest notes loaded", "ms"], floatfmt=".2f"))
+        if self.profiler is not None:
+            lines.append("The profiler is on, stats profile off shows the slowest functions")
+        elif self.profile:
+            lines.append(tabulate(self.profile, ["Function", "calls", "total ms", "cumulative ms"], floatfmt=".2f"))
+        return "\n\n".join(lines)
+
+    def to_dict(self):
+        """
+        Returns all the stats in a format that json can write
+
+        :rtype: dict
+        """
+        return {
+            "timings": {name: histogram.to_dict() for name, histogram in self.timings.items()},
+            "counters": dict(self.counters),
+            "note_loads_ms": dict(self.note_loads),
+            "saves": [{"bytes": num_of_bytes, "ms": ms} for num_of_bytes, ms in list(self.saves)],
+            "profile": [
+                {"function": function, "calls": calls, "total_ms": total, "cumulative_ms": cumulative}
+                for function, calls, total, cumulative in self.profile
+            ],
+        }
+
+    def export(self, file_name):
+        """
+        Writes the stats to file_name in json format, for analysis by other programs
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :raise OSError: If the file cannot be written
+        """
+        with open(file_name, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+# The stats of this process, recorded by project.py, todo.py and the storages through ToDo
+STATS = Stats()
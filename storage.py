@@ -0,0 +1,1284 @@
+from itertools import chain
+import contextlib
+import threading
+import tempfile
+import base64
+import json
+import struct
+import locale
+import mmap
+import stat
+import csv
+import io
+import os
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Number of bytes read at a time when indexing a csv workspace in lazy mode
+LOAD_CHUNK_SIZE = 1 << 20
+# save folds the journal into the csv file when the journal grows larger than
+# JOURNAL_COMPACT_RATIO times the size of the csv file (and JOURNAL_MIN_SIZE bytes)
+JOURNAL_COMPACT_RATIO = 0.5
+JOURNAL_MIN_SIZE = 1 << 16
+# Number of folded journals kept for the processes that did not read them yet, see JournalStorage.changes
+JOURNAL_GENERATIONS = 16
+
+# Valid priorities and statuses, which the binary format stores as their position in these tuples like todo.Task
+PRIORITIES = ("low", "normal", "high")
+STATUSES = ("complete", "incomplete")
+PRIORITY_CODES = {priority: code for code, priority in enumerate(PRIORITIES)}
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# Number of random bits of a task id, which is written as TASK_ID_LENGTH characters of lower case base32, e.g. "k5qzj2x7ma"
+TASK_ID_BITS = 50
+TASK_ID_LENGTH = 10
+# The record of a task in the binary format: heap offset and length of the body, priority code, status code, task id
+TASK_RECORD = struct.Struct(f"<QIBB{TASK_ID_LENGTH}s")
+# The fields of TASK_RECORD before the task id, which are the whole record of a file written before the tasks had ids
+TASK_FIELDS = struct.Struct("<QIBB")
+LEGACY_TASK_RECORD = struct.Struct("<QIBBxx")
+# The first row of a csv file written by CsvStorage, whose rows are loaded as TrustedRows, followed by the generation of the file
+CSV_HEADER = ["#M3TODO", "csv", "2"]
+# Number of random bytes of the generation written inside a file by each write_all, see JournalStorage._file_version
+GENERATION_BYTES = 8
+# Number of bytes at the beginning of a file that hold its generation
+GENERATION_HEAD_SIZE = 64
+
+
+class ConcurrentChangeError(OSError):
+    """
+    Raised by Storage.append and Storage.write_all when another process saved the file after Storage.point.
+    ToDo.save reads the other changes with Storage.changes, merges them and saves again.
+    """
+
+
+class Storage:
+    """
+    Reads and writes the notes and tasks of a ToDo in a file.
+    Each subclass stores them in a different format, open_storage chooses one by the extension of the file name.
+
+    The tasks are passed as [body, priority, status, id] rows, and changes in the format of ToDo._apply.
+    The tasks of a file written before the tasks had ids get the ids of legacy_task_ids, until the file is written again.
+    Several processes can open the same file: self.point is the version of the file that the ToDo has read or written last.
+    append and write_all only write if nobody else wrote the file after self.point, and changes reads what they wrote.
+    """
+
+    def __init__(self, file_name, read_only=False):
+        """
+        Opens file_name, or creates an empty workspace in it if it does not exist.
+        If read_only is True, nothing is ever written next to file_name, not even a lock file, and append and write_all raise PermissionError.
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :param read_only: If True, only reads file_name, which must exist
+        :type read_only: bool
+        :raise FileNotFoundError: If read_only is True and file_name does not exist
+        """
+        self.file_name = file_name
+        self.read_only = read_only
+        if read_only and not os.path.isfile(file_name):
+            raise FileNotFoundError(f"{file_name} does not exist")
+        self.point = None
+        # number of bytes written by append and write_all since the file was opened, which the stats command shows
+        self.bytes_written = 0
+        # True if the last load may have given tasks the ids of legacy_task_ids, which change with the version of the file
+        self.legacy_ids = False
+
+    def load(self, lazy):
+        """
+        Returns the notes in the file in order, and sets self.point to the version that was read and self.legacy_ids.
+        Each note is a tuple (title, num_of_tasks, load), where load is a function with no arguments that returns the rows of the note.
+        If lazy is True, load reads the rows from the file when it is called, from the same version of the file.
+
+        :param lazy: If True, does not read the rows of the notes yet
+        :type lazy: bool
+        :raise ValueError: If the file is curropted
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def changes(self):
+        """
+        Returns the changes saved after self.point, which ToDo applies after load, and moves self.point after them.
+        These are the changes of the journal after load, and the changes saved by other processes after a save.
+
+        :raise ValueError: If the changes are curropted
+        :return: A list of changes, or None if they are not available anymore and the file must be loaded again
+        :rtype: list or None
+        """
+        return []
+
+    def version(self):
+        """
+        Returns self.point as a list, which changes whenever load would return different notes
+
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def saved_version(cls, file_name):
+        """
+        Returns a value that changes whenever file_name is saved, without loading it, e.g. to know if what was read from it is still valid
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :raise OSError: If file_name does not exist or cannot be read
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def needs_compact(self):
+        """
+        Returns True if saving changes with append is not efficient anymore and write_all should be used instead
+
+        :rtype: bool
+        """
+        return False
+
+    def append(self, changes):
+        """
+        Saves changes, which are applied after the changes saved before
+
+        :param changes: A list of changes
+        :type changes: list
+        :raise ConcurrentChangeError: If another process saved the file after self.point
+        :raise OSError: If the file cannot be written
+        """
+        raise NotImplementedError
+
+    def _check_writable(self):
+        """
+        Raises PermissionError if the file was opened with read_only
+        """
+        if self.read_only:
+            raise PermissionError(f"{self.file_name} is opened read-only")
+
+    def write_all(self, notes, changes=()):
+        """
+        Replaces the content of the file with notes
+
+        :param notes: A list of (title, rows) for each note
+        :type notes: list
+        :param changes: The changes included in notes that are not saved yet, so other processes can still read them with self.changes
+        :type changes: list
+        :raise ConcurrentChangeError: If another process saved the file after self.point
+        :raise OSError: If the file cannot be written
+        """
+        raise NotImplementedError
+
+
+class JournalStorage(Storage):
+    """
+    A Storage whose file is only written as a whole.
+    append adds the changes to a journal file next to it in csv format, which write_all folds into the file.
+    A folded journal ends with a ["folded", *version] change with the version of the new file, and is kept with the version
+    it was written for in its name, so the processes that did not read it yet can still read it with changes.
+    The journal and the file are only written while holding an advisory lock on a lock file next to them.
+    self.point is the version of the file and the size of the journal that was read.
+    A journal that was not written for the file, e.g. the file was restored from a backup, is never removed, see self.changes.
+    When the file is opened with read_only, changes reads the journal without the lock and never moves it.
+    """
+
+    # "w" if the file is written in text mode by self._write, "wb" in binary mode
+    mode = "w"
+
+    def __init__(self, file_name, read_only=False):
+        super().__init__(file_name, read_only)
+        self.journal_name = file_name + ".journal"
+        self.lock_name = file_name + ".lock"
+        self.encoding = locale.getpreferredencoding(False)
+
+    def _file_version(self, file=None):
+        """
+        Returns the version of self.file_name, or of the open file if it is passed, which must not be read yet.
+        It is [generation] with the random generation that write_all writes inside the file, so touching or copying the file keeps it,
+        or the size and modification time of a file written without one, e.g. by another program.
+        The journal starts with the version of the file it was written for.
+
+        :rtype: list
+        """
+        if file is None:
+            with open(self.file_name, "rb") as file:
+                return self._file_version(file)
+        generation = self._generation(_read_head(file, GENERATION_HEAD_SIZE))
+        if generation is not None:
+            return [generation]
+        stat = os.fstat(file.fileno())
+        return [str(stat.st_size), str(stat.st_mtime_ns)]
+
+    def _generation(self, head):
+        """
+        Returns the generation written by self._write in head, the first GENERATION_HEAD_SIZE bytes of the file, or None if it has none
+
+        :rtype: str or None
+        """
+        return None
+
+    def version(self):
+        return self.point[0]
+
+    @classmethod
+    def saved_version(cls, file_name):
+        """
+        Returns the size and modification time of file_name and of its journal, None for the journal if it does not exist
+        """
+        version = []
+        for name in [file_name, file_name + ".journal"]:
+            try:
+                stat = os.stat(name)
+            except FileNotFoundError:
+                if name == file_name:
+                    raise
+                version.append(None)
+            else:
+                version.append([stat.st_size, stat.st_mtime_ns])
+        return version
+
+    def changes(self):
+        """
+        Returns the changes in the journal after self.point.
+        If the file was folded by other processes after self.point, the rest of each folded journal is read first.
+        A journal written for an older version of self.file_name was already folded into it and is removed.
+        Without the lock, a change that is being appended is read incomplete, and ToDo ignores an incomplete last change.
+        """
+        with contextlib.nullcontext() if self.read_only else _file_lock(self.lock_name):
+            version, offset = self.point
+            current = self._file_version()
+            changes = []
+            while version != current:
+                header, folded, _ = self._read_journal(self._folded_name(version), offset)
+                if header != ["journal", *version] or not folded or folded[-1][0] != "folded":
+                    return None
+                changes += folded[:-1]
+                version, offset = folded[-1][1:], 0
+            header, new_changes, size = self._read_journal(self.journal_name, offset)
+            if header not in [None, ["journal", *current]]:
+                self._unmatched_journal(header, current)
+                new_changes, size = [], 0
+            changes += new_changes
+        self.point = (current, size)
+        # a save that was interrupted while folding may leave its folded change in the journal
+        return [change for change in changes if change[:1] != ["folded"]]
+
+    def _unmatched_journal(self, header, current):
+        """
+        Handles a journal that was not written for the current version of the file, while holding the lock.
+        A journal that ends with ["folded", *current] was folded into the file by a write_all that stopped before moving it, so it is moved now.
+        Any other journal has changes that the file does not have, e.g. the file was restored from a backup,
+        so it is kept aside instead of being removed, and an error is raised.
+        With read_only, the journal is left where it is.
+
+        :raise ValueError: If the journal has changes that are not in the file
+        """
+        _, changes, _ = self._read_journal(self.journal_name, 0)
+        if changes[-1:] == [["folded", *current]]:
+            if not self.read_only:
+                os.replace(self.journal_name, self._folded_name(header[1:]))
+            return
+        if self.read_only:
+            raise ValueError(f"{self.file_name} was replaced by another program after its last changes were saved to {self.journal_name}")
+        aside = f"{self.journal_name}-unmatched-{new_generation()}"
+        os.replace(self.journal_name, aside)
+        raise ValueError(
+            f"{self.file_name} was replaced by another program after its last changes were saved, they were moved to {aside}"
+        )
+
+    def _folded_name(self, version):
+        """
+        Returns the name of the journal written for version after it is folded
+
+        :rtype: str
+        """
+        return f"{self.journal_name}.{'-'.join(version)}"
+
+    def _read_journal(self, journal_name, offset):
+        """
+        Reads the changes of a journal after offset
+
+        :return: The header of the journal (None if it does not exist), the changes and the size of the journal
+        :rtype: tuple
+        """
+        if not os.path.isfile(journal_name):
+            return None, [], 0
+        with open(journal_name, "rb") as file:
+            header = next(csv.reader([file.readline().decode(self.encoding)]), None)
+            file.seek(max(offset, file.tell()))
+            text = file.read().decode(self.encoding)
+            size = file.tell()
+        return header, list(csv.reader(io.StringIO(text, newline=""))), size
+
+    def _check(self):
+        """
+        Raises ConcurrentChangeError if another process wrote the file or the journal after self.point.
+        Must be called while holding the lock.
+        """
+        if self.point is None:
+            return
+        size = os.path.getsize(self.journal_name) if os.path.isfile(self.journal_name) else 0
+        if [self._file_version(), size] != list(self.point):
+            raise ConcurrentChangeError(f"{self.file_name} was saved by another process")
+
+    def needs_compact(self):
+        journal_size = os.path.getsize(self.journal_name) if os.path.isfile(self.journal_name) else 0
+        base_size = os.path.getsize(self.file_name)
+        return journal_size > max(JOURNAL_MIN_SIZE, base_size * JOURNAL_COMPACT_RATIO)
+
+    def append(self, changes):
+        """
+        Appends changes to the journal and flushes it to the disk.
+        If the journal is empty, writes the version of self.file_name at its beginning.
+        """
+        self._check_writable()
+        with _file_lock(self.lock_name):
+            self._check()
+            self.point = (self._file_version(), self._append_journal(changes))
+
+    def _append_journal(self, changes):
+        """
+        Appends changes to the journal while holding the lock and returns the new size of the journal
+
+        :rtype: int
+        """
+        with open(self.journal_name, "a", newline="") as file:
+            start = file.tell()
+            writer = csv.writer(file)
+            if not start:
+                writer.writerow(["journal", *self._file_version()])
+            writer.writerows(changes)
+            file.flush()
+            os.fsync(file.fileno())
+            self.bytes_written += file.tell() - start
+            return file.tell()
+
+    def write_all(self, notes, changes=()):
+        """
+        Writes notes to a temporary file in the directory of self.file_name with self._write, flushes it to the disk
+        and renames it to self.file_name, so self.file_name is never left half written.
+        If the file was loaded, changes and the version of the new file are appended to the journal before, and the journal is kept as a folded journal.
+        """
+        self._check_writable()
+        directory = os.path.dirname(os.path.abspath(self.file_name))
+        with _file_lock(self.lock_name):
+            self._check()
+            fd, temp_name = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+            try:
+                with open(fd, self.mode, **({} if "b" in self.mode else {"newline": ""})) as file:
+                    self._write(file, notes, new_generation())
+                    file.flush()
+                    os.fsync(file.fileno())
+                    self.bytes_written += os.fstat(file.fileno()).st_size
+                if os.path.isfile(self.file_name):
+                    # keep the permissions of the file instead of the private ones of the temporary file
+                    os.chmod(temp_name, stat.S_IMODE(os.stat(self.file_name).st_mode))
+                if self.point is not None:
+                    # renaming keeps the generation, and the size and modification time, so this is the version of the new file
+                    with open(temp_name, "rb") as temp:
+                        self._append_journal([*changes, ["folded", *self._file_version(temp)]])
+                self._release()
+                os.replace(temp_name, self.file_name)
+            except BaseException:
+                if os.path.isfile(temp_name):
+                    os.remove(temp_name)
+                raise
+            _sync_directory(directory)
+            # the journal does not match the new version of self.file_name anymore, so it would be ignored even if moving it fails
+            if self.point is not None:
+                os.replace(self.journal_name, self._folded_name(self.point[0]))
+                self._remove_folded()
+            self.point = (self._file_version(), 0)
+
+    def _release(self):
+        """
+        Closes the old file if it is kept open, before write_all replaces it, which Windows does not allow for an open file.
+        write_all is given all the notes, so the loaders do not read the old file anymore.
+        """
+
+    def _remove_folded(self):
+        """
+        Removes the folded journals except the last JOURNAL_GENERATIONS ones
+        """
+        directory = os.path.dirname(os.path.abspath(self.journal_name))
+        prefix = os.path.basename(self.journal_name) + "."
+        folded = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith(prefix)]
+        folded.sort(key=os.path.getmtime)
+        for name in folded[:-JOURNAL_GENERATIONS]:
+            os.remove(name)
+
+    def _write(self, file, notes, generation):
+        """
+        Writes notes to the open file in the format of the subclass, with generation if the format has one, see self._generation
+        """
+        raise NotImplementedError
+
+
+class CsvStorage(JournalStorage):
+    """
+    Stores a workspace in a csv file with one [title, body, priority, status, id] row for each task.
+    A file written by self._write starts with the row CSV_HEADER, its rows are loaded as TrustedRows.
+    The rows of a file written by other programs are validated when their tasks are created,
+    and those of a file written before the tasks had ids have no id, see _add_legacy_ids.
+    """
+
+    def __init__(self, file_name, read_only=False):
+        super().__init__(file_name, read_only)
+        # the file read by the loaders of the notes, which stays the same if another process replaces self.file_name
+        self.file = None
+        if not read_only and not os.path.isfile(file_name):
+            # the new file has a generation, so its journal is not lost if the file is touched or copied
+            self.write_all([])
+
+    def load(self, lazy):
+        if lazy:
+            return self._index_file()
+        notes = {}
+        with open(self.file_name) as file:
+            self.point = (self._file_version(file), 0)
+            reader = csv.reader(file)
+            first = next(reader, None)
+            trusted = first is not None and _header_generation(first) is not None
+            if not trusted and first is not None:
+                reader = chain([first], reader)
+            # the rows written by self._write always have an id
+            widths = [5] if trusted else [4, 5]
+            for row in reader:
+                if len(row) not in widths:
+                    raise ValueError(f"{self.file_name} curropted.")
+                rows = notes.get(row[0])
+                if rows is None:
+                    # note with title in row[0] is not found yet. We add a new note with title row[0] and the current task in it.
+                    notes[row[0]] = rows = TrustedRows() if trusted else []
+                rows.append(row[1:])
+        self.legacy_ids = False
+        if not trusted:
+            for title, rows in notes.items():
+                if _add_legacy_ids(rows, self.point[0], title):
+                    self.legacy_ids = True
+        return [(title, len(rows), lambda rows=rows: rows) for title, rows in notes.items()]
+
+    def _index_file(self):
+        """
+        Reads self.file_name in chunks of LOAD_CHUNK_SIZE bytes and finds the byte ranges of the rows of each note without reading the rows.
+        The load function of each note reads its own rows from the file, which is kept open in self.file.
+
+        :raise ValueError: If a row of self.file_name does not start with a note title
+        :rtype: list
+        """
+        spans = {}
+        counts = {}
+        last_raw_title = None
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.file_name, "rb")
+        self.point = (self._file_version(self.file), 0)
+        trusted = _header_generation(self.file.readline().rstrip(b"\r\n").decode("ascii", "replace").split(",")) is not None
+        # the rows are not read yet, and a file without CSV_HEADER may have rows without ids
+        self.legacy_ids = not trusted
+        if not trusted:
+            self.file.seek(0)
+        for raw_title, start, end in _scan_rows(self.file):
+            if raw_title != last_raw_title:
+                title = _decode_title(raw_title, self.encoding, self.file_name)
+                last_raw_title = raw_title
+            if title not in spans:
+                spans[title] = [[start, end]]
+                counts[title] = 1
+                continue
+            if spans[title][-1][1] == start:
+                # rows of a note written by save are next to each other, extend the last range
+                spans[title][-1][1] = end
+            else:
+                spans[title].append([start, end])
+            counts[title] += 1
+
+        return [
+            (title, counts[title], _row_loader(self.file, title, spans[title], self.encoding, self.point[0], trusted))
+            for title in spans
+        ]
+
+    def _generation(self, head):
+        return _header_generation(head.split(b"\n", 1)[0].rstrip(b"\r").decode("ascii", "replace").split(",")) or None
+
+    def _release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write(self, file, notes, generation):
+        """
+        Writes CSV_HEADER with generation and the rows of notes. Empty notes have no rows, so they are not written.
+        """
+        writer = csv.writer(file)
+        writer.writerow([*CSV_HEADER, generation])
+        for title, rows in notes:
+            for row in rows:
+                writer.writerow([title, *row])
+
+
+class BinaryStorage(JournalStorage):
+    """
+    Stores a workspace in a binary file which is opened with mmap, so opening it does not parse or validate the tasks.
+    The file has a header (HEADER), a directory of the notes (NOTE_RECORD), a fixed width record for each task (TASK_RECORD)
+    and a heap of the utf-8 encoded titles and bodies. The tasks of each note are stored one after another, in order.
+    The loader of a note returns Records, which todo.TaskView reads from the mapped file without copying.
+    The header has the generation of the file, see JournalStorage._file_version.
+    A file of the second version of the format (IDS_MAGIC) has a header without the generation (LEGACY_HEADER),
+    and a file of the first version (LEGACY_MAGIC) also has records without the task ids (LEGACY_TASK_RECORD).
+    """
+
+    MAGIC = b"M3TODO\x00\x03"
+    IDS_MAGIC = b"M3TODO\x00\x02"
+    LEGACY_MAGIC = b"M3TODO\x00\x01"
+    # magic, number of notes, number of tasks, offset of the task records, offset of the heap, generation
+    HEADER = struct.Struct(f"<8sIQQQ{GENERATION_BYTES}s")
+    LEGACY_HEADER = struct.Struct("<8sIQQQ")
+    # heap offset and length of the title, number of tasks
+    NOTE_RECORD = struct.Struct("<QII")
+    mode = "wb"
+
+    def __init__(self, file_name, read_only=False):
+        super().__init__(file_name, read_only)
+        if not read_only and (not os.path.isfile(file_name) or not os.path.getsize(file_name)):
+            self.write_all([])
+
+    def load(self, lazy):
+        # the tasks loaded before keep the previous buffer, which stays valid after the file is replaced
+        with open(self.file_name, "rb") as file:
+            self.point = (self._file_version(file), 0)
+            if os.name == "nt":
+                # Windows cannot replace a file while it is mapped, by this process or another, so the file is copied into memory
+                buffer = file.read()
+            else:
+                buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = self.HEADER if buffer[:len(self.MAGIC)] == self.MAGIC else self.LEGACY_HEADER
+        if len(buffer) < header.size:
+            raise ValueError(f"{self.file_name} curropted.")
+        magic, num_of_notes, num_of_tasks, tasks_offset, heap_offset = header.unpack_from(buffer)[:5]
+        record = LEGACY_TASK_RECORD if magic == self.LEGACY_MAGIC else TASK_RECORD
+        self.legacy_ids = record is LEGACY_TASK_RECORD
+        if (
+            magic not in [self.MAGIC, self.IDS_MAGIC, self.LEGACY_MAGIC]
+            or tasks_offset != header.size + num_of_notes * self.NOTE_RECORD.size
+            or heap_offset != tasks_offset + num_of_tasks * record.size
+            or heap_offset > len(buffer)
+        ):
+            raise ValueError(f"{self.file_name} curropted.")
+
+        notes = []
+        view = memoryview(buffer)
+        offset = tasks_offset
+        for title_offset, title_length, count in self.NOTE_RECORD.iter_unpack(view[header.size:tasks_offset]):
+            title = str(view[title_offset:title_offset + title_length], "utf-8")
+            ids = None if record is TASK_RECORD else legacy_task_ids(self.point[0], title, count)
+            records = Records(view, range(offset, offset + count * record.size, record.size), ids)
+            notes.append((title, count, lambda records=records: records))
+            offset += count * record.size
+        if offset != heap_offset:
+            raise ValueError(f"{self.file_name} curropted.")
+        return notes
+
+    def _generation(self, head):
+        if head[:len(self.MAGIC)] != self.MAGIC or len(head) < self.HEADER.size:
+            return None
+        return self.HEADER.unpack_from(head)[5].hex()
+
+    def _write(self, file, notes, generation):
+        """
+        Writes notes in the binary format. Equal strings are written to the heap once.
+        """
+        num_of_tasks = sum(len(rows) for _, rows in notes)
+        tasks_offset = self.HEADER.size + len(notes) * self.NOTE_RECORD.size
+        heap_offset = tasks_offset + num_of_tasks * TASK_RECORD.size
+        heap = bytearray()
+        strings = {}
+
+        def store(text):
+            if text not in strings:
+                data = text.encode("utf-8")
+                strings[text] = (heap_offset + len(heap), len(data))
+                heap.extend(data)
+            return strings[text]
+
+        directory = bytearray()
+        records = bytearray()
+        for title, rows in notes:
+            directory += self.NOTE_RECORD.pack(*store(title), len(rows))
+            for body, priority, status, task_id in rows:
+                records += TASK_RECORD.pack(
+                    *store(body),
+                    PRIORITY_CODES[priority.lower().strip()],
+                    STATUS_CODES[status.lower().strip()],
+                    task_id.encode("ascii"),
+                )
+
+        file.write(self.HEADER.pack(self.MAGIC, len(notes), num_of_tasks, tasks_offset, heap_offset, bytes.fromhex(generation)))
+        file.write(directory)
+        file.write(records)
+        file.write(heap)
+
+
+class TrustedRows(list):
+    """
+    The [body, priority, status, id] rows of a note read from a csv file that starts with CSV_HEADER, which CsvStorage wrote:
+    every row has an id, and the priorities and statuses are in PRIORITIES and STATUSES,
+    so todo creates their tasks without the validation of the setters of Task.
+    """
+
+    __slots__ = ()
+
+
+class Records:
+    """
+    The task records of a note in the buffer of a BinaryStorage.
+    """
+
+    __slots__ = ("buffer", "offsets", "ids")
+
+    def __init__(self, buffer, offsets, ids=None):
+        """
+        :param buffer: A memoryview of the mapped file
+        :type buffer: memoryview
+        :param offsets: The offsets of the TASK_RECORD of each task in buffer
+        :type offsets: range
+        :param ids: The ids of the tasks if the records do not have them, see legacy_task_ids
+        :type ids: list or None
+        """
+        self.buffer = buffer
+        self.offsets = offsets
+        self.ids = ids
+
+
+class SqliteStorage(Storage):
+    """
+    Stores a workspace in an SQLite database with a table of notes and a table of tasks, indexed by note and position.
+    append applies the changes to the tables in one transaction, so saving costs as much as the changes,
+    and load reads the tasks of each note with one indexed query.
+    The changes are also kept in the table changes_log, so the other processes can read them with changes.
+    self.point is the number of transactions written to the database when it was read or written last.
+    A database opened with read_only is opened by SQLite in read-only mode, so its schema and journal mode are left as they are.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE,
+            position INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            note_id INTEGER NOT NULL REFERENCES notes(id),
+            position INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            status TEXT NOT NULL,
+            task_id TEXT
+        );
+        CREATE INDEX IF NOT EXISTS tasks_note_position ON tasks (note_id, position);
+        CREATE TABLE IF NOT EXISTS changes_log (
+            seq INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            change TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+        INSERT OR IGNORE INTO meta VALUES ('version', 0);
+        INSERT OR IGNORE INTO meta VALUES ('pruned', 0);
+    """
+    # Number of changes kept in changes_log. A process that did not read the older changes loads the database again.
+    LOG_SIZE = 100_000
+
+    def __init__(self, file_name, read_only=False):
+        # sqlite3 is imported by the methods that use it, so opening a csv workspace does not import it
+        import pathlib
+        import sqlite3
+
+        super().__init__(file_name, read_only)
+        database = pathlib.Path(file_name).absolute().as_uri() + "?mode=ro" if read_only else file_name
+        # the connection is shared with the background thread of ToDo.save, self.lock makes them take turns.
+        # The transactions are started by self._transaction, so they can check self.point before writing.
+        self.connection = sqlite3.connect(database, check_same_thread=False, isolation_level=None, uri=read_only)
+        self.lock = threading.Lock()
+        # the column of the task ids, NULL in a database written before the tasks had ids and opened with read_only,
+        # whose tasks get new ids that are never written
+        self.task_id_column = "task_id"
+        try:
+            with self.lock:
+                if read_only:
+                    if not self._has_task_ids():
+                        self.task_id_column = "NULL"
+                else:
+                    # in WAL mode the readers do not block the writers, so self.reader can keep reading the version it loaded
+                    self.connection.execute("PRAGMA journal_mode=WAL")
+                    self.connection.executescript(self.SCHEMA)
+                    self._add_task_ids()
+        except sqlite3.Error as e:
+            raise ValueError(f"{file_name} curropted. {e}") from e
+        # reads the notes in a transaction started by load, so lazy notes are read from the version that load read
+        self.reader = sqlite3.connect(database, check_same_thread=False, isolation_level=None, uri=read_only)
+
+    def _has_task_ids(self):
+        """
+        Returns True if the table tasks has the column task_id
+
+        :rtype: bool
+        """
+        return "task_id" in [row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")]
+
+    def _add_task_ids(self):
+        """
+        Adds the column task_id to a database written before the tasks had ids, and gives a new id to each task.
+        The ids are written once, in the transaction that adds the column, so all the processes see the same ids.
+        """
+        if self._has_task_ids():
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            # another process may have added the column while this one waited for the transaction
+            if not self._has_task_ids():
+                self.connection.execute("ALTER TABLE tasks ADD COLUMN task_id TEXT")
+                ids = [row[0] for row in self.connection.execute("SELECT id FROM tasks")]
+                self.connection.executemany("UPDATE tasks SET task_id = ? WHERE id = ?", ((new_task_id(), i) for i in ids))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def load(self, lazy):
+        if self.reader.in_transaction:
+            self.reader.execute("COMMIT")
+        self.reader.execute("BEGIN")
+        notes = self.reader.execute("SELECT id, title FROM notes ORDER BY position").fetchall()
+        counts = dict(self.reader.execute("SELECT note_id, COUNT(*) FROM tasks GROUP BY note_id"))
+        self.point = self.reader.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        loaded = []
+        for note_id, title in notes:
+            load = self._row_loader(note_id)
+            if not lazy:
+                rows = load()
+                load = lambda rows=rows: rows
+            loaded.append((title, counts.get(note_id, 0), load))
+        if not lazy:
+            self.reader.execute("COMMIT")
+        return loaded
+
+    def _row_loader(self, note_id):
+        """
+        Returns a function that reads the rows of the note with note_id
+
+        :rtype: function
+        """
+        def load():
+            return self.reader.execute(
+                f"SELECT body, priority, status, {self.task_id_column} FROM tasks WHERE note_id = ? ORDER BY position", (note_id,)
+            ).fetchall()
+
+        return load
+
+    def version(self):
+        return [str(self.point)]
+
+    @classmethod
+    def saved_version(cls, file_name):
+        """
+        Returns the inode of file_name and the version in its table meta.
+        The files of the database change when it is only read, so their size and modification time are not used.
+        """
+        import pathlib
+        import sqlite3
+
+        inode = os.stat(file_name).st_ino
+        try:
+            connection = sqlite3.connect(pathlib.Path(file_name).absolute().as_uri() + "?mode=ro", uri=True)
+            try:
+                return [inode, connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]]
+            finally:
+                connection.close()
+        except (sqlite3.Error, TypeError) as e:
+            raise OSError(f"{file_name}: {e}") from e
+
+    def changes(self):
+        """
+        Returns the changes in changes_log written after self.point
+        """
+        import sqlite3
+
+        with self.lock:
+            try:
+                self.connection.execute("BEGIN")
+                try:
+                    version = self._meta("version")
+                    pruned = self._meta("pruned")
+                    changes = self.connection.execute(
+                        "SELECT change FROM changes_log WHERE version > ? ORDER BY seq", (self.point,)
+                    ).fetchall()
+                finally:
+                    self.connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                raise OSError(f"{self.file_name}: {e}") from e
+        if self.point < pruned:
+            return None
+        self.point = version
+        return [json.loads(change) for change, in changes]
+
+    def _meta(self, key):
+        """
+        Returns the value of key in the table meta
+
+        :param key: version or pruned
+        :type key: str
+        """
+        return self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _transaction(self, write):
+        """
+        Calls write with the new version inside a transaction, which is only committed if nobody wrote the database after self.point.
+        write returns the size of the text it gave to SQLite, which is added to self.bytes_written if the transaction is committed.
+        The errors of SQLite are raised as OSError, like the errors of writing a file.
+        """
+        import sqlite3
+
+        self._check_writable()
+        with self.lock:
+            try:
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    version = self._meta("version")
+                    if self.point is not None and version != self.point:
+                        raise ConcurrentChangeError(f"{self.file_name} was saved by another process")
+                    num_of_bytes = write(version + 1)
+                    self.connection.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version + 1,))
+                    self.connection.execute("COMMIT")
+                except BaseException:
+                    # the changes of a failed transaction are not written
+                    self.connection.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                raise OSError(f"{self.file_name}: {e}") from e
+            self.point = version + 1
+            self.bytes_written += num_of_bytes
+
+    def append(self, changes):
+        def write(version):
+            for change in changes:
+                self._apply(change)
+            return self._log(version, changes)
+
+        self._transaction(write)
+
+    def _log(self, version, changes):
+        """
+        Adds changes of version to changes_log and removes the oldest ones beyond LOG_SIZE.
+        pruned is the last version whose changes are not all in changes_log anymore.
+        Returns the size of the changes in json, which is about the size of the rows that the changes write.
+        """
+        logged = [(version, json.dumps(change)) for change in changes]
+        self.connection.executemany("INSERT INTO changes_log (version, change) VALUES (?, ?)", logged)
+        cutoff = (self.connection.execute("SELECT MAX(seq) FROM changes_log").fetchone()[0] or 0) - self.LOG_SIZE
+        pruned = self.connection.execute("SELECT MAX(version) FROM changes_log WHERE seq <= ?", (cutoff,)).fetchone()[0]
+        if pruned is not None:
+            self.connection.execute("DELETE FROM changes_log WHERE seq <= ?", (cutoff,))
+            self.connection.execute("UPDATE meta SET value = ? WHERE key = 'pruned'", (pruned,))
+        return sum(len(change) for _, change in logged)
+
+    def _apply(self, change):
+        """
+        Applies one change to the tables, inside the transaction of append
+        """
+        execute = self.connection.execute
+        action, title, *args = change
+        if action == "note":
+            execute("INSERT INTO notes (title, position) SELECT ?, COALESCE(MAX(position) + 1, 0) FROM notes", (title,))
+            return
+
+        row = execute("SELECT id FROM notes WHERE title = ?", (title,)).fetchone()
+        if row is None and action == "newtask":
+            # like ToDo._apply, a task of a missing note creates the note
+            self._apply(["note", title])
+            row = execute("SELECT id FROM notes WHERE title = ?", (title,)).fetchone()
+        note_id = row[0]
+        if action == "newtask":
+            # ToDo applies the change before it is saved, so a change without an id was written by an older version of the program
+            task_id = args[4] if len(args) == 5 else None
+        if action == "newtask" and len(args) >= 4 and args[3] != "":
+            # a task put back by undo at its old position
+            position = int(args[3])
+            execute("UPDATE tasks SET position = position + 1 WHERE note_id = ? AND position >= ?", (note_id, position))
+            execute(
+                "INSERT INTO tasks (note_id, position, body, priority, status, task_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (note_id, position, args[0], args[1].lower().strip(), args[2].lower().strip(), task_id),
+            )
+        elif action == "newtask":
+            execute(
+                "INSERT INTO tasks (note_id, position, body, priority, status, task_id) "
+                "SELECT ?, COALESCE(MAX(position) + 1, 0), ?, ?, ?, ? FROM tasks WHERE note_id = ?",
+                (note_id, args[0], args[1].lower().strip(), args[2].lower().strip(), task_id, note_id),
+            )
+        elif action == "task":
+            position, field, value = args
+            if field != "body":
+                value = value.lower().strip()
+            # field is checked by ToDo._apply before the change is saved
+            execute(f"UPDATE tasks SET {field} = ? WHERE note_id = ? AND position = ?", (value, note_id, int(position)))
+        elif action == "delete task":
+            position = int(args[0])
+            execute("DELETE FROM tasks WHERE note_id = ? AND position = ?", (note_id, position))
+            execute("UPDATE tasks SET position = position - 1 WHERE note_id = ? AND position > ?", (note_id, position))
+        elif action == "delete tasks":
+            # the tasks after the first deleted one are numbered again in one pass, instead of once for each deleted task.
+            # The new positions are computed here, UPDATE ... FROM and ROW_NUMBER need a recent SQLite.
+            positions = sorted({int(position) for position in args})
+            self.connection.executemany(
+                "DELETE FROM tasks WHERE note_id = ? AND position = ?", ((note_id, position) for position in positions)
+            )
+            ids = [row[0] for row in execute(
+                "SELECT id FROM tasks WHERE note_id = ? AND position > ? ORDER BY position", (note_id, positions[0])
+            )]
+            self.connection.executemany(
+                "UPDATE tasks SET position = ? WHERE id = ?", ((position, task_id) for position, task_id in enumerate(ids, start=positions[0]))
+            )
+        elif action == "insert tasks":
+            positions = [int(position) for position in args[::5]]
+            # the tasks from the first position get their new positions in one pass, then the tasks are inserted
+            ids = [row[0] for row in execute(
+                "SELECT id FROM tasks WHERE note_id = ? AND position >= ? ORDER BY position", (note_id, positions[0])
+            )]
+            moved = []
+            inserted = set(positions)
+            position = positions[0]
+            for task_id in ids:
+                while position in inserted:
+                    position += 1
+                moved.append((position, task_id))
+                position += 1
+            self.connection.executemany("UPDATE tasks SET position = ? WHERE id = ?", moved)
+            self.connection.executemany(
+                "INSERT INTO tasks (note_id, position, body, priority, status, task_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (note_id, positions[i // 5], args[i + 1], args[i + 2].lower().strip(), args[i + 3].lower().strip(), args[i + 4])
+                    for i in range(0, len(args), 5)
+                ),
+            )
+        elif action == "delete note":
+            execute("DELETE FROM tasks WHERE note_id = ?", (note_id,))
+            execute("DELETE FROM notes WHERE id = ?", (note_id,))
+
+    def write_all(self, notes, changes=()):
+        """
+        Replaces the content of the tables with notes.
+        changes are added to changes_log, so the other processes can still read them.
+        """
+        def write(version):
+            self.connection.execute("DELETE FROM tasks")
+            self.connection.execute("DELETE FROM notes")
+            num_of_bytes = 0
+            for note_position, (title, rows) in enumerate(notes):
+                note_id = self.connection.execute(
+                    "INSERT INTO notes (title, position) VALUES (?, ?)", (title, note_position)
+                ).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO tasks (note_id, position, body, priority, status, task_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((note_id, position, *row) for position, row in enumerate(rows)),
+                )
+                num_of_bytes += len(title) + sum(len(body) + len(priority) + len(status) + len(task_id) for body, priority, status, task_id in rows)
+            return num_of_bytes + self._log(version, changes)
+
+        self._transaction(write)
+
+
+# Storage class for each file extension, csv is used for the other extensions
+STORAGES = {
+    ".csv": CsvStorage,
+    ".db": SqliteStorage,
+    ".sqlite": SqliteStorage,
+    ".sqlite3": SqliteStorage,
+    ".m3": BinaryStorage,
+}
+
+
+def storage_class(file_name):
+    """
+    Returns the subclass of Storage for file_name, chosen by its extension
+
+    :param file_name: The name of the file
+    :type file_name: str
+    :rtype: type
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    return STORAGES.get(extension, CsvStorage)
+
+
+def open_storage(file_name, read_only=False):
+    """
+    Returns the Storage for file_name, chosen by its extension
+
+    :param file_name: The name of the file
+    :type file_name: str
+    :param read_only: If True, the file is only read, see Storage
+    :type read_only: bool
+    :rtype: Storage
+    """
+    return storage_class(file_name)(file_name, read_only)
+
+
+def new_task_id():
+    """
+    Returns a new random task id of TASK_ID_BITS bits.
+    The ids are random instead of counted, so the tasks added by several processes at the same time do not get the same id.
+
+    :rtype: str
+    """
+    return format_task_id(int.from_bytes(os.urandom(8), "big") >> (64 - TASK_ID_BITS))
+
+
+def new_generation():
+    """
+    Returns a new random generation, which identifies one write of a file, see JournalStorage._file_version
+
+    :rtype: str
+    """
+    return os.urandom(GENERATION_BYTES).hex()
+
+
+def format_task_id(number):
+    """
+    Returns the task id of number, written in lower case base32
+
+    :param number: A number of TASK_ID_BITS bits
+    :type number: int
+    :rtype: str
+    """
+    # 7 bytes are 12 characters of base32, the first TASK_ID_LENGTH of them are the TASK_ID_BITS bits of number
+    return base64.b32encode((number << (56 - TASK_ID_BITS)).to_bytes(7, "big"))[:TASK_ID_LENGTH].decode("ascii").lower()
+
+
+def legacy_task_ids(version, title, count):
+    """
+    Returns the ids of the count tasks of the note title in a file written before the tasks had ids.
+    They are the same in every process that reads the same version of the file, and the file keeps them once it is written again.
+
+    :param version: The version of the file, see Storage.version
+    :type version: list
+    :param title: The title of the note
+    :type title: str
+    :param count: The number of tasks of the note
+    :type count: int
+    :rtype: list
+    """
+    import hashlib
+
+    digest = hashlib.blake2b(json.dumps([version, title]).encode("utf-8"), digest_size=8).digest()
+    # the ids of a note follow each other, and the first one leaves room for 2**32 tasks below 2**TASK_ID_BITS
+    first = int.from_bytes(digest, "big") >> (64 - TASK_ID_BITS + 1)
+    return [format_task_id(first + i) for i in range(count)]
+
+
+def _add_legacy_ids(rows, version, title):
+    """
+    Adds the ids of legacy_task_ids to the [body, priority, status] rows of a csv file written before the tasks had ids
+
+    :param rows: The rows of the note title, in order
+    :type rows: list
+    :return: True if a row had no id
+    :rtype: bool
+    """
+    if not any(len(row) == 3 for row in rows):
+        return False
+    for row, task_id in zip(rows, legacy_task_ids(version, title, len(rows))):
+        if len(row) == 3:
+            row.append(task_id)
+    return True
+
+
+def _header_generation(row):
+    """
+    Returns the generation in the first row of a csv file written by CsvStorage,
+    "" if the row is CSV_HEADER without a generation, or None if it is not CSV_HEADER
+
+    :param row: The fields of the first row of the file
+    :type row: list
+    :rtype: str or None
+    """
+    if row[:len(CSV_HEADER)] != CSV_HEADER or len(row) > len(CSV_HEADER) + 1:
+        return None
+    return row[len(CSV_HEADER)] if len(row) > len(CSV_HEADER) else ""
+
+
+def _read_head(file, size):
+    """
+    Returns the first size bytes of a file that was opened and not read yet, and leaves it at its beginning
+
+    :param file: A file object in text or binary mode
+    :type file: file object
+    :rtype: bytes
+    """
+    fd = file.fileno()
+    os.lseek(fd, 0, os.SEEK_SET)
+    head = os.read(fd, size)
+    os.lseek(fd, 0, os.SEEK_SET)
+    return head
+
+
+def _sync_directory(directory):
+    """
+    Flushes a directory to the disk, so a file renamed inside it is not lost after a crash.
+    Does nothing on windows, where directories cannot be opened.
+
+    :param directory: The path of the directory
+    :type directory: str
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def _file_lock(file_name):
+    """
+    Holds an advisory lock on file_name, which is created if it does not exist.
+    The processes that take the lock on the same file wait for each other, the others are not blocked.
+
+    :param file_name: The name of the lock file
+    :type file_name: str
+    """
+    with open(file_name, "a+b") as file:
+        if os.name == "nt":
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def _scan_rows(file):
+    """
+    Reads a csv file opened in binary mode in chunks and yields the raw note title and the byte range of each row.
+    A new line inside a quoted field does not end the row.
+
+    :param file: A file object opened in binary mode
+    :type file: file
+    :raise ValueError: If a row does not contain a comma after the note title
+    :return: A generator of tuples (title, start, end), title is in bytes and is still quoted if it was quoted in the file
+    :rtype: generator
+    """
+    buffer = b""
+    # file offset of buffer[0], the rows are read from the current position of file
+    offset = file.tell()
+    # start of the current row in buffer and where to look for its end
+    start = search = 0
+    quotes = 0
+    eof = False
+    while True:
+        end = buffer.find(b"\n", search)
+        if end == -1:
+            if not eof:
+                chunk = file.read(LOAD_CHUNK_SIZE)
+                eof = not chunk
+                buffer = buffer[start:] + chunk
+                offset += start
+                search -= start
+                start = 0
+                continue
+            if not buffer[start:].strip():
+                return
+            # the last row of the file has no new line at the end
+            end = len(buffer)
+        else:
+            quotes += buffer.count(b'"', search, end)
+            if quotes % 2:
+                # the new line is inside a quoted field
+                search = end + 1
+                continue
+            end += 1
+        row = buffer[start:end]
+        yield _raw_title(row, file.name), offset + start, offset + end
+        start = search = end
+        quotes = 0
+
+
+def _raw_title(row, file_name):
+    """
+    Returns the bytes of the first field of a csv row
+
+    :raise ValueError: If the row does not contain a comma after the first field
+    :rtype: bytes
+    """
+    if row.startswith(b'"'):
+        # skip the escaped quotes ("") until the closing quote
+        i = 1
+        while True:
+            i = row.find(b'"', i)
+            if i == -1:
+                raise ValueError(f"{file_name} curropted.")
+            if row[i + 1 : i + 2] != b'"':
+                break
+            i += 2
+        comma = i + 1
+    else:
+        comma = row.find(b",")
+    if row[comma : comma + 1] != b",":
+        raise ValueError(f"{file_name} curropted.")
+    return row[:comma]
+
+
+def _decode_title(raw_title, encoding, file_name):
+    """
+    Returns the note title from the raw title found by _scan_rows
+
+    :raise ValueError: If the title cannot be read
+    :rtype: str
+    """
+    if not raw_title.startswith(b'"'):
+        return raw_title.decode(encoding)
+    try:
+        return next(csv.reader(io.StringIO(raw_title.decode(encoding), newline=None)))[0]
+    except csv.Error:
+        raise ValueError(f"{file_name} curropted.")
+
+
+def _row_loader(file, title, spans, encoding, version, trusted=False):
+    """
+    Returns a function that reads the byte ranges in spans from file and returns the rows of the note title
+
+    :param file: The csv file opened in binary mode
+    :type file: file object
+    :param spans: A list of [start, end] byte ranges in file
+    :type spans: list
+    :param version: The version of file, which gives the ids of the rows without one, see _add_legacy_ids
+    :type version: list
+    :param trusted: True if file starts with CSV_HEADER
+    :type trusted: bool
+    :return: A function with no arguments which returns a list of [body, priority, status, id] rows, TrustedRows if trusted
+    :rtype: function
+    """
+    widths = [5] if trusted else [4, 5]
+
+    def load():
+        rows = TrustedRows() if trusted else []
+        for start, end in spans:
+            file.seek(start)
+            text = file.read(end - start).decode(encoding)
+            # newline=None converts the new lines the same way the eager loader reads them
+            for row in csv.reader(io.StringIO(text, newline=None)):
+                if len(row) not in widths or row[0] != title:
+                    raise ValueError(f"{file.name} curropted.")
+                rows.append(row[1:])
+        if not trusted:
+            _add_legacy_ids(rows, version, title)
+        return rows
+
+    return load
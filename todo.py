@@ -1,11 +1,58 @@
-from colorama import Fore, Back, Style
-from tabulate import tabulate
-import csv
+from collections import OrderedDict, deque
+from itertools import islice
+import threading
+import gc
+import time
+import heapq
+import re
 import os
 
+# import search Library
+from search import SearchIndex
+# the times of the loads and saves are recorded in STATS, see the stats command
+from stats import STATS
+# import storage Library
+# Valid priorities and statuses are PRIORITIES and STATUSES, which the storages share.
+# A task stores the position of its priority and status in these tuples.
+from storage import open_storage, ConcurrentChangeError, Records, TrustedRows, TASK_FIELDS, TASK_ID_LENGTH, PRIORITIES, STATUSES, PRIORITY_CODES, STATUS_CODES
+# Each task has an id that stays the same when other tasks are added or deleted, see new_task_id
+from storage import new_task_id
+
+# Width of the task column in the table of a note. Longer bodies are wrapped into several lines.
+BODY_WIDTH = 120
+# The ANSI codes of colorama.Fore and colorama.Style used by the tables,
+# written here because importing colorama is a large part of the startup time. tabulate is imported on first use for the same reason.
+_CYAN, _GREEN, _YELLOW, _RED, _MAGENTA = "\033[36m", "\033[32m", "\033[33m", "\033[31m", "\033[35m"
+_BRIGHT, _RESET_ALL = "\033[1m", "\033[0m"
+# How a note table shows the header, the priority and the status of the tasks
+_NOTE_HEADERS = [
+    _CYAN + "No" + _RESET_ALL,
+    _CYAN + "Task" + _RESET_ALL,
+    _CYAN + "Priority" + _RESET_ALL,
+    _CYAN + "Status" + _RESET_ALL,
+    _CYAN + "Id" + _RESET_ALL,
+]
+_PRIORITY_FORMAT = (
+    _GREEN + "low" + _RESET_ALL,
+    _YELLOW + "normal" + _RESET_ALL,
+    _RED + "high" + _RESET_ALL,
+)
+_STATUS_FORMAT = ("🗹", "☐")
+
+# Number of commands that undo can take back, the oldest ones are forgotten first
+HISTORY_SIZE = 100
+# Number of changes kept by undo and redo in all, e.g. undoing the delete of a note keeps a change for each of its tasks
+HISTORY_CHANGES = 100_000
+
+# Titles that new_note generates for a note without a title
+_AUTO_TITLE = re.compile(r"new_note_([1-9][0-9]*)")
+
 
 class Task:
-    def __init__(self, body="", priority="normal", status="incomplete"):
+    # there can be millions of tasks, so they do not have a __dict__
+    __slots__ = ("_body", "_priority", "_status", "_cells", "_note", "_id")
+
+    def __init__(self, body="", priority="normal", status="incomplete", task_id=None):
         """
         Creates a new object from the class Task
 
@@ -15,14 +62,22 @@ class Task:
         :type file_name: str
         :param status: A string containing the status of the task
         :type file_name: str
+        :param task_id: The id of the task, a new id if None
+        :type task_id: str or None
         :return: An object of class Task
         :r type: class Task
         """
+        self._cells = None
+        # the note that contains the task, set by Note.new_task
+        self._note = None
+        self._id = new_task_id() if task_id is None else task_id
         self.body = body
         self.priority = priority
         self.status = status
 
     def __str__(self):
+        from tabulate import tabulate
+
         headers = ["Task", "Priority", "Status"]
         # return f"{self.body}\t{self.priority}\t{self.status}"
         return tabulate(
@@ -33,43 +88,255 @@ class Task:
             maxcolwidths=[120, 8, 10],
         )
 
+    def cells(self):
+        """
+        Returns the body, priority and status of the task formatted for the table of a note.
+        The result is kept until the task is changed, so a note only formats the tasks that changed since it was shown.
+
+        :return: A tuple of the wrapped body, the colored priority and the status symbol
+        :rtype: tuple
+        """
+        if self._cells is None:
+            body = self.body
+            # a short ascii body takes one column for each character, so it is already as tabulate would wrap it
+            if not body.isascii() or len(body) > BODY_WIDTH or not body.isprintable() or body != body.strip():
+                body = _wrap_body(body)
+            self._cells = (body, _PRIORITY_FORMAT[self._priority], _STATUS_FORMAT[self._status])
+        return self._cells
+
+    @property
+    def note(self):
+        return self._note
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def body(self):
+        return self._body
+
+    @body.setter
+    def body(self, body):
+        if self._note is not None:
+            if self._note.search is not None:
+                self._note.search.update(self, self.body, body)
+            self._note._changed()
+        self._body = body
+        self._cells = None
+
     @property
     def priority(self):
-        return self._priority
+        return PRIORITIES[self._priority]
 
     @priority.setter
     def priority(self, priority):
-        if priority.lower().strip() in ["low", "normal", "high"]:
-            self._priority = priority.lower().strip()
-        else:
+        code = PRIORITY_CODES.get(priority.lower().strip())
+        if code is None:
             raise ValueError("Invalid Priority. Priority can be low, normal or high")
+        if self._note is not None:
+            if self._note.index is not None:
+                self._note.index.move(self, code, self._status)
+            self._note._changed()
+        self._priority = code
+        self._cells = None
 
     @property
     def status(self):
-        return self._status
+        return STATUSES[self._status]
 
     @status.setter
     def status(self, status):
-        if status.lower().strip() in ["complete", "incomplete"]:
-            self._status = status.lower().strip()
-        else:
+        code = STATUS_CODES.get(status.lower().strip())
+        if code is None:
             raise ValueError("Invalid Status. Status can be complete or incomplete")
+        if self._note is not None:
+            if self._note.index is not None:
+                self._note.index.move(self, self._priority, code)
+            self._note._changed()
+        self._status = code
+        self._cells = None
+
+
+def _wrap_body(body):
+    """
+    Wraps body into lines of BODY_WIDTH columns, the same way tabulate does with maxcolwidths.
+    The wrapper of tabulate counts the columns of each character with wcwidth, e.g. two for a Chinese character.
+
+    :param body: The body of a task
+    :type body: str
+    :return: The lines of body joined by new lines
+    :rtype: str
+    """
+    from tabulate import _CustomTextWrap
+
+    wrapper = _CustomTextWrap(width=BODY_WIDTH)
+    return "\n".join("\n".join(wrapper.wrap(line)) for line in body.splitlines() if line.strip())
+
+
+class TaskView(Task):
+    """
+    A task of a binary workspace, read from the TASK_RECORD at offset in the mapped file.
+    The priority and status codes are read when the task is created, without validation.
+    The body and the id are decoded on first access, so tasks that are never shown or searched do not copy them.
+    """
+
+    __slots__ = ("_buffer", "_offset")
+
+    def __init__(self, buffer, offset, task_id=None):
+        """
+        :param buffer: A memoryview of the mapped file
+        :type buffer: memoryview
+        :param offset: The offset of the TASK_RECORD of the task in buffer
+        :type offset: int
+        :param task_id: The id of the task if its record has none, see storage.legacy_task_ids
+        :type task_id: str or None
+        """
+        self._cells = None
+        self._note = None
+        self._body = None
+        self._id = task_id
+        self._buffer = buffer
+        self._offset = offset
+        _, _, self._priority, self._status = TASK_FIELDS.unpack_from(buffer, offset)
+
+    @Task.body.getter
+    def body(self):
+        if self._body is None:
+            start, length, _, _ = TASK_FIELDS.unpack_from(self._buffer, self._offset)
+            self._body = str(self._buffer[start:start + length], "utf-8")
+            self._release()
+        return self._body
+
+    @property
+    def id(self):
+        if self._id is None:
+            start = self._offset + TASK_FIELDS.size
+            self._id = str(self._buffer[start:start + TASK_ID_LENGTH], "ascii")
+            self._release()
+        return self._id
+
+    def _release(self):
+        """
+        Drops the buffer once the body and the id are read, the buffer stays referenced by the other tasks
+        """
+        if self._body is not None and self._id is not None:
+            self._buffer = None
+
+
+class TaskIndex:
+    """
+    Keeps the tasks of a ToDo in one bucket for each pair of priority and status, so they can be found without going through all the tasks.
+    Each bucket is a dict used as an ordered set of tasks.
+    The buckets are updated by Note.new_task, Note.delete_task and the priority and status setters of Task.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty index
+
+        :return: An object of class TaskIndex
+        :r type: class TaskIndex
+        """
+        # self.buckets[priority][status] has the tasks with the codes priority and status
+        self.buckets = [[{} for _ in STATUSES] for _ in PRIORITIES]
+
+    def add(self, task):
+        self.buckets[task._priority][task._status][task] = None
+
+    def remove(self, task):
+        del self.buckets[task._priority][task._status][task]
+
+    def move(self, task, priority, status):
+        """
+        Moves task to the bucket of priority and status when its priority or status changes, before the task is changed
+
+        :param priority: The new priority code of task
+        :type priority: int
+        :param status: The new status code of task
+        :type status: int
+        """
+        if (priority, status) != (task._priority, task._status):
+            del self.buckets[task._priority][task._status][task]
+            self.buckets[priority][status][task] = None
+
+    def query(self, priority=None, status=None):
+        """
+        Returns the tasks with priority and status, grouped by priority and then by status. A None priority or status matches all the tasks.
+        The time depends on the number of tasks returned, not on the number of all the tasks.
+
+        :param priority: One of PRIORITIES or None
+        :type priority: str or None
+        :param status: One of STATUSES or None
+        :type status: str or None
+        :raise KeyError: If priority or status is not valid
+        :return: A list of objects of class Task
+        :rtype: list
+        """
+        rows = self.buckets if priority is None else [self.buckets[PRIORITY_CODES[priority]]]
+        if status is None:
+            return [task for row in rows for bucket in row for task in bucket]
+        status = STATUS_CODES[status]
+        return [task for row in rows for task in row[status]]
 
 
 class Note:
-    def __init__(self, title=""):
+    __slots__ = ("title", "index", "search", "ids", "dirty", "_tasks", "_loader", "_num_of_tasks", "_positions")
+
+    def __init__(self, title="", loader=None, num_of_tasks=0):
         """
         Creates a new object from the class Note
+        If a loader is passed, the tasks are not created until self.tasks is accessed for the first time.
 
         :param title: A string containing the title of the note
         :type file_name: str
+        :param loader: A function with no arguments that returns the list of tasks of the note
+        :type loader: function or None
+        :param num_of_tasks: Number of tasks that the loader will return
+        :type num_of_tasks: int
         :return: An object of class note
         :r type: class Note
         """
-        self.num_of_tasks = 0
-        self.tasks = []
+        self._tasks = None if loader else []
+        self._loader = loader
+        self._num_of_tasks = num_of_tasks if loader else 0
+        # the position of each task in self.tasks, built by the first self.position and dropped when the tasks move
+        self._positions = None
         self.title = title
+        # the TaskIndex, the SearchIndex and the dict of the tasks by id of the ToDo that contains the note, once the ToDo has built them
+        self.index = None
+        self.search = None
+        self.ids = None
+        # the set of the titles of the notes changed since the last save, shared by the notes of a ToDo, see self._changed
+        self.dirty = None
+
+    @property
+    def tasks(self):
+        if self._tasks is None:
+            # first access to a lazy note, create its tasks
+            start = time.perf_counter()
+            self._tasks = self._loader()
+            self._loader = None
+            STATS.record_load(self.title, time.perf_counter() - start)
+            # the SearchIndex may have the positions of the tasks already, see SearchIndex.add_note
+            search = self.search is None or not self.search.resolve(self, self._tasks)
+            for task in self._tasks:
+                self._attach(task, search)
+        return self._tasks
 
+    @property
+    def num_of_tasks(self):
+        if self._tasks is None:
+            return self._num_of_tasks
+        return len(self._tasks)
+
+    @property
+    def is_loaded(self):
+        return self._tasks is not None
+
+    @property
+    def is_dirty(self):
+        return self.dirty is not None and self.title in self.dirty
 
     def __str__(self):
         """
@@ -78,88 +345,298 @@ class Note:
         :return: Returns a string in the table format from all the tasks inside the Note.
         :rtype: str
         """
-        headers = [
-            Fore.CYAN + "No" + Style.RESET_ALL,
-            Fore.CYAN + "Task" + Style.RESET_ALL,
-            Fore.CYAN + "Priority" + Style.RESET_ALL,
-            Fore.CYAN + "Status" + Style.RESET_ALL,
-        ]
-        status_format = {
-            "complete": "🗹",
-            "incomplete": "☐",
-        }
-        priority_format = {
-            "low": Fore.GREEN + "low" + Style.RESET_ALL,
-            "normal": Fore.YELLOW + "normal" + Style.RESET_ALL,
-            "high": Fore.RED + "high" + Style.RESET_ALL,
-        }
+        return self.render()
+
+    def render(self, start=0, count=None):
+        """
+        Returns a table of count tasks of the note, starting from the task at position start.
+        Only the tasks in the table are formatted.
+
+        :param start: Position of the first task in the table, starting from 0
+        :type start: int
+        :param count: Maximum number of tasks in the table, all the tasks after start if None
+        :type count: int or None
+        :return: Returns a string in the table format from the tasks
+        :rtype: str
+        """
+        from tabulate import tabulate
+
         # print(f"{self.title}")
         if self.num_of_tasks:
+            tasks = self.tasks[start:] if count is None else self.tasks[start : start + count]
+            STATS.count("rows rendered", len(tasks))
             return tabulate(
-                [
-                    [i, task.body, priority_format[task.priority], status_format[task.status]]
-                    for i, task in enumerate(self.tasks, start=1)
-                ],
-                headers,
+                [[i, *task.cells(), task.id] for i, task in enumerate(tasks, start=start + 1)],
+                _NOTE_HEADERS,
                 tablefmt="mixed_grid",
-                colalign=("left", "left", "center", "center"),
-                maxcolwidths=[5, 120, 8, 10],
+                colalign=("left", "left", "center", "center", "left"),
+                maxcolwidths=[5, None, None, None, None],
             )
         else:
             return tabulate(
-                [headers],
+                [_NOTE_HEADERS],
                 tablefmt="mixed_grid",
-                colalign=("left", "left", "center", "center"),
-                maxcolwidths=[5, 120, 8, 10],
+                colalign=("left", "left", "center", "center", "left"),
+                maxcolwidths=[5, 120, 8, 10, TASK_ID_LENGTH],
             )
 
-    def new_task(self, task):
+    def position(self, task):
+        """
+        Returns the position of task in self.tasks in O(1), e.g. to change a task found by its id.
+        The first call after the tasks moved finds the positions of all the tasks in one pass.
+
+        :param task: An object of class Task of the note
+        :type task: Task
+        :raise ValueError: If task is not in the note
+        :return: The position of task, starting from 0
+        :rtype: int
+        """
+        if self._positions is None:
+            self._positions = {task: position for position, task in enumerate(self.tasks)}
+        try:
+            return self._positions[task]
+        except KeyError:
+            raise ValueError(f"The task is not in the note {self.title}") from None
+
+    def new_task(self, task, position=None):
         """
         Creates a new task inside the the current instance of the Note.
         Increases the self.num_of_notes by 1
 
         :param task: An object of the class Task
         :type task: Class Task
+        :param position: The position of the task in self.tasks, starting from 0, or None to add it after the other tasks
+        :type position: int or None
         """
-        self.tasks.append(task)
-        self.num_of_tasks = len(self.tasks)
+        if position is None:
+            self.tasks.append(task)
+            if self._positions is not None:
+                self._positions[task] = len(self._tasks) - 1
+        else:
+            self.tasks.insert(position, task)
+            self._positions = None
+        self._attach(task)
+        self._changed()
+
+    def delete_task(self, position):
+        """
+        Deletes the task at position from the note
+
+        :param position: The position of the task in self.tasks, starting from 0
+        :type position: int
+        :raise IndexError: If there is no task at position
+        :return: The deleted task
+        :rtype: Task
+        """
+        task = self.tasks.pop(position)
+        self._positions = None
+        self._detach(task)
+        self._changed()
+        return task
+
+    def delete_tasks(self, positions):
+        """
+        Deletes the tasks at positions from the note.
+        The tasks after the first position are moved once, instead of once for each deleted task like delete_task.
+
+        :param positions: The positions of the tasks in self.tasks, starting from 0, in increasing order without repeats
+        :type positions: list
+        :return: The deleted tasks
+        :rtype: list
+        """
+        tasks = self.tasks
+        deleted = [tasks[position] for position in positions]
+        if deleted:
+            first = positions[0]
+            positions = set(positions)
+            tasks[first:] = [task for position, task in enumerate(tasks[first:], start=first) if position not in positions]
+            self._positions = None
+        for task in deleted:
+            self._detach(task)
+        if deleted:
+            self._changed()
+        return deleted
+
+    def insert_tasks(self, positions, tasks):
+        """
+        Inserts tasks at positions, e.g. to put back the tasks deleted by delete_tasks.
+        The tasks after the first position are moved once, instead of once for each inserted task like new_task.
+
+        :param positions: The positions of the tasks in self.tasks after they are inserted, in increasing order without repeats
+        :type positions: list
+        :param tasks: The objects of class Task to insert, one for each position
+        :type tasks: list
+        :raise IndexError: If a position is after the end of the note
+        """
+        old = self.tasks
+        if not positions:
+            return
+        if positions[-1] >= len(old) + len(tasks):
+            raise IndexError(f"There is no task at position {positions[-1]}")
+        first = positions[0]
+        rest = iter(old[first:])
+        merged = []
+        position = first
+        for task_position, task in zip(positions, tasks):
+            merged.extend(islice(rest, task_position - position))
+            merged.append(task)
+            position = task_position + 1
+        merged.extend(rest)
+        old[first:] = merged
+        self._positions = None
+        for task in tasks:
+            self._attach(task)
+        self._changed()
+
+    def _attach(self, task, search=True):
+        """
+        Sets the note of task and adds it to the indexes of the note, to the SearchIndex only if search is True
+        """
+        task._note = self
+        if self.index is not None:
+            self.index.add(task)
+        if self.search is not None and search:
+            self.search.add(task)
+        if self.ids is not None:
+            self.ids[task.id] = task
+
+    def _detach(self, task):
+        """
+        Removes task from the indexes of the note and clears its note
+        """
+        if self.index is not None:
+            self.index.remove(task)
+        if self.search is not None:
+            self.search.remove(task)
+        if self.ids is not None:
+            del self.ids[task.id]
+        task._note = None
+
+    def _changed(self):
+        """
+        Marks the note as changed since the last save, it is called by the changes of the note and of its tasks
+        """
+        if self.dirty is not None:
+            self.dirty.add(self.title)
 
 class ToDo:
-    def __init__(self, file_name):
+    def __init__(self, file_name, lazy=False, read_only=False):
         """
         Creates a new file or read the existing file (file_name) and initiate the engine for use of the ToDo class
         The object created loads all the notes and tasks from the file_name (or return an empty object is file_name do not exists)
+        If lazy is True, the file is only indexed at start and the tasks of each note are read when the note is accessed.
+        The format of the file is chosen by its extension, see storage.open_storage: a csv file, or an SQLite database for .db, .sqlite and .sqlite3.
+        Several processes can open the same file, each save merges the changes saved by the others, see self._merge.
+        If read_only is True, the file and its journal are only read, e.g. to count the tasks of a workspace that other processes use,
+        and save raises PermissionError.
 
         :param file_name: a string contain the file name to load or create a new file if does file_name does not exists
         :type file_name: str
-        :raise ValueError: If the existing file_name does not follows the required csv format for this applications
+        :param lazy: If True, loads the tasks of each note on first access instead of loading all of them at start
+        :type lazy: bool
+        :param read_only: If True, never writes the file or the files next to it
+        :type read_only: bool
+        :raise ValueError: If the existing file_name does not follows the required format for this applications
+        :raise FileNotFoundError: If read_only is True and file_name does not exist
         :return: An object of class ToDo. It contains all the notes an tasks that are saved in the file file_name
         :r type: class ToDo
         """
+        start = time.perf_counter()
         self.file_name = file_name
-        self.notes = {}
-        if os.path.isfile(file_name):
-            with open(file_name) as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    if len(row) != 4:
-                        raise ValueError(f"{file_name} curropted.")
-                    else:
-                        if row[0] in self.notes:
-                            # check if a note with title in row[0] already exists in self.notes, if so add the current task in the row to it.
-                            self.notes[row[0]].new_task(Task(row[1], row[2], row[3]))
-                        else:
-                            # note with title in row[0] does not exists in self.notes . We create a new Note with title row[0] and then add the current task to it.
-                            self.notes[row[0]] = Note(row[0])
-                            self.notes[row[0]].new_task(Task(row[1], row[2], row[3]))
+        self.lazy = lazy
+        self.storage = open_storage(file_name, read_only)
+        # the titles of the notes changed since the last save, by the changes of the engine or by the attributes of their tasks
+        self._dirty = set()
+        self._load_notes()
 
-        else:
-            file = open(file_name, "a")
-            file.close()
+        # changes that are not written to the file yet, see self._change
+        self.changes = []
+        # number of changes applied since the workspace was loaded, it only grows
+        self.mutations = 0
+        # number of tasks of each note changed since the last save, when it was first changed (None if it did not exist), see self._merge
+        self._touched = {}
+        # (changes, inverse changes) of the commands that undo and redo can take back or do again, see self._remember
+        self._undo = deque()
+        self._redo = []
+        self._history_size = 0
+        # TaskIndex of all the tasks, built by the first query
+        self._index = None
+        # SearchIndex of all the tasks, built by the first search or read from the file search_name
+        self._search = None
+        # the tasks of all the notes by id, built by the first find_task
+        self._ids = None
+        self.search_name = file_name + ".search"
+        if not lazy:
+            # the notes are loaded anyway, and are still as self.storage loaded them
+            self._load_search(lambda note: True)
+        # new_note generates the title new_note_{i} with the smallest free i:
+        # every free i below self._next_auto is in the heap self._free_auto
+        self._next_auto = 1
+        self._free_auto = []
+        self._save_thread = None
+        self._save_error = None
+        # False if the last background save did not write its changes because another process saved meanwhile, see wait_for_save
+        self._save_written = True
+        self._replay_journal()
 
+        # number of tasks shown in each page of the current note, all of them if None
+        self.page_size = None
+        self.page = 1
         self.num_of_notes = len(self.notes)
-        self.current_note = list(self.notes.keys())[0] if self.num_of_notes else None
-        self.is_saved = True
+        self.current_note = next(iter(self.notes), None)
+        STATS.record("load workspace", time.perf_counter() - start)
+
+    def _load_notes(self):
+        '''
+        Creates self.notes from the notes that self.storage loads
+        '''
+        # an OrderedDict finds its first note in O(1) even after many notes are deleted
+        self.notes = OrderedDict()
+        for title, num_of_tasks, load in self.storage.load(self.lazy):
+            self.notes[title] = Note(title, _task_loader(load), num_of_tasks)
+            self.notes[title].dirty = self._dirty
+            if not self.lazy:
+                # the rows are already read, create the tasks now like before lazy loading
+                self.notes[title].tasks
+        # the version of self.storage that the notes that are not loaded yet belong to
+        self._notes_version = self.storage.version()
+
+    @property
+    def current_note(self):
+        return self._current_note
+
+    @property
+    def is_saved(self):
+        '''
+        True if nothing changed since the last save, e.g. switching the current note or the page is not a change.
+        A background save that is still running counts as saved, its error is raised by wait_for_save.
+
+        :rtype: bool
+        '''
+        return not self.changes and not self._dirty
+
+    def dirty_notes(self):
+        '''
+        Returns the titles of the notes changed since the last save, including the deleted notes
+
+        :rtype: set
+        '''
+        return set(self._dirty)
+
+    @current_note.setter
+    def current_note(self, title):
+        # a note is always shown from its first page
+        self._current_note = title
+        self.page = 1
+
+    @property
+    def num_of_pages(self):
+        """
+        Number of pages of the current note, at least 1
+        """
+        if self.current_note is None or self.page_size is None:
+            return 1
+        return max(1, -(-self.notes[self.current_note].num_of_tasks // self.page_size))
 
     def __str__(self):
         """
@@ -168,14 +645,25 @@ class ToDo:
         :return: Returns a string in the table format from all note title inside the ToDo object and all the the tasks inside the self.current_note
         :rtype: str
         """
+        from tabulate import tabulate
+
         if self.num_of_notes:
             # tabulate note titles and distinguish current Note with color MAGENTA
             tabs = [
-                Fore.MAGENTA + Style.BRIGHT + title + Style.RESET_ALL if self.current_note == title else title
-                for title in self.notes.keys()
+                _MAGENTA + _BRIGHT + title + _RESET_ALL if self.current_note == title else title
+                for title in self.notes
             ]
 
-            return tabulate([tabs], tablefmt="simple_grid") + "\n" + str(self.notes[self.current_note])
+            note = self.notes[self.current_note]
+            if self.page_size is None:
+                return tabulate([tabs], tablefmt="simple_grid") + "\n" + str(note)
+
+            # only the tasks in the current page are formatted
+            page = min(self.page, self.num_of_pages)
+            table = note.render((page - 1) * self.page_size, self.page_size)
+            if self.num_of_pages > 1:
+                table += f"\nPage {page} of {self.num_of_pages}. To show another page, use: page [page_number|next|prev]"
+            return tabulate([tabs], tablefmt="simple_grid") + "\n" + table
 
         else:
             # There are no notes in the ToDo engine.
@@ -190,23 +678,32 @@ class ToDo:
         :param title: A string containing the title of the new note
         :type title: str
         '''
-        if title in self.notes.keys():
+        if title in self.notes:
             self.current_note = title
         else:
             if not title:
                 # if title is empty, creates a generic name for it
-                i = 1
-                while True:
-                    if f"new_note_{i}" in self.notes.keys():
-                        i += 1
-                    else:
-                        title = f"new_note_{i}"
-                        break
+                title = self._auto_title()
 
-            self.notes[title] = Note(title)
-            self.num_of_notes = len(self.notes)
+            self._change(["note", title])
             self.current_note = title
 
+    def _auto_title(self):
+        '''
+        Returns the title new_note_{i} with the smallest i that is not the title of a note
+
+        :rtype: str
+        '''
+        while self._free_auto:
+            # a number freed by a deleted note may be taken again by a note created with that title
+            title = f"new_note_{heapq.heappop(self._free_auto)}"
+            if title not in self.notes:
+                return title
+        while f"new_note_{self._next_auto}" in self.notes:
+            self._next_auto += 1
+        self._next_auto += 1
+        return f"new_note_{self._next_auto - 1}"
+
     def new_task(self, **kwargs):
         '''
         Creates a new task for the self.notes[self.current_note]
@@ -214,16 +711,935 @@ class ToDo:
         :param **kwargs: Named parametes with names body, priority and status
         :type **kwargs: str
         '''
-        self.notes[self.current_note].new_task(Task(**kwargs))
+        task_id = new_task_id()
+        while self._ids is not None and task_id in self._ids:
+            task_id = new_task_id()
+        task = Task(**kwargs, task_id=task_id)
+        self._change(["newtask", self.current_note, task.body, task.priority, task.status, "", task.id])
+
+    def edit_task(self, task_number, field, value):
+        '''
+        Changes the body, priority or status of the task number task_number of self.notes[self.current_note]
+
+        :param task_number: The number of the task, starting from 1
+        :type task_number: int
+        :param field: One of body, priority or status
+        :type field: str
+        :param value: The new value of the field
+        :type value: str
+        :raise IndexError: If there is no task with number task_number
+        :raise ValueError: If value is not a valid value for field
+        '''
+        self._change(["task", self.current_note, self._task_index(task_number), field, value])
+
+    def delete_task(self, task_number):
+        '''
+        Deletes the task number task_number of self.notes[self.current_note]
+
+        :param task_number: The number of the task, starting from 1
+        :type task_number: int
+        :raise IndexError: If there is no task with number task_number
+        '''
+        self._change(["delete task", self.current_note, self._task_index(task_number)])
+
+    def edit_tasks(self, task_numbers, field, value):
+        '''
+        Changes the body, priority or status of the tasks with task_numbers of self.notes[self.current_note].
+        undo takes them back as one command.
+
+        :param task_numbers: The numbers of the tasks, starting from 1
+        :type task_numbers: iterable
+        :param field: One of body, priority or status
+        :type field: str
+        :param value: The new value of the field
+        :type value: str
+        :raise IndexError: If there is no task with one of task_numbers, then no task is changed
+        :raise ValueError: If value is not a valid value for field, then no task is changed
+        '''
+        positions = sorted({self._task_index(task_number) for task_number in task_numbers})
+        self._changes([["task", self.current_note, position, field, value] for position in positions])
+
+    def delete_tasks(self, task_numbers):
+        '''
+        Deletes the tasks with task_numbers of self.notes[self.current_note] with one change,
+        which removes them from the note in one pass, see Note.delete_tasks
+
+        :param task_numbers: The numbers of the tasks, starting from 1
+        :type task_numbers: iterable
+        :raise IndexError: If there is no task with one of task_numbers, then no task is deleted
+        '''
+        positions = sorted({self._task_index(task_number) for task_number in task_numbers})
+        if positions:
+            self._change(["delete tasks", self.current_note, *positions])
+
+    def edit_tasks_by_id(self, task_ids, field, value):
+        '''
+        Changes the body, priority or status of the tasks with task_ids, which can be in any note.
+        undo takes them back as one command.
+
+        :param task_ids: The ids of the tasks
+        :type task_ids: iterable
+        :param field: One of body, priority or status
+        :type field: str
+        :param value: The new value of the field
+        :type value: str
+        :raise KeyError: If there is no task with one of task_ids, then no task is changed
+        :raise ValueError: If value is not a valid value for field, then no task is changed
+        '''
+        self._changes([
+            ["task", title, position, field, value]
+            for title, positions in self._locate(task_ids).items()
+            for position in positions
+        ])
 
+    def delete_tasks_by_id(self, task_ids):
+        '''
+        Deletes the tasks with task_ids, which can be in any note, with one change for each note, see self.delete_tasks
+
+        :param task_ids: The ids of the tasks
+        :type task_ids: iterable
+        :raise KeyError: If there is no task with one of task_ids, then no task is deleted
+        '''
+        self._changes([["delete tasks", title, *positions] for title, positions in self._locate(task_ids).items()])
+
+    def delete_note(self, title):
+        '''
+        Deletes the note with title from self.notes
+        If it was the current note, the first note becomes the current note
+
+        :param title: The title of the note
+        :type title: str
+        :raise KeyError: If there is no note with title
+        '''
+        if title not in self.notes:
+            raise KeyError(title)
+        self._change(["delete note", title])
+        if self.num_of_notes:
+            if self.current_note == title:
+                # if we are deleteing the current_note, then the current_note should be changed, we set it to the first note
+                self.current_note = next(iter(self.notes))
+        else:
+            self.current_note = None
+
+    def query(self, priority=None, status=None):
+        '''
+        Returns the tasks of all the notes with priority and status. A None priority or status matches all the tasks.
+        The first query loads all the notes and builds an index, which the next changes keep up to date.
+
+        :param priority: One of PRIORITIES or None
+        :type priority: str or None
+        :param status: One of STATUSES or None
+        :type status: str or None
+        :raise ValueError: If priority or status is not valid
+        :return: A list of objects of class Task, the note of a task is task.note
+        :rtype: list
+        '''
+        if priority is not None and priority not in PRIORITY_CODES:
+            raise ValueError("Invalid Priority. Priority can be low, normal or high")
+        if status is not None and status not in STATUS_CODES:
+            raise ValueError("Invalid Status. Status can be complete or incomplete")
+        if self._index is None:
+            self._index = TaskIndex()
+            for note in self.notes.values():
+                for task in note.tasks:
+                    self._index.add(task)
+                note.index = self._index
+        return self._index.query(priority, status)
 
-    def save(self):
+    def search(self, query):
         '''
-        Saves all the tasks of all the notes in self.notes inside the file self.file_name with csv format.
+        Returns the tasks of all the notes whose body matches query, see SearchIndex.search for the format of query.
+        The first search loads all the notes and builds an index, which the next changes keep up to date.
+        compact writes the index to the file self.search_name, so it is read instead of built when the workspace is loaded again,
+        and a lazy workspace only loads the notes that a search matches.
 
+        :param query: A string with the words to search
+        :type query: str
+        :return: A list of objects of class Task, the note of a task is task.note
+        :rtype: list
         '''
-        with open(self.file_name, "w", newline="") as file:
-            writer = csv.writer(file)
+        if self._search is None:
+            # the notes loaded since the workspace was loaded may have changed
+            self._load_search(lambda note: not note.is_loaded)
+        if self._search is None:
+            self._search = SearchIndex()
             for note in self.notes.values():
                 for task in note.tasks:
-                    writer.writerow([note.title, task.body, task.priority, task.status])
+                    self._search.add(task)
+                note.search = self._search
+        return self._search.search(query)
+
+    def find_task(self, task_id):
+        '''
+        Returns the task with task_id, in any note.
+        The first call loads all the notes and builds a dict of the tasks by id, which the next changes keep up to date,
+        so a task is found by its id in O(1), however many tasks there are.
+
+        :param task_id: The id of the task, e.g. "k5qzj2x7ma"
+        :type task_id: str
+        :raise KeyError: If there is no task with task_id
+        :return: An object of class Task, the note of the task is task.note
+        :rtype: Task
+        '''
+        if self._ids is None:
+            self._ids = {}
+            for note in self.notes.values():
+                for task in note.tasks:
+                    self._ids[task.id] = task
+                note.ids = self._ids
+        return self._ids[task_id]
+
+    def _load_search(self, unchanged):
+        '''
+        Creates self._search from the SearchIndex written by compact, if it was written for the version of self.storage the notes were loaded from.
+        The tasks of the notes for which unchanged(note) is True are added from their saved positions, without loading the notes,
+        the other notes are loaded and their tasks are added from their bodies.
+        self._search stays None if there is no such index.
+
+        :param unchanged: A function that returns True if a note is still as self.storage loaded it
+        :type unchanged: function
+        '''
+        if not os.path.isfile(self.search_name):
+            return
+        saved = SearchIndex.read(self.search_name, self._notes_version)
+        if saved is None:
+            return
+        search = SearchIndex()
+        try:
+            for note in self.notes.values():
+                if unchanged(note):
+                    # a note without tokens has no postings
+                    search.add_note(note, saved.get(note.title, {}))
+                else:
+                    for task in note.tasks:
+                        search.add(task)
+        except (IndexError, ValueError, TypeError, AttributeError):
+            return
+        self._search = search
+        for note in self.notes.values():
+            note.search = search
+
+    def _task_index(self, task_number):
+        '''
+        Returns the position of the task number task_number in self.notes[self.current_note].tasks
+
+        :raise IndexError: If there is no task with number task_number
+        :rtype: int
+        '''
+        if self.current_note is None or not 1 <= task_number <= self.notes[self.current_note].num_of_tasks:
+            raise IndexError(f"There is no task number {task_number}")
+        return task_number - 1
+
+    def _locate(self, task_ids):
+        '''
+        Returns the positions of the tasks with task_ids, found by self.find_task, grouped by the title of their note.
+        The positions are found by Note.position, so changing tasks by id does not go through their notes.
+
+        :raise KeyError: If there is no task with one of task_ids
+        :return: A dict from the title of each note to the positions of its tasks, in increasing order
+        :rtype: dict
+        '''
+        positions = {}
+        for task_id in task_ids:
+            task = self.find_task(task_id)
+            positions.setdefault(task.note, set()).add(task.note.position(task))
+        return {note.title: sorted(chosen) for note, chosen in positions.items()}
+
+    def _change(self, change, history=True):
+        '''
+        Applies a change to the notes and keeps it in self.changes to be written to the journal on the next save.
+        If history is True, the change can be taken back by self.undo.
+
+        :param change: A list in one of the formats accepted by self._apply
+        :type change: list
+        :param history: False for the changes made by undo and redo themselves
+        :type history: bool
+        '''
+        self._changes([change], history)
+
+    def _changes(self, changes, history=True):
+        '''
+        Applies the changes of one command in order, see self._change. undo takes them back together.
+        If a change fails, the changes before it stay applied and can be taken back.
+
+        :param changes: A list of changes in the formats accepted by self._apply
+        :type changes: list
+        :param history: False for the changes made by undo and redo themselves
+        :type history: bool
+        '''
+        applied = []
+        inverses = []
+        try:
+            for change in changes:
+                title = change[1]
+                if title not in self._touched:
+                    self._touched[title] = self.notes[title].num_of_tasks if title in self.notes else None
+                if history:
+                    inverses.append(self._inverse(change))
+                self._apply(change)
+                self.changes.append(change)
+                self.mutations += 1
+                applied.append(change)
+        finally:
+            if history and applied:
+                # the last change is taken back first
+                self._remember(applied, [inverse for step in reversed(inverses[: len(applied)]) for inverse in step])
+
+    def _inverse(self, change):
+        '''
+        Returns the changes that take back change, before change is applied.
+        Only the tasks that change touches are copied, e.g. a deleted task is put back at its position by newtask.
+        A deleted note is created again after the other notes.
+
+        :param change: A list in one of the formats accepted by self._apply
+        :type change: list
+        :raise KeyError: If there is no note with title
+        :raise IndexError: If there is no task at position index
+        :rtype: list
+        '''
+        action, title, *args = change
+        if action == "note":
+            return [["delete note", title]]
+        if action == "newtask":
+            if title not in self.notes:
+                return [["delete note", title]]
+            position = self.notes[title].num_of_tasks if len(args) < 4 or args[3] == "" else int(args[3])
+            return [["delete task", title, position]]
+        if action == "task" and len(args) == 3 and args[1] in ["body", "priority", "status"]:
+            tasks = self.notes[title].tasks
+            position = _position(args[0], tasks)
+            return [["task", title, position, args[1], getattr(tasks[position], args[1])]]
+        if action == "delete task":
+            tasks = self.notes[title].tasks
+            position = _position(args[0], tasks)
+            task = tasks[position]
+            return [["newtask", title, task.body, task.priority, task.status, position, task.id]]
+        if action == "delete tasks":
+            tasks = self.notes[title].tasks
+            inverse = ["insert tasks", title]
+            for position in sorted({_position(index, tasks) for index in args}):
+                task = tasks[position]
+                inverse += [position, task.body, task.priority, task.status, task.id]
+            return [inverse]
+        if action == "insert tasks":
+            return [["delete tasks", title, *args[::5]]]
+        if action == "delete note":
+            return [["note", title]] + [
+                ["newtask", title, task.body, task.priority, task.status, "", task.id] for task in self.notes[title].tasks
+            ]
+        # an invalid change, self._apply raises the error
+        return []
+
+    def _remember(self, changes, inverse):
+        '''
+        Adds the changes of a command and their inverse to the history of undo, and forgets the commands that redo could do again.
+        The oldest commands are forgotten when there are more than HISTORY_SIZE,
+        or when the history keeps more than HISTORY_CHANGES changes.
+        '''
+        self._history_size -= sum(len(step[0]) + len(step[1]) for step in self._redo)
+        self._redo.clear()
+        self._undo.append((changes, inverse))
+        self._history_size += len(changes) + len(inverse)
+        while len(self._undo) > 1 and (len(self._undo) > HISTORY_SIZE or self._history_size > HISTORY_CHANGES):
+            changes, inverse = self._undo.popleft()
+            self._history_size -= len(changes) + len(inverse)
+
+    def _forget(self, titles=None):
+        '''
+        Forgets the commands of undo and redo that changed the notes with titles, or all of them if titles is None,
+        e.g. when other processes changed these notes, so the positions in the history are not valid anymore.
+        '''
+        if titles is None:
+            self._undo.clear()
+            self._redo.clear()
+        else:
+            self._undo = deque(step for step in self._undo if not any(change[1] in titles for change in step[0]))
+            self._redo = [step for step in self._redo if not any(change[1] in titles for change in step[0])]
+        self._history_size = sum(len(step[0]) + len(step[1]) for steps in (self._undo, self._redo) for step in steps)
+
+    def undo(self):
+        '''
+        Takes back the last command that changed the notes, e.g. a deleted note comes back with all its tasks.
+        Undo is saved like any other change, and the note that it changes becomes the current note.
+
+        :raise IndexError: If there is no command to undo
+        '''
+        if not self._undo:
+            raise IndexError("There is nothing to undo")
+        changes, inverse = self._undo.pop()
+        for change in inverse:
+            self._change(change, history=False)
+        self._redo.append((changes, inverse))
+        self._show_change(changes[0][1])
+
+    def redo(self):
+        '''
+        Does again the last command taken back by undo, if no other command changed the notes since then
+
+        :raise IndexError: If there is no command to redo
+        '''
+        if not self._redo:
+            raise IndexError("There is nothing to redo")
+        changes, inverse = self._redo.pop()
+        for change in changes:
+            self._change(change, history=False)
+        self._undo.append((changes, inverse))
+        self._show_change(changes[0][1])
+
+    def _show_change(self, title):
+        '''
+        Makes the note with title the current note after undo or redo, or the first note if it does not exist anymore
+        '''
+        if title in self.notes:
+            self.current_note = title
+        elif self.current_note not in self.notes:
+            self.current_note = next(iter(self.notes), None)
+
+    def _apply(self, change):
+        '''
+        Applies a change to the notes. A change is a list in one of these formats:
+            ["note", title]
+            ["newtask", title, body, priority, status, index, id] to insert the task at index, or after the other tasks if index is ""
+            ["task", title, index, field, value] where field is body, priority or status
+            ["delete task", title, index]
+            ["delete tasks", title, index, index, ...] to delete several tasks at once, the indexes are their positions before the change
+            ["insert tasks", title, index, body, priority, status, id, index, body, ...] to insert several tasks at once,
+                the indexes are their positions after the change, in increasing order
+            ["delete note", title]
+        index is the position of the task in the tasks of the note, starting from 0.
+        The changes saved before the tasks had ids are also accepted: ["newtask", title, body, priority, status]
+        and ["newtask", title, body, priority, status, index], the task gets a new id.
+
+        :param change: A list in one of the formats above, the values can be str as read from the journal
+        :type change: list
+        :raise ValueError: If the change is not in a valid format
+        :raise KeyError: If there is no note with title
+        :raise IndexError: If there is no task at position index
+        '''
+        action, title, *args = change
+        if action == "note" and not args:
+            self.notes[title] = Note(title)
+            self.notes[title].index = self._index
+            self.notes[title].search = self._search
+            self.notes[title].ids = self._ids
+            self.notes[title].dirty = self._dirty
+            self._dirty.add(title)
+        elif action == "newtask" and len(args) in [3, 4, 5]:
+            if title not in self.notes:
+                # compact drops empty notes, which have no rows in the csv file, so the note is created again like the loader does
+                self._apply(["note", title])
+            note = self.notes[title]
+            position = None if len(args) == 3 or args[3] == "" else _position(args[3], range(note.num_of_tasks + 1))
+            note.new_task(Task(*args[:3], *args[4:]), position)
+        elif action == "task" and len(args) == 3 and args[1] in ["body", "priority", "status"]:
+            tasks = self.notes[title].tasks
+            setattr(tasks[_position(args[0], tasks)], args[1], args[2])
+        elif action == "delete task" and len(args) == 1:
+            note = self.notes[title]
+            note.delete_task(_position(args[0], note.tasks))
+        elif action == "delete tasks" and args:
+            note = self.notes[title]
+            note.delete_tasks(sorted({_position(index, note.tasks) for index in args}))
+        elif action == "insert tasks" and args and len(args) % 5 == 0:
+            positions = [int(index) for index in args[::5]]
+            if any(position < 0 for position in positions) or any(a >= b for a, b in zip(positions, positions[1:])):
+                raise ValueError(f"Invalid change {change}")
+            tasks = [Task(*args[i + 1 : i + 5]) for i in range(0, len(args), 5)]
+            self.notes[title].insert_tasks(positions, tasks)
+        elif action == "delete note" and not args:
+            note = self.notes.pop(title)
+            if note.is_loaded:
+                for task in note.tasks:
+                    note._detach(task)
+            elif note.search is not None:
+                note.search.discard(note)
+            if (match := _AUTO_TITLE.fullmatch(title)) and int(match.group(1)) < self._next_auto:
+                heapq.heappush(self._free_auto, int(match.group(1)))
+            self._dirty.add(title)
+        else:
+            raise ValueError(f"Invalid change {change}")
+        self.num_of_notes = len(self.notes)
+
+    def _replay_journal(self):
+        '''
+        Applies the saved changes that self.storage.load does not include yet, e.g. the journal of a csv file.
+        An incomplete last change, left by a save that was interrupted, is ignored.
+
+        :raise ValueError: If the changes are curropted
+        '''
+        changes = self.storage.changes()
+        if changes is None:
+            # other processes rewrote the file twice while it was loaded, load it again
+            self._load_notes()
+            self._search = None
+            self._replay_journal()
+            return
+        for i, change in enumerate(changes, start=1):
+            try:
+                self._apply(change)
+            except (ValueError, KeyError, IndexError):
+                if i == len(changes):
+                    break
+                raise ValueError(f"{self.file_name} changes curropted.")
+        # the notes are as they are saved
+        self._dirty.clear()
+        if self.storage.legacy_ids:
+            # the ids given to the tasks without one change with the version of the file, so the next save writes them with compact
+            self._dirty.update(self.notes)
+
+    def save(self, background=False):
+        '''
+        Saves the changes since the last save, and does not write anything if self.is_saved.
+        The changes are appended to self.storage, e.g. to the journal of a csv file, so the cost of save depends on the number of changes.
+        When the journal becomes large compared to the csv file, it is folded into the file with self.compact.
+        The changes saved by other processes since the last save are merged first, see self._merge.
+        If background is True, the file is written by a thread and save returns immediately. Only one save runs at a time.
+        If another process saves while the thread writes, the changes are kept and the next save merges and writes them, see wait_for_save.
+
+        :param background: If True, writes the file in a background thread
+        :type background: bool
+        :raise OSError: If the file cannot be written, or the previous background save failed
+        '''
+        self.wait_for_save()
+        if self.is_saved:
+            # nothing to write, only the changes saved by other processes are read
+            self._merge()
+            return
+        while True:
+            self._merge()
+            # a note changed by the attributes of its tasks, and not by the methods of ToDo, has no changes to append
+            if self.storage.needs_compact() or self._dirty - self._touched.keys():
+                self.compact(background)
+                return
+            if not self.changes:
+                return
+
+            changes = self.changes
+            self.changes = []
+            try:
+                self._write(self.storage.append, changes, background=background)
+                return
+            except ConcurrentChangeError:
+                # another process saved between the merge and the write, merge its changes too
+                continue
+
+    def compact(self, background=False):
+        '''
+        Saves all the tasks of all the notes in self.notes inside the file self.file_name, replacing its content, see Storage.write_all.
+        A csv file is written to a temporary file, which replaces self.file_name after it is flushed to the disk,
+        so self.file_name is never left half written.
+
+        :param background: If True, writes the file in a background thread
+        :type background: bool
+        :raise OSError: If the file cannot be written, or the previous background save failed
+        '''
+        self.wait_for_save()
+        while True:
+            self._merge()
+            # the rows are copied here, so the notes can be changed while a background thread writes them
+            notes = self._snapshot()
+            search_postings = None
+            if self._search is not None:
+                positions = {task: i for note in self.notes.values() for i, task in enumerate(note.tasks)}
+                search_postings = self._search.to_positions(positions)
+            changes = self.changes
+            self.changes = []
+            try:
+                self._write(self._write_all, notes, search_postings, changes, background=background)
+                return
+            except ConcurrentChangeError:
+                continue
+
+    def wait_for_save(self):
+        '''
+        Waits until the background save, if any, is finished
+
+        :raise OSError: If the background save failed
+        :return: False if another process saved while the background save was writing, its changes are written by the next save then
+        :rtype: bool
+        '''
+        if self._save_thread is not None:
+            self._save_thread.join()
+            self._save_thread = None
+        if self._save_error is not None:
+            error, self._save_error = self._save_error, None
+            raise error
+        written, self._save_written = self._save_written, True
+        return written
+
+    def _write(self, write, *args, background=False):
+        '''
+        Calls write(*args) in a background thread if background is True, otherwise calls it directly.
+        If write fails, the changes that it was saving are kept in self.changes for the next save.
+        The time of write and the bytes it writes to self.storage are recorded in STATS.
+        '''
+        # the changes made from now on are counted from this save
+        touched, self._touched = self._touched, {}
+        dirty = set(self._dirty)
+        self._dirty.clear()
+
+        def run():
+            start = time.perf_counter()
+            bytes_written = self.storage.bytes_written
+            try:
+                write(*args)
+            except OSError as e:
+                # args[-1] is always the list of changes being saved
+                self.changes[:0] = args[-1]
+                # they are still counted from the previous save
+                for title, num_of_tasks in touched.items():
+                    self._touched[title] = num_of_tasks
+                self._dirty.update(dirty)
+                if not background:
+                    raise
+                if isinstance(e, ConcurrentChangeError):
+                    # not an error: the next save merges the changes of the other process and writes these again
+                    self._save_written = False
+                else:
+                    self._save_error = e
+            else:
+                STATS.record_save(self.storage.bytes_written - bytes_written, time.perf_counter() - start)
+
+        if background:
+            self._save_thread = threading.Thread(target=run)
+            self._save_thread.start()
+        else:
+            run()
+
+    def _merge(self):
+        '''
+        Applies the changes that other processes saved since the last save, see Storage.changes, and rebases self.changes on them.
+        The notes that were not changed since the last save get their changes as they are, the others are merged by self._rebase.
+        If their changes are not available anymore, the notes are loaded again by self._reload.
+        '''
+        theirs = self.storage.changes()
+        if theirs is None:
+            self._reload()
+        elif theirs:
+            titles = {change[1] for change in theirs if len(change) > 1 and change[1] in self._touched}
+            # the notes that only theirs changed are saved as they will be after theirs
+            saved = {change[1] for change in theirs if len(change) > 1} - titles - self._dirty
+            # the positions in the history of undo are not valid anymore in the notes that they changed
+            self._forget({change[1] for change in theirs if len(change) > 1})
+            for change in theirs:
+                if len(change) > 1 and change[1] not in titles:
+                    try:
+                        self._apply(change)
+                    except (ValueError, KeyError, IndexError):
+                        # an incomplete change of a save that was interrupted
+                        pass
+            self._dirty.difference_update(saved)
+            if titles:
+                self._rebase(theirs, titles)
+        self.num_of_notes = len(self.notes)
+        if self.current_note not in self.notes:
+            self.current_note = next(iter(self.notes), None)
+
+    def _rebase(self, theirs, titles):
+        '''
+        Merges theirs into the notes with titles, which were changed both by theirs and by self.changes since the last save,
+        and rewrites self.changes so they apply after theirs.
+        The tasks of these notes are followed by tokens, so a change is applied to the same task even if theirs added or deleted other tasks.
+        The tasks added by theirs come before the tasks added by self.changes, and a field changed by both keeps the value of self.changes.
+        A change to a task or a note deleted by theirs is dropped.
+
+        :param theirs: The changes saved by other processes since the last save
+        :type theirs: list
+        :param titles: The titles of the notes changed by both
+        :type titles: set
+        '''
+        # the tokens of the tasks of each note at the last save, None if the note did not exist
+        base = {
+            title: None if self._touched[title] is None else [("base", title, i) for i in range(self._touched[title])]
+            for title in titles
+        }
+
+        # self.changes with the tasks of these notes replaced by their tokens
+        mine = {title: None if tokens is None else list(tokens) for title, tokens in base.items()}
+        ours = []
+        edited = set()
+        for number, change in enumerate(self.changes):
+            action, title, *args = change
+            tokens = mine.get(title)
+            if title not in titles:
+                ours.append(("keep", title, change))
+            elif action == "note":
+                mine[title] = []
+                ours.append((action, title))
+            elif action == "newtask":
+                if tokens is None:
+                    mine[title] = tokens = []
+                if len(args) > 3 and args[3] != "":
+                    # a task put back by undo goes after the task that is before it now, ("start",) if it is the first task
+                    position = int(args[3])
+                    previous = tokens[position - 1] if position else ("start",)
+                    tokens.insert(position, ("ours", number))
+                else:
+                    previous = None
+                    tokens.append(("ours", number))
+                ours.append((action, title, ("ours", number), [*args[:3], *args[4:]], previous))
+            elif action == "task":
+                token = tokens[int(args[0])]
+                edited.add((token, args[1]))
+                ours.append((action, title, token, args[1:]))
+            elif action == "delete task":
+                ours.append((action, title, tokens.pop(int(args[0]))))
+            elif action == "insert tasks":
+                # merged like the tasks put back by undo one by one
+                for i in range(0, len(args), 5):
+                    position = int(args[i])
+                    previous = tokens[position - 1] if position else ("start",)
+                    tokens.insert(position, ("ours", number, i))
+                    ours.append(("newtask", title, ("ours", number, i), args[i + 1 : i + 5], previous))
+            elif action == "delete tasks":
+                deleted = {int(index) for index in args}
+                ours.append((action, title, [tokens[index] for index in sorted(deleted)]))
+                tokens[:] = [token for index, token in enumerate(tokens) if index not in deleted]
+            elif action == "delete note":
+                mine[title] = None
+                ours.append((action, title))
+
+        # theirs applied to the tokens of the last save
+        merged = {title: None if tokens is None else list(tokens) for title, tokens in base.items()}
+        added = {}
+        their_edits = []
+        for number, change in enumerate(theirs):
+            if len(change) < 2 or change[1] not in titles:
+                continue
+            action, title, *args = change
+            tokens = merged[title]
+            try:
+                if action == "note":
+                    merged[title] = []
+                elif action == "newtask":
+                    if tokens is None:
+                        merged[title] = tokens = []
+                    if len(args) > 3 and args[3] != "":
+                        tokens.insert(int(args[3]), ("theirs", number))
+                    else:
+                        tokens.append(("theirs", number))
+                    added[("theirs", number)] = [*args[:3], *args[4:5]]
+                elif action == "task":
+                    token = tokens[int(args[0])]
+                    if token in added:
+                        added[token][["body", "priority", "status"].index(args[1])] = args[2]
+                    else:
+                        their_edits.append((token, args[1], args[2]))
+                elif action == "delete task":
+                    tokens.pop(int(args[0]))
+                elif action == "insert tasks":
+                    for i in range(0, len(args), 5):
+                        tokens.insert(int(args[i]), ("theirs", number, i))
+                        added[("theirs", number, i)] = list(args[i + 1 : i + 5])
+                elif action == "delete tasks":
+                    deleted = {_position(index, tokens) for index in args}
+                    tokens[:] = [token for index, token in enumerate(tokens) if index not in deleted]
+                elif action == "delete note":
+                    merged[title] = None
+            except (ValueError, TypeError, IndexError):
+                # an incomplete change of a save that was interrupted
+                continue
+        # the changes are counted from the save of theirs from now on
+        touched = {title: None if tokens is None else len(tokens) for title, tokens in merged.items()}
+
+        # self.changes applied after theirs, with the tokens replaced by the positions of the tasks after theirs
+        changes = []
+        for action, title, *args in ours:
+            tokens = merged.get(title)
+            if action == "keep":
+                changes.append(args[0])
+            elif action == "note":
+                if tokens is None:
+                    merged[title] = []
+                    changes.append(["note", title])
+            elif action == "newtask":
+                token, row, previous = args
+                if tokens is None:
+                    merged[title] = tokens = []
+                if previous is None or (previous != ("start",) and previous not in tokens):
+                    tokens.append(token)
+                    changes.append(["newtask", title, *row[:3], "", *row[3:]])
+                else:
+                    position = 0 if previous == ("start",) else tokens.index(previous) + 1
+                    tokens.insert(position, token)
+                    changes.append(["newtask", title, *row[:3], position, *row[3:]])
+            elif action == "task":
+                if tokens is not None and args[0] in tokens:
+                    changes.append(["task", title, tokens.index(args[0]), *args[1]])
+            elif action == "delete task":
+                if tokens is not None and args[0] in tokens:
+                    index = tokens.index(args[0])
+                    del tokens[index]
+                    changes.append(["delete task", title, index])
+            elif action == "delete tasks":
+                if tokens is not None:
+                    positions = {token: index for index, token in enumerate(tokens)}
+                    removed = {token for token in args[0] if token in positions}
+                    if removed:
+                        tokens[:] = [token for token in tokens if token not in removed]
+                        changes.append(["delete tasks", title, *sorted(positions[token] for token in removed)])
+            elif action == "delete note":
+                if tokens is not None:
+                    merged[title] = None
+                    changes.append(["delete note", title])
+
+        # the tasks in memory are the tasks of mine, they get the fields changed only by theirs
+        tasks = {}
+        for title in titles:
+            if title in self.notes:
+                tasks.update(zip(mine[title], self.notes[title].tasks))
+        for token, field, value in their_edits:
+            if token in tasks and (token, field) not in edited:
+                try:
+                    setattr(tasks[token], field, value)
+                except ValueError:
+                    continue
+
+        for title in titles:
+            if merged[title] is None:
+                if title in self.notes:
+                    self._apply(["delete note", title])
+                continue
+            if title in self.notes:
+                old = self.notes[title]
+                for task in old.tasks:
+                    old._detach(task)
+            note = Note(title)
+            note.index = self._index
+            note.search = self._search
+            note.ids = self._ids
+            note.dirty = self._dirty
+            for token in merged[title]:
+                note.new_task(tasks[token] if token in tasks else Task(*added[token]))
+            self.notes[title] = note
+
+        for title, num_of_tasks in self._touched.items():
+            touched.setdefault(title, num_of_tasks)
+        self.changes = changes
+        self._touched = touched
+
+    def _reload(self):
+        '''
+        Loads the notes again when the changes saved by other processes are not available anymore,
+        e.g. another process compacted the file twice since the last save.
+        The notes changed since the last save replace the loaded ones as a whole.
+        '''
+        ours = {
+            title: [[task.body, task.priority, task.status, task.id] for task in self.notes[title].tasks] if title in self.notes else None
+            for title in self._touched.keys() | self._dirty
+        }
+        self._load_notes()
+        self._index = None
+        self._search = None
+        self._ids = None
+        self.changes = []
+        self._touched = {}
+        self._forget()
+        self._replay_journal()
+        for title, rows in ours.items():
+            if title in self.notes:
+                self._change(["delete note", title], history=False)
+            if rows is not None:
+                self._change(["note", title], history=False)
+                for body, priority, status, task_id in rows:
+                    self._change(["newtask", title, body, priority, status, "", task_id], history=False)
+
+    def export(self, file_name):
+        '''
+        Writes all the notes to file_name, in the format chosen by its extension, e.g. to convert a csv workspace to SQLite.
+        The unsaved changes are included, but they stay unsaved in self.file_name.
+
+        :param file_name: The name of the file
+        :type file_name: str
+        :raise OSError: If the file cannot be written
+        '''
+        open_storage(file_name).write_all(self._snapshot())
+
+    def _snapshot(self):
+        '''
+        Returns a copy of the notes in the format of Storage.write_all
+
+        :rtype: list
+        '''
+        return [
+            (note.title, [[task.body, task.priority, task.status, task.id] for task in note.tasks])
+            for note in self.notes.values()
+        ]
+
+    def _write_all(self, notes, search_postings, changes):
+        '''
+        Replaces the content of self.storage with notes,
+        and writes search_postings, if any, for the new version of self.storage.
+        '''
+        self.storage.write_all(notes, changes)
+        if search_postings is not None:
+            SearchIndex.dump(self.search_name, search_postings, self.storage.version())
+
+
+def _position(index, tasks):
+    """
+    Converts the index of a task in a change to int and checks that it is a position in tasks
+
+    :raise IndexError: If index is not a position in tasks
+    :rtype: int
+    """
+    index = int(index)
+    if not 0 <= index < len(tasks):
+        raise IndexError(f"There is no task at position {index}")
+    return index
+
+
+def _task_loader(load):
+    """
+    Returns a loader for Note that creates the tasks from the rows returned by load.
+    The records of a binary workspace become views of the mapped file instead.
+
+    :param load: A function with no arguments which returns a list of [body, priority, status, id] rows or Records
+    :type load: function
+    :rtype: function
+    """
+    def tasks():
+        rows = load()
+        if isinstance(rows, Records):
+            if rows.ids is not None:
+                return [TaskView(rows.buffer, offset, task_id) for offset, task_id in zip(rows.offsets, rows.ids)]
+            return [TaskView(rows.buffer, offset) for offset in rows.offsets]
+        if isinstance(rows, TrustedRows):
+            return _trusted_tasks(rows)
+        return [Task(*row) for row in rows]
+
+    return tasks
+
+
+def _trusted_tasks(rows):
+    """
+    Creates the tasks of TrustedRows without calling Task.__init__ and the setters, which validate each row.
+    The priority and status are only looked up in PRIORITY_CODES and STATUS_CODES.
+    The garbage collector is paused meanwhile, because the new tasks cannot be garbage and it would scan them many times.
+
+    :param rows: The [body, priority, status, id] rows written by CsvStorage
+    :type rows: TrustedRows
+    :raise ValueError: If a priority or status is not valid, e.g. the file was edited by another program
+    :rtype: list
+    """
+    new = Task.__new__
+    tasks = []
+    append = tasks.append
+    collect = gc.isenabled()
+    gc.disable()
+    try:
+        for body, priority, status, task_id in rows:
+            task = new(Task)
+            task._body = body
+            task._priority = PRIORITY_CODES[priority]
+            task._status = STATUS_CODES[status]
+            task._id = task_id
+            task._cells = None
+            task._note = None
+            append(task)
+    except KeyError as e:
+        raise ValueError(f"Invalid priority or status {e}") from None
+    finally:
+        if collect:
+            gc.enable()
+    return tasks
@@ -0,0 +1,232 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import sys
+import os
+
+from todo import ToDo
+from storage import storage_class, PRIORITIES, STATUSES, PRIORITY_CODES, STATUS_CODES
+
+# Number of open high priority tasks printed by main
+OPEN_HIGH_LIMIT = 100
+
+
+def summarize(file_name):
+    """
+    Loads the workspace file_name and counts its tasks.
+    The workspace is loaded with read_only, so the processes that use it are not disturbed, e.g. no lock file or schema change is written.
+    It runs in the processes of Workspaces.refresh, so it only returns lists and dicts, which are sent back to the main process.
+
+    :param file_name: The name of the workspace file
+    :type file_name: str
+    :raise ValueError: If the workspace is curropted
+    :return: A dict with "notes", a list of [title, counts] where counts[priority][status] is the number of tasks
+        by the codes of PRIORITIES and STATUSES, and "open_high", a list of [title, body, id] of the incomplete high priority tasks
+    :rtype: dict
+    """
+    engine = ToDo(file_name, read_only=True)
+    high, incomplete = PRIORITY_CODES["high"], STATUS_CODES["incomplete"]
+    notes = []
+    open_high = []
+    for title, note in engine.notes.items():
+        counts = [[0] * len(STATUSES) for _ in PRIORITIES]
+        for task in note.tasks:
+            counts[task._priority][task._status] += 1
+            if task._priority == high and task._status == incomplete:
+                open_high.append([title, task.body, task.id])
+        notes.append([title, counts])
+    return {"notes": notes, "open_high": open_high}
+
+
+class Workspaces:
+    """
+    A read-only view of many workspaces, e.g. one csv file for each team.
+    refresh loads the files in parallel in a pool of processes, and only the files that changed since they were loaded last,
+    e.g. by the size and modification time of a csv file and its journal, see Storage.saved_version.
+    The tasks are not kept, only their number by note, priority and status, and the incomplete high priority tasks.
+    """
+
+    def __init__(self, file_names, workers=None, cache_name=None):
+        """
+        :param file_names: The names of the workspace files
+        :type file_names: list
+        :param workers: Number of processes that load the files, os.cpu_count() if None. With 1 they are loaded in this process.
+        :type workers: int or None
+        :param cache_name: If not None, a json file where the summaries are kept, so the next runs do not load the unchanged files again
+        :type cache_name: str or None
+        :return: An object of class Workspaces, call refresh to load the files
+        :r type: class Workspaces
+        """
+        self.file_names = list(dict.fromkeys(file_names))
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_name = cache_name
+        # the summary of each file with the version it was made from, see summarize,
+        # or the error of loading that version, so a bad file is not loaded again until it changes
+        self.summaries = {}
+        # the error of each file that could not be loaded
+        self.errors = {}
+        if cache_name is not None and os.path.isfile(cache_name):
+            try:
+                with open(cache_name) as file:
+                    self.summaries = json.load(file)
+            except (OSError, ValueError):
+                # the cache only saves time, the files are loaded again
+                self.summaries = {}
+
+    def refresh(self):
+        """
+        Loads the files that changed since their summary was made, in parallel.
+        A file that cannot be loaded is left out of the view and its error is kept in self.errors.
+        The summaries are written to self.cache_name, if any.
+
+        :return: Number of files loaded
+        :rtype: int
+        """
+        missing = {}
+        changed = {}
+        for file_name in self.file_names:
+            try:
+                version = storage_class(file_name).saved_version(file_name)
+            except OSError as e:
+                missing[file_name] = str(e)
+                self.summaries.pop(file_name, None)
+                continue
+            summary = self.summaries.get(file_name)
+            if summary is None or summary["version"] != version:
+                # the version is read before the file is loaded, so a save during the load makes the next refresh load it again
+                changed[file_name] = version
+
+        if self.workers == 1 or len(changed) < 2:
+            results = [self._summarize(file_name) for file_name in changed]
+        else:
+            with ProcessPoolExecutor(min(self.workers, len(changed))) as executor:
+                results = list(executor.map(self._summarize, changed))
+
+        for (file_name, version), (summary, error) in zip(changed.items(), results):
+            self.summaries[file_name] = {"version": version, **summary} if error is None else {"version": version, "error": error}
+        # the summaries of the files that are not in the view anymore are dropped
+        self.summaries = {file_name: self.summaries[file_name] for file_name in self.file_names if file_name in self.summaries}
+        self.errors = {file_name: summary["error"] for file_name, summary in self.summaries.items() if "error" in summary}
+        self.errors.update(missing)
+        if self.cache_name is not None and changed:
+            with open(self.cache_name, "w") as file:
+                json.dump(self.summaries, file)
+        return len(changed)
+
+    @staticmethod
+    def _summarize(file_name):
+        """
+        Calls summarize and returns its error instead of raising it, so one bad file does not stop the others
+
+        :return: A tuple (summary, error), one of them is None
+        :rtype: tuple
+        """
+        try:
+            return summarize(file_name), None
+        except (OSError, ValueError) as e:
+            return None, f"{type(e).__name__}: {e}"
+
+    def counts(self, by_file=False):
+        """
+        Returns the number of tasks of each note by priority and status, over all the workspaces
+
+        :param by_file: If True, the notes with the same title in different files are counted apart
+        :type by_file: bool
+        :return: A dict from the title of each note, or (file_name, title) if by_file, to a dict from (priority, status) to the number of tasks
+        :rtype: dict
+        """
+        counts = {}
+        for file_name, summary in self._loaded():
+            for title, matrix in summary["notes"]:
+                note = counts.setdefault((file_name, title) if by_file else title, {})
+                for priority, row in zip(PRIORITIES, matrix):
+                    for status, count in zip(STATUSES, row):
+                        note[(priority, status)] = note.get((priority, status), 0) + count
+        return counts
+
+    def total(self, priority=None, status=None):
+        """
+        Returns the number of tasks of all the workspaces with priority and status. A None priority or status matches all the tasks.
+
+        :param priority: One of PRIORITIES or None
+        :type priority: str or None
+        :param status: One of STATUSES or None
+        :type status: str or None
+        :rtype: int
+        """
+        return sum(
+            count
+            for note in self.counts().values()
+            for (task_priority, task_status), count in note.items()
+            if priority in [None, task_priority] and status in [None, task_status]
+        )
+
+    def open_high(self):
+        """
+        Returns the incomplete high priority tasks of all the workspaces
+
+        :return: A list of [file_name, title, body, id]
+        :rtype: list
+        """
+        return [[file_name, *task] for file_name, summary in self._loaded() for task in summary["open_high"]]
+
+    def _loaded(self):
+        """
+        Returns the (file_name, summary) of the files that were loaded without errors
+
+        :rtype: list
+        """
+        return [(file_name, summary) for file_name, summary in self.summaries.items() if "error" not in summary]
+
+    def report(self, limit=OPEN_HIGH_LIMIT):
+        """
+        Returns the number of tasks of each note by priority and status, and at most limit open high priority tasks, in tables
+
+        :rtype: str
+        """
+        from tabulate import tabulate
+
+        rows = []
+        for title, note in self.counts().items():
+            rows.append([
+                title,
+                sum(note.values()),
+                *(sum(note[(priority, status)] for status in STATUSES) for priority in PRIORITIES),
+                *(sum(note[(priority, status)] for priority in PRIORITIES) for status in STATUSES),
+            ])
+        totals = [sum(column) for column in zip(*(row[1:] for row in rows))]
+        rows.append(["(all)", *totals])
+        lines = [tabulate(rows, ["Note", "tasks", *PRIORITIES, *STATUSES])]
+        open_high = self.open_high()
+        if open_high:
+            lines.append(tabulate(open_high[:limit], ["Workspace", "Note", "Open high priority task", "Id"], maxcolwidths=[30, 20, 80, None]))
+            if len(open_high) > limit:
+                lines.append(f"Showing {limit} of {len(open_high)} open high priority tasks")
+        for file_name, error in self.errors.items():
+            lines.append(f"{file_name}: {error}")
+        return "\n\n".join(lines)
+
+
+def main():
+    """
+    Prints an overview of many workspaces, see Workspaces
+    """
+    parser = argparse.ArgumentParser(description="Counts the tasks of many M3 ToDo workspaces")
+    parser.add_argument("workspaces", nargs="+", help="the csv, SQLite (.db) or binary (.m3) files of the workspaces")
+    parser.add_argument("--workers", type=int, help="processes that load the workspaces (default: the number of CPUs)")
+    parser.add_argument("--cache", metavar="FILE", help="json file that keeps the counts of the workspaces that did not change")
+    parser.add_argument("--limit", type=int, default=OPEN_HIGH_LIMIT, help="open high priority tasks shown")
+    arguments = parser.parse_args()
+
+    workspaces = Workspaces(arguments.workspaces, arguments.workers, arguments.cache)
+    try:
+        workspaces.refresh()
+    except OSError as e:
+        sys.exit(f"Error: {e}")
+    print(workspaces.report(arguments.limit))
+    if workspaces.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()